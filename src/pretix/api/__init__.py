@@ -6,7 +6,7 @@ class PretixApiConfig(AppConfig):
     label = 'pretixapi'
 
     def ready(self):
-        from . import signals, webhooks  # noqa
+        from . import changes, signals, webhooks  # noqa
 
 
 default_app_config = 'pretix.api.PretixApiConfig'
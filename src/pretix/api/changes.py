@@ -0,0 +1,259 @@
+"""
+Maintains the :py:class:`ChangeFeedEntry` table behind the change feed of the REST API.
+
+Every time an order, an order position, a voucher or a check-in is saved or deleted, a new entry for the object is
+added in the same transaction, which moves the object to the end of the feed. Changes to anything that is part of
+the API representation of an object count as a change of that object as well, e.g. a new payment changes its order
+and a check-in changes its position and that position's order. Older entries of an object are hidden by the API
+and deleted by a periodic task, which also adds objects that have been created before the change feed existed.
+
+Entries get their IDs when they are inserted, but only become visible once their transaction is committed, which
+can be in a different order. The API therefore lists entries by their ``seq``, which committed entries only get when
+the feed of their event is read, in a short transaction that locks the event's :py:class:`ChangeFeedLock`. This way,
+no entry can show up behind one that an API client has already seen, while the transactions that change the objects
+neither wait for each other nor pay for more than inserting their entries. A periodic task numbers the entries of
+events whose feed is not read, so that they can be pruned.
+
+``Order.touch()`` is not recorded on its own, since it is only called when a part of the order changes, which is
+recorded anyway. Changes that do not send ``post_save`` or ``post_delete``, like ``QuerySet.update()`` or
+``bulk_create()``, need to be recorded with :py:func:`record_objects` or :py:func:`record_changes`.
+"""
+import threading
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import CharField, Exists, F, Max, Min, OuterRef
+from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django_scopes import scopes_disabled
+
+from pretix.api.models import ChangeFeedEntry, ChangeFeedLock
+from pretix.base.models import (
+    Checkin, Event, InvoiceAddress, Order, OrderFee, OrderPayment,
+    OrderPosition, OrderRefund, Voucher,
+)
+from pretix.base.models.orders import QuestionAnswer
+from pretix.base.settings import GlobalSettingsObject
+from pretix.base.signals import periodic_task
+from pretix.helpers.database import connect_models
+from pretix.helpers.iter import chunked_iterable
+from pretix.helpers.periodic import minimum_interval
+
+BATCH_SIZE = 1000
+BACKFILL_SIZE = 20000
+
+# The object types in the feed, with the lookup of their event and of their identifier in the API
+FEED_TYPES = {
+    'order': (Order, 'event_id', 'code'),
+    'orderposition': (OrderPosition, 'order__event_id', 'pk'),
+    'voucher': (Voucher, 'event_id', 'pk'),
+    'checkin': (Checkin, 'position__order__event_id', 'pk'),
+}
+
+_local = threading.local()
+
+
+def _queryset(model):
+    return OrderPosition.all.all() if model is OrderPosition else model.objects.all()
+
+
+def _entries(model, instance) -> set:
+    # Check-ins are part of their position, positions are part of their order. The objects that call this have
+    # usually touched their order already, so this rarely needs to query anything.
+    if model is Checkin:
+        position = instance.position
+        return {(position.order.event_id, 'checkin', str(instance.pk))} | _entries(OrderPosition, position)
+    elif model is OrderPosition:
+        order = instance.order
+        return {(order.event_id, 'orderposition', str(instance.pk)), (order.event_id, 'order', order.code)}
+    elif model is Order:
+        return {(instance.event_id, 'order', instance.code)}
+    elif model is Voucher:
+        return {(instance.event_id, 'voucher', str(instance.pk))}
+    elif model is QuestionAnswer:
+        return _entries(OrderPosition, instance.orderposition) if instance.orderposition_id else set()
+    else:
+        return _entries(Order, instance.order) if instance.order_id else set()
+
+
+def _deleting_events() -> set:
+    if not hasattr(_local, 'deleting_events'):
+        _local.deleting_events = set()
+    return _local.deleting_events
+
+
+def _lock(event_id):
+    qs = ChangeFeedLock.objects.select_for_update().filter(event_id=event_id)
+    lock = qs.first()
+    if lock is None:
+        if not ChangeFeedEntry.objects.filter(event_id=event_id).exists():
+            # The event has been deleted in the meantime
+            return None
+        ChangeFeedLock.objects.bulk_create([ChangeFeedLock(event_id=event_id)], ignore_conflicts=True)
+        lock = qs.first()
+    return lock
+
+
+@scopes_disabled()
+def assign_sequence_numbers(events) -> None:
+    """
+    Gives all committed entries of the given events that do not have a sequence number yet one that is higher
+    than all sequence numbers handed out before, keeping the order of their IDs.
+    """
+    for event_id in sorted(events):
+        with transaction.atomic():
+            lock = _lock(event_id)
+            if lock is None:
+                continue
+            pending = ChangeFeedEntry.objects.filter(event_id=event_id, seq__isnull=True)
+            bounds = pending.aggregate(min_id=Min('id'), max_id=Max('id'))
+            if bounds['min_id'] is None:
+                continue
+            # Entries are numbered by their offset to the first ID instead of one by one, so that this is a single
+            # query. Entries within the range that have been committed in the meantime still get a unique number.
+            offset = lock.last_seq + 1 - bounds['min_id']
+            pending.filter(id__range=(bounds['min_id'], bounds['max_id'])).update(seq=F('id') + offset)
+            lock.last_seq = bounds['max_id'] + offset
+            lock.save(update_fields=['last_seq'])
+
+
+
+@scopes_disabled()
+def record_changes(changed, deleted=()) -> None:
+    """
+    Moves the given objects to the end of the change feed. Both arguments are iterables of
+    ``(event_id, object_type, object_id)`` tuples, the objects in ``deleted`` are marked as deleted. This needs
+    to be called in the transaction that changes the objects.
+    """
+    rows = {k: False for k in changed}
+    rows.update({k: True for k in deleted})
+    # Entries of an event that is being deleted would keep it from being deleted
+    deleting = _deleting_events()
+    rows = sorted((k, d) for k, d in rows.items() if k[0] not in deleting)
+    if not rows:
+        return
+
+    for chunk in chunked_iterable(rows, BATCH_SIZE):
+        ChangeFeedEntry.objects.bulk_create([
+            ChangeFeedEntry(event_id=event_id, object_type=object_type, object_id=object_id, deleted=d)
+            for (event_id, object_type, object_id), d in chunk
+        ])
+
+
+def record_objects(objects) -> None:
+    """
+    Moves the given orders, order positions, vouchers or check-ins to the end of the change feed. This needs to
+    be called for changes that do not send ``post_save``, like ``QuerySet.update()`` or ``bulk_create()``.
+    """
+    entries = set()
+    for o in objects:
+        entries |= _entries(type(o), o)
+    record_changes(entries)
+
+
+def _object_changed(sender, instance, update_fields=None, **kwargs):
+    if sender is Order and update_fields is not None and set(update_fields) == {'last_modified'}:
+        return
+    record_changes(_entries(sender, instance))
+
+
+def _object_deleted(sender, instance, **kwargs):
+    if sender in (Order, Voucher):
+        record_changes((), _entries(sender, instance))
+    elif sender in (OrderPosition, Checkin):
+        # Django deletes children before their parents, so the position and order of a check-in still exist
+        entries = _entries(sender, instance)
+        object_type = 'orderposition' if sender is OrderPosition else 'checkin'
+        record_changes({e for e in entries if e[1] != object_type}, {e for e in entries if e[1] == object_type})
+    else:
+        try:
+            _object_changed(sender, instance)
+        except ObjectDoesNotExist:
+            # Objects with a nullable relation to their parent can be deleted after the parent, whose deletion
+            # has been recorded already
+            pass
+
+
+FEED_MODELS = (Order, OrderPosition, Voucher, Checkin, QuestionAnswer, OrderFee, OrderPayment, OrderRefund,
+               InvoiceAddress)
+connect_models(post_save, _object_changed, FEED_MODELS)
+connect_models(post_delete, _object_deleted, FEED_MODELS)
+
+
+@receiver(pre_delete, sender=Event, dispatch_uid='pretixapi_changes_event_deleting')
+def _event_deleting(sender, instance, **kwargs):
+    _deleting_events().add(instance.pk)
+
+
+@receiver(post_delete, sender=Event, dispatch_uid='pretixapi_changes_event_deleted')
+def _event_deleted(sender, instance, **kwargs):
+    _deleting_events().discard(instance.pk)
+
+
+def change_feed_ready() -> bool:
+    return GlobalSettingsObject().settings.get('change_feed_ready', as_type=bool, default=False)
+
+
+def build_change_feed(limit=None) -> int:
+    """
+    Adds up to ``limit`` objects of every type that are not in the change feed yet. Once no object is missing,
+    this does not need to run again. Returns the number of objects added.
+    """
+    n = 0
+    complete = True
+    with scopes_disabled():
+        for object_type, (model, event_lookup, key) in FEED_TYPES.items():
+            qs = _queryset(model).annotate(
+                _event=F(event_lookup),
+                _key=Cast(key, output_field=CharField()),
+            )
+            qs = qs.annotate(
+                in_feed=Exists(ChangeFeedEntry.objects.filter(
+                    event_id=OuterRef('_event'), object_type=object_type, object_id=OuterRef('_key')
+                ))
+            ).filter(in_feed=False).order_by().values_list('_event', '_key')
+            missing = list(qs[:limit] if limit else qs)
+            record_changes([(e, object_type, k) for e, k in missing])
+            n += len(missing)
+            if limit and len(missing) >= limit:
+                complete = False
+    if complete and not change_feed_ready():
+        GlobalSettingsObject().settings.set('change_feed_ready', True)
+    return n
+
+
+def prune_change_feed() -> int:
+    """
+    Deletes all entries that are hidden by a newer entry of the same object. Returns the number of entries deleted.
+    """
+    superseded = ChangeFeedEntry.objects.annotate_superseded().filter(
+        superseded=True
+    ).order_by().values_list('pk', flat=True)
+    n = 0
+    while True:
+        pks = list(superseded[:BATCH_SIZE])
+        if not pks:
+            return n
+        n += ChangeFeedEntry.objects.filter(pk__in=pks).delete()[0]
+
+
+@receiver(signal=periodic_task)
+@minimum_interval(minutes_after_success=5)
+def build_change_feed_periodic(sender, **kwargs):
+    if not change_feed_ready():
+        build_change_feed(limit=BACKFILL_SIZE)
+
+
+@receiver(signal=periodic_task)
+@minimum_interval(minutes_after_success=5)
+def assign_sequence_numbers_periodic(sender, **kwargs):
+    assign_sequence_numbers(
+        ChangeFeedEntry.objects.filter(seq__isnull=True).order_by().values_list('event_id', flat=True).distinct()
+    )
+
+
+@receiver(signal=periodic_task)
+@minimum_interval(minutes_after_success=60)
+def prune_change_feed_periodic(sender, **kwargs):
+    prune_change_feed()
@@ -0,0 +1,30 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0182_statisticsrollup'),
+        ('pretixapi', '0005_auto_20191028_1541'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeedEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('object_type', models.CharField(max_length=190)),
+                ('object_id', models.CharField(max_length=190)),
+                ('deleted', models.BooleanField(default=False)),
+                ('datetime', models.DateTimeField(auto_now_add=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.Event')),
+            ],
+            options={
+                'unique_together': {('event', 'object_type', 'object_id')},
+                'index_together': {('event', 'id')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.0.14 on 2026-10-18 10:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0182_statisticsrollup'),
+        ('pretixapi', '0006_changefeedentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeedLock',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='pretixbase.Event')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='changefeedentry',
+            unique_together=set(),
+        ),
+        migrations.AlterIndexTogether(
+            name='changefeedentry',
+            index_together={('event', 'object_type', 'object_id'), ('event', 'id')},
+        ),
+        migrations.RemoveField(
+            model_name='changefeedentry',
+            name='datetime',
+        ),
+    ]
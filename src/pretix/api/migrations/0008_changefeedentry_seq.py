@@ -0,0 +1,37 @@
+# Generated by Django 3.0.14 on 2026-10-18 14:02
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def set_seq(apps, schema_editor):
+    ChangeFeedEntry = apps.get_model('pretixapi', 'ChangeFeedEntry')
+    ChangeFeedLock = apps.get_model('pretixapi', 'ChangeFeedLock')
+    ChangeFeedEntry.objects.update(seq=F('id'))
+    for e in ChangeFeedEntry.objects.order_by().values('event_id').annotate(m=Max('id')):
+        ChangeFeedLock.objects.update_or_create(event_id=e['event_id'], defaults={'last_seq': e['m']})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixapi', '0007_changefeedlock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='changefeedentry',
+            name='seq',
+            field=models.BigIntegerField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='changefeedlock',
+            name='last_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(set_seq, migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='changefeedentry',
+            index_together={('event', 'object_type', 'object_id'), ('event', 'seq')},
+        ),
+    ]
@@ -127,3 +127,62 @@ class ApiCall(models.Model):
 
     class Meta:
         unique_together = (('idempotency_key', 'auth_hash'),)
+
+
+class ChangeFeedEntryQuerySet(models.QuerySet):
+    def annotate_superseded(self):
+        """
+        Annotates every entry with ``superseded``, which is ``True`` if there is a newer entry of the same object.
+        Entries are numbered after their transaction has been committed, which can happen in a different order than
+        they have been inserted in, so the newer entry is the one with the higher ``seq``. Entries without a
+        ``seq`` are newer than all others, but are never superseded themselves.
+        """
+        return self.annotate(
+            superseded=models.Case(
+                models.When(seq__isnull=True, then=models.Value(False)),
+                default=models.Exists(ChangeFeedEntry.objects.filter(
+                    models.Q(seq__isnull=True) | models.Q(seq__gt=models.OuterRef('seq')),
+                    event=models.OuterRef('event'), object_type=models.OuterRef('object_type'),
+                    object_id=models.OuterRef('object_id'),
+                )),
+                output_field=models.BooleanField(),
+            )
+        )
+
+    def current(self):
+        """
+        Only returns the latest entry of every object.
+        """
+        return self.annotate_superseded().filter(superseded=False)
+
+
+class ChangeFeedEntry(models.Model):
+    """
+    A change of an order, order position, voucher or check-in of an event. The ``seq`` serves as a sequence
+    number that API clients can resume the change feed from, and only the latest entry of every object is
+    listed. ``object_id`` is the identifier the object has in the API, i.e. the code for orders and the primary
+    key for everything else.
+
+    Entries are added without a ``seq`` in the transaction that changes the object, and only get one once that
+    transaction has been committed. Entries are kept up to date by :py:mod:`pretix.api.changes`.
+    """
+    id = models.BigAutoField(primary_key=True)
+    event = models.ForeignKey('pretixbase.Event', on_delete=models.CASCADE, related_name='+')
+    object_type = models.CharField(max_length=190)
+    object_id = models.CharField(max_length=190)
+    deleted = models.BooleanField(default=False)
+    seq = models.BigIntegerField(null=True, db_index=True)
+
+    objects = ChangeFeedEntryQuerySet.as_manager()
+
+    class Meta:
+        index_together = (('event', 'seq'), ('event', 'object_type', 'object_id'))
+
+
+class ChangeFeedLock(models.Model):
+    """
+    One row per event that is locked while committed entries of the event's change feed get their sequence
+    numbers, so that sequence numbers are only ever handed out in ascending order.
+    """
+    event = models.OneToOneField('pretixbase.Event', primary_key=True, on_delete=models.CASCADE, related_name='+')
+    last_seq = models.BigIntegerField(default=0)
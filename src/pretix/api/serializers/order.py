@@ -13,6 +13,7 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.relations import SlugRelatedField
 from rest_framework.reverse import reverse
 
+from pretix.api.changes import record_objects
 from pretix.api.serializers.i18n import I18nAwareModelSerializer
 from pretix.base.channels import get_all_sales_channels
 from pretix.base.decimal import round_decimal
@@ -214,6 +215,11 @@ class CheckinSerializer(I18nAwareModelSerializer):
         fields = ('id', 'datetime', 'list', 'auto_checked_in', 'type')
 
 
+class ChangeFeedCheckinSerializer(CheckinSerializer):
+    class Meta(CheckinSerializer.Meta):
+        fields = CheckinSerializer.Meta.fields + ('position',)
+
+
 class OrderDownloadsField(serializers.Field):
     def to_representation(self, instance: Order):
         if instance.status != Order.STATUS_PAID:
@@ -1198,6 +1204,7 @@ class OrderCreateSerializer(I18nAwareModelSerializer):
                 else:
                     if pos.voucher:
                         Voucher.objects.filter(pk=pos.voucher.pk).update(redeemed=F('redeemed') + 1)
+                        record_objects([pos.voucher])
                     pos.save()
                     for answ_data in answers_data:
                         options = answ_data.pop('options', [])
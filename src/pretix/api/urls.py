@@ -7,8 +7,8 @@ from rest_framework import routers
 from pretix.api.views import cart
 
 from .views import (
-    checkin, device, event, exporters, item, oauth, order, organizer, upload,
-    user, version, voucher, waitinglist, webhooks,
+    changes, checkin, device, event, exporters, item, oauth, order, organizer,
+    upload, user, version, voucher, waitinglist, webhooks,
 )
 
 router = routers.DefaultRouter()
@@ -46,6 +46,7 @@ event_router.register(r'waitinglistentries', waitinglist.WaitingListViewSet)
 event_router.register(r'checkinlists', checkin.CheckinListViewSet)
 event_router.register(r'cartpositions', cart.CartPositionViewSet)
 event_router.register(r'exporters', exporters.EventExportersViewSet, basename='exporters')
+event_router.register(r'changes', changes.ChangeFeedViewSet, basename='changes')
 
 checkinlist_router = routers.DefaultRouter()
 checkinlist_router.register(r'positions', checkin.CheckinListPositionViewSet, basename='checkinlistpos')
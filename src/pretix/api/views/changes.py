@@ -0,0 +1,97 @@
+from django.db.models import Prefetch
+from rest_framework import viewsets
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from pretix.api.changes import FEED_TYPES, assign_sequence_numbers
+from pretix.api.models import ChangeFeedEntry
+from pretix.api.serializers.order import (
+    ChangeFeedCheckinSerializer, OrderPositionSerializer, OrderSerializer,
+)
+from pretix.api.serializers.voucher import VoucherSerializer
+from pretix.base.models import Checkin, OrderFee, OrderPosition
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+class ChangeFeedViewSet(viewsets.ViewSet):
+    permission = 'can_view_orders'
+
+    def _get_types(self, request):
+        types = request.query_params.getlist('type')
+        if any(t not in FEED_TYPES for t in types):
+            raise ValidationError('Unknown type, valid types are: {}.'.format(', '.join(FEED_TYPES)))
+        if 'can_view_vouchers' not in request.eventpermset:
+            if 'voucher' in types:
+                raise PermissionDenied('You do not have permission to view vouchers.')
+            return types or [t for t in FEED_TYPES if t != 'voucher']
+        return types or list(FEED_TYPES)
+
+    def _serialize(self, object_type, object_ids):
+        event = self.request.event
+        ctx = {'request': self.request, 'event': event}
+        if object_type == 'order':
+            qs = event.orders.filter(code__in=object_ids).select_related('invoice_address').prefetch_related(
+                Prefetch('fees', queryset=OrderFee.objects.all()),
+                'payments', 'refunds', 'refunds__payment',
+                Prefetch('positions', OrderPosition.objects.prefetch_related(
+                    'checkins', 'item', 'variation', 'answers', 'answers__options', 'answers__question', 'seat',
+                ))
+            )
+            return {o['code']: o for o in OrderSerializer(qs, many=True, context=ctx).data}
+        elif object_type == 'orderposition':
+            qs = OrderPosition.all.filter(order__event=event, pk__in=object_ids).prefetch_related(
+                'checkins', 'answers', 'answers__options', 'answers__question',
+            ).select_related('item', 'order', 'order__event', 'order__event__organizer', 'seat')
+            serializer = OrderPositionSerializer
+        elif object_type == 'voucher':
+            qs = event.vouchers.filter(pk__in=object_ids).select_related('seat')
+            serializer = VoucherSerializer
+        else:
+            qs = Checkin.objects.filter(position__order__event=event, pk__in=object_ids)
+            serializer = ChangeFeedCheckinSerializer
+        return {str(o['id']): o for o in serializer(qs, many=True, context=ctx).data}
+
+    def list(self, request, **kwargs):
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError('since and limit need to be integers.')
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        assign_sequence_numbers([request.event.pk])
+
+        entries = list(ChangeFeedEntry.objects.filter(
+            event=request.event,
+            object_type__in=self._get_types(request),
+            seq__gt=since,
+        ).current().order_by('seq')[:limit + 1])
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+        cursor = entries[-1].seq if entries else since
+
+        ids = {t: [] for t in FEED_TYPES}
+        for e in entries:
+            if not e.deleted:
+                ids[e.object_type].append(e.object_id)
+        data = {t: self._serialize(t, i) for t, i in ids.items() if i}
+
+        results = []
+        for e in entries:
+            d = None if e.deleted else data[e.object_type].get(e.object_id)
+            results.append({
+                'seq': e.seq,
+                'type': e.object_type,
+                'id': e.object_id if e.object_type == 'order' else int(e.object_id),
+                'deleted': d is None,
+                'data': d,
+            })
+        return Response({
+            'cursor': cursor,
+            'has_more': has_more,
+            'next': replace_query_param(request.build_absolute_uri(), 'since', cursor) if has_more else None,
+            'results': results,
+        })
@@ -12,6 +12,7 @@ from django_filters.rest_framework import DjangoFilterBackend, FilterSet
 from django_scopes import scopes_disabled
 from rest_framework import viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError as DRFValidationError
 from rest_framework.fields import DateTimeField
 from rest_framework.response import Response
 
@@ -26,6 +27,7 @@ from pretix.base.models import (
 )
 from pretix.base.services.checkin import (
     CheckInError, RequiredQuestionsError, perform_checkin,
+    perform_checkin_batch,
 )
 from pretix.helpers.database import FixedOrderBy
 
@@ -160,6 +162,9 @@ with scopes_disabled():
             return queryset.filter(last_checked_in__isnull=not value)
 
 
+BATCH_REDEEM_MAX_SCANS = 1000
+
+
 class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CheckinListOrderPositionSerializer
     queryset = OrderPosition.all.none()
@@ -356,6 +361,106 @@ class CheckinListPositionViewSet(viewsets.ReadOnlyModelViewSet):
                 'position': CheckinListOrderPositionSerializer(op, context=self.get_serializer_context()).data
             }, status=201)
 
+    @action(detail=False, methods=['POST'], url_name='redeem_batch', url_path='redeem_batch')
+    def redeem_batch(self, *args, **kwargs):
+        scans = self.request.data.get('scans')
+        if not isinstance(scans, list) or not scans:
+            raise DRFValidationError({'scans': ['This field needs to be a non-empty list.']})
+        if len(scans) > BATCH_REDEEM_MAX_SCANS:
+            raise DRFValidationError({'scans': ['You can submit at most {} scans at once.'.format(BATCH_REDEEM_MAX_SCANS)]})
+
+        parsed = []
+        for scan in scans:
+            if not isinstance(scan, dict) or not scan.get('secret'):
+                raise DRFValidationError({'scans': ['Every scan needs to contain a secret.']})
+            type = scan.get('type', None) or Checkin.TYPE_ENTRY
+            if type not in dict(Checkin.CHECKIN_TYPES):
+                raise DRFValidationError({'scans': ['Invalid check-in type.']})
+            parsed.append({
+                'secret': str(scan['secret']),
+                'type': type,
+                'datetime': DateTimeField().to_internal_value(scan['datetime']) if scan.get('datetime') else now(),
+                'nonce': scan.get('nonce'),
+                'force': bool(scan.get('force', False)),
+                'ignore_unpaid': bool(scan.get('ignore_unpaid', False)),
+            })
+
+        queryset = self.get_queryset(ignore_status=True, ignore_products=True)
+        secrets = {s['secret'] for s in parsed}
+        pks = {int(s) for s in secrets if s.isnumeric()}
+        positions = {}
+        for op in queryset.filter(Q(secret__in=secrets) | Q(pk__in=pks)):
+            positions[op.secret] = op
+            positions.setdefault(str(op.pk), op)
+
+        unknown = secrets - positions.keys()
+        if unknown:
+            for rs in self.request.event.revoked_secrets.filter(secret__in=unknown).select_related('position'):
+                positions.setdefault(('revoked', rs.secret), rs.position)
+
+        scans_to_perform = []
+        results = [None] * len(parsed)
+        for i, scan in enumerate(parsed):
+            op = positions.get(scan['secret'])
+            log_data = {
+                'datetime': scan['datetime'],
+                'type': scan['type'],
+                'list': self.checkinlist.pk,
+                'barcode': scan['secret']
+            }
+            if not op:
+                op = positions.get(('revoked', scan['secret']))
+                if not op or not scan['force']:
+                    self.request.event.log_action('pretix.event.checkin.unknown', data=log_data,
+                                                  user=self.request.user, auth=self.request.auth)
+                    results[i] = {
+                        'status': 'error',
+                        'reason': 'invalid',
+                    }
+                    continue
+                op.order.log_action('pretix.event.checkin.revoked', data=log_data,
+                                    user=self.request.user, auth=self.request.auth)
+            scan['position'] = op
+            scans_to_perform.append((i, scan))
+
+        errors = perform_checkin_batch(
+            clist=self.checkinlist,
+            scans=[scan for i, scan in scans_to_perform],
+            questions_supported=self.request.data.get('questions_supported', True),
+            canceled_supported=self.request.data.get('canceled_supported', False),
+            user=self.request.user,
+            auth=self.request.auth,
+        )
+
+        # Load the positions again to include the new checkins in the response
+        fresh = queryset.in_bulk({scan['position'].pk for i, scan in scans_to_perform})
+        ctx = self.get_serializer_context()
+        for (i, scan), e in zip(scans_to_perform, errors):
+            op = fresh.get(scan['position'].pk, scan['position'])
+            res = {
+                'status': 'ok',
+                'require_attention': op.item.checkin_attention or op.order.checkin_attention,
+                'position': CheckinListOrderPositionSerializer(op, context=ctx).data
+            }
+            if isinstance(e, RequiredQuestionsError):
+                res['status'] = 'incomplete'
+                res['questions'] = [QuestionSerializer(q).data for q in e.questions]
+            elif isinstance(e, CheckInError):
+                op.order.log_action('pretix.event.checkin.denied', data={
+                    'position': op.id,
+                    'positionid': op.positionid,
+                    'errorcode': e.code,
+                    'force': scan['force'],
+                    'datetime': scan['datetime'],
+                    'type': scan['type'],
+                    'list': self.checkinlist.pk
+                }, user=self.request.user, auth=self.request.auth)
+                res['status'] = 'error'
+                res['reason'] = e.code
+            results[i] = res
+
+        return Response({'results': results}, status=200)
+
     def _handle_file_upload(self, data):
         try:
             cf = CachedFile.objects.get(
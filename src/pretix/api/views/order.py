@@ -54,6 +54,7 @@ from pretix.base.services.orders import (
     extend_order, mark_order_expired, mark_order_refunded, reactivate_order,
 )
 from pretix.base.services.pricing import get_price
+from pretix.base.services.search import order_search_q
 from pretix.base.services.tickets import generate
 from pretix.base.signals import (
     order_modified, order_paid, order_placed, register_ticket_outputs,
@@ -104,6 +105,13 @@ with scopes_disabled():
 
         def search_qs(self, qs, name, value):
             u = value
+            mainq = order_search_q(u)
+            if mainq is not None:
+                for recv, q in order_search_filter_q.send(sender=getattr(self, 'event', None), query=u):
+                    mainq = mainq | q
+                return qs.filter(mainq)
+
+            # The search index is still being built
             if "-" in value:
                 code = (Q(event__slug__icontains=u.rsplit("-", 1)[0])
                         & Q(code__icontains=Order.normalize_code(u.rsplit("-", 1)[1])))
@@ -228,7 +236,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         if order.status != Order.STATUS_PAID:
             raise PermissionDenied("Downloads are not available for unpaid orders.")
 
-        ct = CachedCombinedTicket.objects.filter(
+        ct = CachedCombinedTicket.objects.current(self.request.event).filter(
             order=order, provider=provider.identifier, file__isnull=False
         ).last()
         if not ct or not ct.file:
@@ -983,7 +991,7 @@ class OrderPositionViewSet(mixins.DestroyModelMixin, mixins.UpdateModelMixin, vi
         if not pos.generate_ticket:
             raise PermissionDenied("Downloads are not enabled for this product.")
 
-        ct = CachedTicket.objects.filter(
+        ct = CachedTicket.objects.current(self.request.event).filter(
             order_position=pos, provider=provider.identifier, file__isnull=False
         ).last()
         if not ct or not ct.file:
@@ -1,15 +1,21 @@
 import json
 import logging
+import random
 import time
-from collections import OrderedDict
+import uuid
+from collections import OrderedDict, defaultdict
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlparse
 
 import requests
 from celery.exceptions import MaxRetriesExceededError
+from django.conf import settings
 from django.db.models import Exists, OuterRef, Q
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _, pgettext_lazy
 from django_scopes import scope, scopes_disabled
 from requests import RequestException
+from requests.adapters import HTTPAdapter
 
 from pretix.api.models import WebHook, WebHookCall, WebHookEventListener
 from pretix.api.signals import register_webhook_events
@@ -261,38 +267,185 @@ def register_default_webhook_events(sender, **kwargs):
 def notify_webhooks(logentry_ids: list):
     if not isinstance(logentry_ids, list):
         logentry_ids = [logentry_ids]
-    qs = LogEntry.all.select_related('event', 'event__organizer').filter(id__in=logentry_ids)
-    _org, _at, webhooks = None, None, None
+    qs = LogEntry.all.select_related('event', 'event__organizer').filter(id__in=logentry_ids).order_by('pk')
+    webhooks = {}
+    deliveries = defaultdict(list)
     for logentry in qs:
         if not logentry.organizer:
-            break  # We need to know the organizer
+            continue  # We need to know the organizer
 
         notification_type = logentry.webhook_type
 
         if not notification_type:
-            break  # Ignore, no webhooks for this event type
-
-        if _org != logentry.organizer or _at != logentry.action_type or webhooks is None:
-            _org = logentry.organizer
-            _at = logentry.action_type
+            continue  # Ignore, no webhooks for this event type
 
+        key = (logentry.organizer.pk, logentry.event_id, notification_type.action_type)
+        if key not in webhooks:
             # All webhooks that registered for this notification
             event_listener = WebHookEventListener.objects.filter(
                 webhook=OuterRef('pk'),
                 action_type=notification_type.action_type
             )
-            webhooks = WebHook.objects.annotate(has_el=Exists(event_listener)).filter(
+            wh_qs = WebHook.objects.annotate(has_el=Exists(event_listener)).filter(
                 organizer=logentry.organizer,
                 has_el=True,
                 enabled=True
             )
             if logentry.event_id:
-                webhooks = webhooks.filter(
+                wh_qs = wh_qs.filter(
                     Q(all_events=True) | Q(limit_events__pk=logentry.event_id)
                 )
+            webhooks[key] = list(wh_qs.values_list('pk', flat=True))
+
+        for webhook_id in webhooks[key]:
+            deliveries[webhook_id].append((logentry.id, notification_type.action_type))
+
+    # Deliver everything for the same webhook in one task, so we can reuse the connection
+    for webhook_id, items in deliveries.items():
+        if len(items) == 1:
+            send_webhook.apply_async(args=(items[0][0], items[0][1], webhook_id))
+        else:
+            send_webhooks.apply_async(args=(webhook_id, items))
+
+
+MAX_SESSIONS = 100
+_sessions = OrderedDict()
+
+
+def _target_key(url):
+    u = urlparse(url)
+    return '{}://{}'.format(u.scheme, u.netloc)
+
+
+def _get_session(url):
+    """
+    Returns a HTTP session for the host of the given URL, so consecutive calls to the same host can reuse the
+    connection. Only the sessions of the ``MAX_SESSIONS`` most recently used hosts are kept.
+    """
+    key = _target_key(url)
+    if key in _sessions:
+        _sessions.move_to_end(key)
+        return _sessions[key]
+
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.WEBHOOK_TARGET_CONCURRENCY or 10)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    _sessions[key] = session
+    while len(_sessions) > MAX_SESSIONS:
+        _sessions.popitem(last=False)[1].close()
+    return session
+
+
+# KEYS: slot set
+# ARGV: token, current time in milliseconds, timeout in milliseconds, limit
+LUA_ACQUIRE_SLOT = """
+redis.call('zremrangebyscore', KEYS[1], '-inf', ARGV[2])
+if redis.call('zcard', KEYS[1]) >= tonumber(ARGV[4]) then
+    return 0
+end
+redis.call('zadd', KEYS[1], ARGV[2] + ARGV[3], ARGV[1])
+redis.call('pexpire', KEYS[1], ARGV[3])
+return 1
+"""
+
+
+def _acquire_slot(url):
+    """
+    Reserves one of ``WEBHOOK_TARGET_CONCURRENCY`` slots for concurrent calls to the host of the given URL
+    across all workers. Returns a token to pass to :py:func:`_release_slot`, ``True`` if the concurrency
+    is not limited, or ``None`` if all slots are in use.
+    """
+    if not settings.WEBHOOK_TARGET_CONCURRENCY or not settings.HAS_REDIS:
+        return True
+
+    from django_redis import get_redis_connection
+
+    rc = get_redis_connection("redis")
+    token = uuid.uuid4().hex
+    if rc.register_script(LUA_ACQUIRE_SLOT)(
+        keys=['pretix_webhook_slots_%s' % _target_key(url)],
+        args=[token, int(time.time() * 1000), (settings.WEBHOOK_TIMEOUT + 5) * 1000,
+              settings.WEBHOOK_TARGET_CONCURRENCY]
+    ):
+        return token
+
+
+def _release_slot(url, token):
+    if token is True:
+        return
+
+    from django_redis import get_redis_connection
+
+    rc = get_redis_connection("redis")
+    rc.zrem('pretix_webhook_slots_%s' % _target_key(url), token)
+
+
+def _log_call(webhook, logentry, payload, is_retry, execution_time, return_code, response_body, success=False):
+    if success and settings.WEBHOOK_LOG_SUCCESS_RATE < 1 and random.random() >= settings.WEBHOOK_LOG_SUCCESS_RATE:
+        return
+    payload = json.dumps(payload)
+    if settings.WEBHOOK_LOG_PAYLOAD_LENGTH and len(payload) > settings.WEBHOOK_LOG_PAYLOAD_LENGTH:
+        payload = payload[:settings.WEBHOOK_LOG_PAYLOAD_LENGTH] + '…'
+    WebHookCall.objects.create(
+        webhook=webhook,
+        action_type=logentry.action_type,
+        target_url=webhook.target_url,
+        is_retry=is_retry,
+        execution_time=execution_time,
+        return_code=return_code,
+        payload=payload,
+        response_body=response_body,
+        success=success
+    )
 
-        for wh in webhooks:
-            send_webhook.apply_async(args=(logentry.id, notification_type.action_type, wh.pk))
+
+class _RetryLater(Exception):
+    pass
+
+
+def _deliver(webhook, logentry_id, action_type, is_retry):
+    """
+    Sends one webhook call. Returns ``False`` if the call should be retried later.
+    """
+    logentry = LogEntry.all.get(id=logentry_id)
+    types = get_all_webhook_events()
+    event_type = types.get(action_type)
+    if not event_type or not webhook.enabled:
+        return True  # Ignore, e.g. plugin not installed
+
+    payload = event_type.build_payload(logentry)
+    if payload is None:
+        # Content object deleted?
+        return True
+
+    slot = _acquire_slot(webhook.target_url)
+    if not slot:
+        raise _RetryLater()
+
+    t = time.time()
+    try:
+        resp = _get_session(webhook.target_url).post(
+            webhook.target_url,
+            json=payload,
+            allow_redirects=False,
+            timeout=settings.WEBHOOK_TIMEOUT,
+        )
+    except RequestException as e:
+        _log_call(webhook, logentry, payload, is_retry, time.time() - t, 0, str(e)[:1024 * 1024])
+        return False
+    finally:
+        _release_slot(webhook.target_url, slot)
+
+    _log_call(webhook, logentry, payload, is_retry, time.time() - t, resp.status_code, resp.text[:1024 * 1024],
+              success=200 <= resp.status_code <= 299)
+    if resp.status_code == 410:
+        webhook.enabled = False
+        webhook.save()
+    elif resp.status_code > 299:
+        return False
+    return True
 
 
 @app.task(base=ProfiledTask, bind=True, max_retries=9, acks_late=True)
@@ -301,53 +454,34 @@ def send_webhook(self, logentry_id: int, action_type: str, webhook_id: int):
     with scopes_disabled():
         webhook = WebHook.objects.get(id=webhook_id)
     with scope(organizer=webhook.organizer):
-        logentry = LogEntry.all.get(id=logentry_id)
-        types = get_all_webhook_events()
-        event_type = types.get(action_type)
-        if not event_type or not webhook.enabled:
-            return  # Ignore, e.g. plugin not installed
-
-        payload = event_type.build_payload(logentry)
-        if payload is None:
-            # Content object deleted?
-            return
-
-        t = time.time()
-
         try:
-            try:
-                resp = requests.post(
-                    webhook.target_url,
-                    json=payload,
-                    allow_redirects=False
-                )
-                WebHookCall.objects.create(
-                    webhook=webhook,
-                    action_type=logentry.action_type,
-                    target_url=webhook.target_url,
-                    is_retry=self.request.retries > 0,
-                    execution_time=time.time() - t,
-                    return_code=resp.status_code,
-                    payload=json.dumps(payload),
-                    response_body=resp.text[:1024 * 1024],
-                    success=200 <= resp.status_code <= 299
-                )
-                if resp.status_code == 410:
-                    webhook.enabled = False
-                    webhook.save()
-                elif resp.status_code > 299:
-                    raise self.retry(countdown=2 ** (self.request.retries * 2))  # max is 2 ** (8*2) = 65536 seconds = ~18 hours
-            except RequestException as e:
-                WebHookCall.objects.create(
-                    webhook=webhook,
-                    action_type=logentry.action_type,
-                    target_url=webhook.target_url,
-                    is_retry=self.request.retries > 0,
-                    execution_time=time.time() - t,
-                    return_code=0,
-                    payload=json.dumps(payload),
-                    response_body=str(e)[:1024 * 1024]
-                )
+            if not _deliver(webhook, logentry_id, action_type, is_retry=self.request.retries > 0):
                 raise self.retry(countdown=2 ** (self.request.retries * 2))  # max is 2 ** (8*2) = 65536 seconds = ~18 hours
+        except _RetryLater:
+            # The target is busy, try again soon without counting this as a failed attempt
+            send_webhook.apply_async(args=(logentry_id, action_type, webhook_id), countdown=random.uniform(1, 5),
+                                     retries=self.request.retries)
         except MaxRetriesExceededError:
             pass
+
+
+@app.task(base=ProfiledTask, acks_late=True)
+def send_webhooks(webhook_id: int, items: list):
+    """
+    Sends a number of webhook calls to the same webhook, reusing the connection. Failed calls are retried
+    individually through :py:func:`send_webhook`.
+    """
+    with scopes_disabled():
+        webhook = WebHook.objects.get(id=webhook_id)
+    with scope(organizer=webhook.organizer):
+        for i, (logentry_id, action_type) in enumerate(items):
+            try:
+                if not _deliver(webhook, logentry_id, action_type, is_retry=False):
+                    send_webhook.apply_async(args=(logentry_id, action_type, webhook_id), countdown=1, retries=1)
+            except _RetryLater:
+                # The target is busy, hand the remaining calls back to the queue
+                send_webhooks.apply_async(args=(webhook_id, items[i:]), countdown=random.uniform(1, 5))
+                return
+            except Exception:
+                # Do not let one broken call keep the others from being delivered
+                logger.exception('Could not deliver webhook call')
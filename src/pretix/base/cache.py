@@ -1,10 +1,73 @@
 import hashlib
+import pickle
+import threading
 import time
+from collections import OrderedDict
 from typing import Callable, Dict, List
 
+from django.conf import settings
 from django.core.cache import caches
 from django.db.models import Model
 
+# Upper bound for how long a NamespacedCache instance trusts the namespace prefix it has fetched once.
+# Instances usually live for one request, this only matters for long-lived ones, e.g. in a task.
+PREFIX_PIN_SECONDS = 10
+
+_cleared = {}
+
+
+class _LocalCache:
+    """
+    A small in-process LRU cache with a short expiry time that is shared by all namespaced caches of a
+    process. Since keys contain the namespace prefix, clearing a namespace invalidates all of its entries
+    in the process that cleared it immediately, other processes see the change after the expiry time.
+    """
+
+    def __init__(self):
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+        value = entry[1]
+        # Hand out copies of mutable values, just like the cache backends do
+        return value if isinstance(value, (str, int)) else pickle.loads(value)
+
+    def set(self, key, value):
+        if value is None:
+            return
+        if not isinstance(value, (str, int)):
+            value = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data[key] = (time.monotonic() + settings.CACHE_L1_TTL, value)
+            self.data.move_to_end(key)
+            while len(self.data) > settings.CACHE_L1_SIZE:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+
+_local_cache = _LocalCache()
+
+
+def _count(layer, hits, misses):
+    if settings.METRICS_ENABLED:
+        from pretix.base.metrics import pretix_cache_requests_total
+
+        if hits:
+            pretix_cache_requests_total.inc(hits, layer=layer, result='hit')
+        if misses:
+            pretix_cache_requests_total.inc(misses, layer=layer, result='miss')
+
 
 class NamespacedCache:
 
@@ -12,72 +75,137 @@ class NamespacedCache:
         self.cache = caches[cache]
         self.prefixkey = prefixkey
         self._last_prefix = None
+        self._last_prefix_time = 0
+
+    def _get_prefix(self) -> int:
+        # The prefix is fetched once and then pinned, so that an instance that lives for the duration
+        # of a request only needs one round trip for it. Clearing the namespace in the same process
+        # unpins it for all instances.
+        t = time.monotonic()
+        if (
+            self._last_prefix is not None
+            and t - self._last_prefix_time < PREFIX_PIN_SECONDS
+            and _cleared.get(self.prefixkey, 0) <= self._last_prefix_time
+        ):
+            return self._last_prefix
 
-    def _prefix_key(self, original_key: str, known_prefix=None) -> str:
         # Race conditions can happen here, but should be very very rare.
         # We could only handle this by going _really_ lowlevel using
         # memcached's `add` keyword instead of `set`.
         # See also:
         # https://code.google.com/p/memcached/wiki/NewProgrammingTricks#Namespacing
-        prefix = known_prefix or self.cache.get(self.prefixkey)
+        prefix = self.cache.get(self.prefixkey)
         if prefix is None:
             prefix = int(time.time())
             self.cache.set(self.prefixkey, prefix)
         self._last_prefix = prefix
+        self._last_prefix_time = t
+        return prefix
+
+    def _prefix_key(self, original_key: str, prefix: int=None) -> str:
+        if prefix is None:
+            prefix = self._get_prefix()
         key = '%s:%d:%s' % (self.prefixkey, prefix, original_key)
         if len(key) > 200:  # Hash long keys, as memcached has a length limit
-            # TODO: Use a more efficient, non-cryptographic hash algorithm
-            key = hashlib.sha256(key.encode("UTF-8")).hexdigest()
+            key = '%s:%d:#%s' % (
+                self.prefixkey, prefix, hashlib.blake2b(original_key.encode("UTF-8"), digest_size=16).hexdigest()
+            )
         return key
 
-    def _strip_prefix(self, key: str) -> str:
-        return key.split(":", 2 + self.prefixkey.count(":"))[-1]
-
     def clear(self) -> None:
-        self._last_prefix = None
         try:
             prefix = self.cache.incr(self.prefixkey, 1)
         except ValueError:
-            prefix = int(time.time())
+            # The prefix has been evicted, make sure we do not accidentally reuse the one we know
+            prefix = max(int(time.time()), (self._last_prefix or 0) + 1)
             self.cache.set(self.prefixkey, prefix)
+        _cleared[self.prefixkey] = self._last_prefix_time = time.monotonic()
+        self._last_prefix = prefix
 
     def set(self, key: str, value: str, timeout: int=300):
-        return self.cache.set(self._prefix_key(key), value, timeout)
+        key = self._prefix_key(key)
+        if settings.CACHE_L1_TTL:
+            _local_cache.set(key, value)
+        return self.cache.set(key, value, timeout)
 
     def get(self, key: str) -> str:
-        return self.cache.get(self._prefix_key(key, known_prefix=self._last_prefix))
+        key = self._prefix_key(key)
+        if settings.CACHE_L1_TTL:
+            value = _local_cache.get(key)
+            _count('l1', value is not None, value is None)
+            if value is not None:
+                return value
+
+        value = self.cache.get(key)
+        _count('backend', value is not None, value is None)
+        if settings.CACHE_L1_TTL:
+            _local_cache.set(key, value)
+        return value
 
     def get_or_set(self, key: str, default: Callable, timeout=300) -> str:
-        return self.cache.get_or_set(
-            self._prefix_key(key, known_prefix=self._last_prefix),
-            default=default,
-            timeout=timeout
-        )
+        value = self.get(key)
+        if value is None:
+            value = default() if callable(default) else default
+            if value is not None:
+                self.set(key, value, timeout)
+        return value
 
     def get_many(self, keys: List[str]) -> Dict[str, str]:
-        values = self.cache.get_many([self._prefix_key(key) for key in keys])
-        newvalues = {}
+        prefix = self._get_prefix()
+        keymap = {self._prefix_key(key, prefix): key for key in keys}
+        result = {}
+
+        if settings.CACHE_L1_TTL:
+            for k, original_key in keymap.items():
+                value = _local_cache.get(k)
+                if value is not None:
+                    result[original_key] = value
+            _count('l1', len(result), len(keymap) - len(result))
+            if len(result) == len(keymap):
+                return result
+            missing = [k for k, original_key in keymap.items() if original_key not in result]
+        else:
+            missing = list(keymap)
+
+        values = self.cache.get_many(missing)
+        _count('backend', len(values), len(missing) - len(values))
         for k, v in values.items():
-            newvalues[self._strip_prefix(k)] = v
-        return newvalues
+            if settings.CACHE_L1_TTL:
+                _local_cache.set(k, v)
+            result[keymap[k]] = v
+        return result
 
     def set_many(self, values: Dict[str, str], timeout=300):
+        prefix = self._get_prefix()
         newvalues = {}
         for k, v in values.items():
-            newvalues[self._prefix_key(k)] = v
+            k = self._prefix_key(k, prefix)
+            newvalues[k] = v
+            if settings.CACHE_L1_TTL:
+                _local_cache.set(k, v)
         return self.cache.set_many(newvalues, timeout)
 
     def delete(self, key: str):  # NOQA
-        return self.cache.delete(self._prefix_key(key))
+        key = self._prefix_key(key)
+        _local_cache.delete(key)
+        return self.cache.delete(key)
 
     def delete_many(self, keys: List[str]):  # NOQA
-        return self.cache.delete_many([self._prefix_key(key) for key in keys])
+        prefix = self._get_prefix()
+        keys = [self._prefix_key(key, prefix) for key in keys]
+        for key in keys:
+            _local_cache.delete(key)
+        return self.cache.delete_many(keys)
 
     def incr(self, key: str, by: int=1):  # NOQA
-        return self.cache.incr(self._prefix_key(key), by)
+        key = self._prefix_key(key)
+        _local_cache.delete(key)
+        return self.cache.incr(key, by)
 
     def decr(self, key: str, by: int=1):  # NOQA
-        return self.cache.decr(self._prefix_key(key), by)
+        key = self._prefix_key(key)
+        _local_cache.delete(key)
+        return self.cache.decr(key, by)
 
     def close(self):  # NOQA
         pass
@@ -92,9 +220,10 @@ class ObjectRelatedCache(NamespacedCache):
     main purpose of this is to be able to flush all cached data related
     to this object at once.
 
-    The ObjectRelatedCache instance itself is stateless, all state is
-    stored in the cache backend, so you can instantiate this class as many
-    times as you want.
+    All state is stored in the cache backend, so you can instantiate this
+    class as many times as you want. An instance only remembers the current
+    namespace of the object for a few seconds, so it is best used for the
+    duration of a request or task, e.g. through ``event.cache``.
     """
 
     def __init__(self, obj: Model, cache: str='default'):
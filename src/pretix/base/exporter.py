@@ -1,19 +1,26 @@
 import io
+import json
 import re
 import tempfile
+import uuid
 from collections import OrderedDict, namedtuple
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from typing import Tuple
 
 from defusedcsv import csv
 from django import forms
+from django.core.files import File
 from django.db.models import QuerySet
 from django.utils.formats import localize
-from django.utils.translation import gettext, gettext_lazy as _
+from django.utils.timezone import now
+from django.utils.translation import get_language, gettext, gettext_lazy as _
 from openpyxl import Workbook
 from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE, KNOWN_TYPES
 
-from pretix.base.models import Event
+from pretix.base.models import CachedFile, Event, cachedfile_name
+
+SNAPSHOT_NAMESPACE = uuid.UUID('8a0b9c64-5d33-4b3e-a7a4-5a6f0c1e2d71')
 
 
 def excel_safe(val):
@@ -137,46 +144,44 @@ class ListExporter(BaseExporter):
     def get_filename(self):
         return 'export'
 
-    def _render_csv(self, form_data, output_file=None, **kwargs):
-        if output_file:
-            if 'b' in output_file.mode:
-                output_file = io.TextIOWrapper(output_file, encoding='utf-8', newline='')
-            writer = csv.writer(output_file, **kwargs)
-            total = 0
-            counter = 0
-            for line in self.iterate_list(form_data):
-                if isinstance(line, self.ProgressSetTotal):
-                    total = line.total
-                    continue
-                line = [
-                    localize(f) if isinstance(f, Decimal) else f
-                    for f in line
-                ]
-                if total:
-                    counter += 1
-                    if counter % max(10, total // 100) == 0:
-                        self.progress_callback(counter / total * 100)
-                writer.writerow(line)
-            return self.get_filename() + '.csv', 'text/csv', None
+    def _write_csv(self, lines, output_file=None, **kwargs):
+        """
+        Writes the rows yielded by ``lines`` as CSV, either directly into ``output_file`` or into memory if no
+        file is given. Returns the file content in the latter case and ``None`` otherwise.
+        """
+        if output_file and 'b' in output_file.mode:
+            output = io.TextIOWrapper(output_file, encoding='utf-8', newline='')
+        elif output_file:
+            output = output_file
         else:
             output = io.StringIO()
-            writer = csv.writer(output, **kwargs)
-            total = 0
-            counter = 0
-            for line in self.iterate_list(form_data):
-                if isinstance(line, self.ProgressSetTotal):
-                    total = line.total
-                    continue
-                line = [
-                    localize(f) if isinstance(f, Decimal) else f
-                    for f in line
-                ]
-                if total:
-                    counter += 1
-                    if counter % max(10, total // 100) == 0:
-                        self.progress_callback(counter / total * 100)
-                writer.writerow(line)
-            return self.get_filename() + '.csv', 'text/csv', output.getvalue().encode("utf-8")
+        writer = csv.writer(output, **kwargs)
+        total = 0
+        counter = 0
+        for line in lines:
+            if isinstance(line, self.ProgressSetTotal):
+                total = line.total
+                continue
+            line = [
+                localize(f) if isinstance(f, Decimal) else f
+                for f in line
+            ]
+            writer.writerow(line)
+            if total:
+                counter += 1
+                if counter % max(10, total // 100) == 0:
+                    self.progress_callback(counter / total * 100)
+
+        if not output_file:
+            return output.getvalue().encode("utf-8")
+        if output is not output_file:
+            # Detach the wrapper, otherwise it closes output_file as soon as it is garbage collected
+            output.flush()
+            output.detach()
+
+    def _render_csv(self, form_data, output_file=None, **kwargs):
+        data = self._write_csv(self.iterate_list(form_data), output_file=output_file, **kwargs)
+        return self.get_filename() + '.csv', 'text/csv', data
 
     def _render_xlsx(self, form_data, output_file=None):
         wb = Workbook(write_only=True)
@@ -259,43 +264,8 @@ class MultiSheetListExporter(ListExporter):
             raise NotImplementedError()  # noqa
 
     def _render_sheet_csv(self, form_data, sheet, output_file=None, **kwargs):
-        total = 0
-        counter = 0
-        if output_file:
-            if 'b' in output_file.mode:
-                output_file = io.TextIOWrapper(output_file, encoding='utf-8', newline='')
-            writer = csv.writer(output_file, **kwargs)
-            for line in self.iterate_sheet(form_data, sheet):
-                if isinstance(line, self.ProgressSetTotal):
-                    total = line.total
-                    continue
-                line = [
-                    localize(f) if isinstance(f, Decimal) else f
-                    for f in line
-                ]
-                writer.writerow(line)
-                if total:
-                    counter += 1
-                    if counter % max(10, total // 100) == 0:
-                        self.progress_callback(counter / total * 100)
-            return self.get_filename() + '.csv', 'text/csv', None
-        else:
-            output = io.StringIO()
-            writer = csv.writer(output, **kwargs)
-            for line in self.iterate_sheet(form_data, sheet):
-                if isinstance(line, self.ProgressSetTotal):
-                    total = line.total
-                    continue
-                line = [
-                    localize(f) if isinstance(f, Decimal) else f
-                    for f in line
-                ]
-                writer.writerow(line)
-                if total:
-                    counter += 1
-                    if counter % max(10, total // 100) == 0:
-                        self.progress_callback(counter / total * 100)
-            return self.get_filename() + '.csv', 'text/csv', output.getvalue().encode("utf-8")
+        data = self._write_csv(self.iterate_sheet(form_data, sheet), output_file=output_file, **kwargs)
+        return self.get_filename() + '.csv', 'text/csv', data
 
     def _render_xlsx(self, form_data, output_file=None):
         wb = Workbook(write_only=True)
@@ -341,3 +311,217 @@ class MultiSheetListExporter(ListExporter):
                 return self._render_sheet_csv(form_data, sheet, dialect='excel', output_file=output_file)
             elif f == 'semicolon':
                 return self._render_sheet_csv(form_data, sheet, dialect='excel', delimiter=';', output_file=output_file)
+
+
+def _snapshot_encode(val):
+    if isinstance(val, Decimal):
+        return {'__decimal': str(val)}
+    elif isinstance(val, datetime):
+        return {'__datetime': val.isoformat()}
+    elif isinstance(val, date):
+        return {'__date': val.isoformat()}
+    elif isinstance(val, time):
+        return {'__time': val.isoformat()}
+    return str(val)
+
+
+def _snapshot_decode(obj):
+    if len(obj) == 1:
+        if '__decimal' in obj:
+            return Decimal(obj['__decimal'])
+        elif '__datetime' in obj:
+            return datetime.fromisoformat(obj['__datetime'])
+        elif '__date' in obj:
+            return date.fromisoformat(obj['__date'])
+        elif '__time' in obj:
+            return time.fromisoformat(obj['__time'])
+    return obj
+
+
+class OrderSnapshot:
+    """
+    Stores the rows an exporter generated for every order, so that the next export with the same options only
+    needs to generate the rows of the orders that have been modified since and can take all other rows from
+    the stored snapshot.
+
+    An order counts as modified if its ``last_modified`` timestamp changed, i.e. the same rule the
+    ``modified_since`` filter of the REST API follows. Changes to the events themselves (products, questions,
+    settings, …) clear the event cache and therefore invalidate all snapshots of the event. The snapshot is
+    kept as a :py:class:`CachedFile` for ``SNAPSHOT_TTL``.
+    """
+    SNAPSHOT_TTL = timedelta(days=7)
+    # Increase this whenever the file format changes, so that older snapshots are no longer used
+    VERSION = 2
+    # Orders are not visible to us before their transaction is committed, which might be a while after their
+    # modification date has been set.
+    OVERLAP = timedelta(minutes=5)
+
+    def __init__(self, events, identifier: str, options: dict):
+        self.events = list(events)
+        key = json.dumps([identifier, sorted(e.pk for e in self.events), options, get_language()],
+                         sort_keys=True, default=str)
+        self.id = uuid.uuid5(SNAPSHOT_NAMESPACE, key)
+
+    def _tokens(self):
+        return [
+            e.cache.get_or_set('export_snapshot_token', lambda: uuid.uuid4().hex, self.SNAPSHOT_TTL.total_seconds())
+            for e in self.events
+        ]
+
+    def _load(self, tokens):
+        try:
+            cf = CachedFile.objects.get(id=self.id)
+        except CachedFile.DoesNotExist:
+            return None, None
+        if not cf.file:
+            return None, None
+        f = io.TextIOWrapper(cf.file.open('rb'), encoding='utf-8')
+        meta = json.loads(f.readline(), object_hook=_snapshot_decode)
+        if meta.get('tokens') != tokens or meta.get('version') != self.VERSION:
+            f.close()
+            return None, None
+        # Every line after the header is a ``[pk, number of rows, rows]`` list, we only need the numbers for now
+        meta['orders'] = {}
+        for line in f:
+            pk, n = line[1:].split(',', 2)[:2]
+            if pk.isdigit():
+                meta['orders'][int(pk)] = int(n)
+        f.seek(0)
+        f.readline()
+        return meta, f
+
+    def _save(self, tmp):
+        tmp.seek(0)
+        cf, created = CachedFile.objects.get_or_create(id=self.id, defaults={
+            'filename': 'snapshot.jsonl', 'type': 'application/x-ndjson', 'web_download': False
+        })
+        old_file = cf.file.name if cf.file else None
+        cf.expires = now() + self.SNAPSHOT_TTL
+        cf.date = now()
+        cf.file.save(cachedfile_name(cf, cf.filename), File(tmp), save=False)
+        cf.save()
+        if old_file:
+            cf.file.storage.delete(old_file)
+
+    def iterate(self, orders, generate, row_key):
+        """
+        Yields the same rows as ``generate(None)`` would, but only generates the rows of changed orders.
+
+        :param orders: A queryset of all orders included in the export
+        :param generate: A callable that returns an iterator of rows for the orders with the given IDs (or for all
+                         orders if ``None`` is passed). Its first row needs to be the header row, which is compared
+                         to the header of the snapshot.
+        :param row_key: A callable that returns the ``(event slug, order code)`` tuple a row belongs to
+        """
+        start = now()
+        tokens = self._tokens()
+        ordered = list(orders.order_by('datetime', 'pk').values_list('pk', 'event__slug', 'code'))
+        pks = {(slug, code): pk for pk, slug, code in ordered}
+
+        meta, snapshot = self._load(tokens)
+        changed = None
+        if meta:
+            changed = set(orders.filter(
+                last_modified__gte=meta['high_water_mark'] - self.OVERLAP
+            ).values_list('pk', flat=True))
+            # Orders that are not in the snapshot are new or have not been stored correctly
+            changed |= {pk for pk, slug, code in ordered} - meta['orders'].keys()
+            if len(changed) > len(ordered) // 2:
+                # Not worth the effort
+                changed = None
+
+        try:
+            rows = generate(changed) if changed is not None else None
+            headers = next(rows) if rows is not None else None
+            if rows is None or [str(h) for h in headers] != meta['headers']:
+                if snapshot:
+                    snapshot.close()
+                    snapshot = None
+                rows = generate(None)
+                headers = next(rows)
+                changed = None
+
+            with tempfile.TemporaryFile('w+b') as tmp:
+                out = io.TextIOWrapper(tmp, encoding='utf-8')
+                out.write(json.dumps({
+                    'version': self.VERSION,
+                    'tokens': tokens,
+                    'high_water_mark': start,
+                    'headers': [str(h) for h in headers],
+                }, default=_snapshot_encode) + '\n')
+
+                def write(pk, group):
+                    out.write(json.dumps([pk, len(group), group], default=_snapshot_encode) + '\n')
+
+                yield headers
+                if changed is None:
+                    # Orders without any rows get an empty line as well, so that we know they are in the snapshot.
+                    # The rows are generated in the same order as ``ordered``, so we can write them along the way.
+                    positions = {pk: i for i, (pk, slug, code) in enumerate(ordered)}
+                    next_pos = 0
+
+                    def write_empty(until):
+                        nonlocal next_pos
+                        for pk, slug, code in ordered[next_pos:until]:
+                            write(pk, [])
+                        next_pos = max(next_pos, until)
+
+                    current, group = None, []
+                    for row in rows:
+                        if isinstance(row, ListExporter.ProgressSetTotal):
+                            yield row
+                            continue
+                        pk = pks.get(row_key(row))
+                        if pk != current and group:
+                            write(current, group)
+                            group = []
+                        if pk != current and pk in positions:
+                            write_empty(positions[pk])
+                            next_pos = max(next_pos, positions[pk] + 1)
+                        current = pk
+                        group.append(row)
+                        yield row
+                    if group:
+                        write(current, group)
+                    write_empty(len(ordered))
+                else:
+                    # The rows of the changed orders are generated in the same order as ``ordered`` as well, so we
+                    # can merge them with the snapshot one order at a time.
+                    fresh_total = 0
+                    next_row = None
+                    for row in rows:
+                        if isinstance(row, ListExporter.ProgressSetTotal):
+                            fresh_total = row.total
+                        else:
+                            next_row = row
+                            break
+                    fresh = (row for row in rows if not isinstance(row, ListExporter.ProgressSetTotal))
+
+                    yield ListExporter.ProgressSetTotal(total=fresh_total + sum(
+                        meta['orders'].get(pk, 0) for pk, slug, code in ordered if pk not in changed
+                    ))
+                    pending = {}
+                    for pk, slug, code in ordered:
+                        group = []
+                        if pk in changed:
+                            while next_row is not None and pks.get(row_key(next_row)) == pk:
+                                group.append(next_row)
+                                next_row = next(fresh, None)
+                        else:
+                            # The snapshot is in the same order, so we usually find the order in the next line
+                            while pk not in pending:
+                                line = snapshot.readline()
+                                if not line:
+                                    break
+                                spk, n, sgroup = json.loads(line, object_hook=_snapshot_decode)
+                                pending[spk] = sgroup
+                            group = pending.pop(pk, [])
+                        write(pk, group)
+                        yield from group
+
+                out.flush()
+                out.detach()
+                self._save(tmp)
+        finally:
+            if snapshot:
+                snapshot.close()
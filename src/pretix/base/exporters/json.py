@@ -1,10 +1,13 @@
 import json
+from collections import OrderedDict
 from decimal import Decimal
 
+from django import forms
 from django.core.serializers.json import DjangoJSONEncoder
 from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
 
-from ..exporter import BaseExporter
+from ..exporter import BaseExporter, OrderSnapshot
 from ..signals import register_data_exporters
 
 
@@ -12,7 +15,70 @@ class JSONExporter(BaseExporter):
     identifier = 'json'
     verbose_name = 'Order data (JSON)'
 
+    @property
+    def export_form_fields(self):
+        return OrderedDict(
+            [
+                ('incremental',
+                 forms.BooleanField(
+                     label=_('Only update orders that changed since the last export'),
+                     help_text=_('This makes repeated exports of large events a lot faster.'),
+                     initial=False,
+                     required=False
+                 )),
+            ]
+        )
+
+    def iterate_orders(self, order_ids=None):
+        yield []
+        qs = self.event.orders.all()
+        if order_ids is not None:
+            qs = qs.filter(pk__in=order_ids)
+        for order in qs.order_by('datetime', 'pk').prefetch_related('positions', 'positions__answers', 'fees'):
+            yield {
+                'code': order.code,
+                'status': order.status,
+                'user': order.email,
+                'datetime': order.datetime,
+                'fees': [
+                    {
+                        'type': fee.fee_type,
+                        'description': fee.description,
+                        'value': fee.value,
+                    } for fee in order.fees.all()
+                ],
+                'total': order.total,
+                'positions': [
+                    {
+                        'id': position.id,
+                        'item': position.item_id,
+                        'variation': position.variation_id,
+                        'price': position.price,
+                        'attendee_name': position.attendee_name,
+                        'attendee_email': position.attendee_email,
+                        'secret': position.secret,
+                        'addon_to': position.addon_to_id,
+                        'answers': [
+                            {
+                                'question': answer.question_id,
+                                'answer': answer.answer
+                            } for answer in position.answers.all()
+                        ]
+                    } for position in order.positions.all()
+                ]
+            }
+
     def render(self, form_data):
+        if form_data.get('incremental'):
+            orders = OrderSnapshot(self.events, self.identifier, {}).iterate(
+                self.event.orders.all(), self.iterate_orders, lambda row: (self.event.slug, row['code'])
+            )
+        else:
+            orders = self.iterate_orders()
+        next(orders)  # header
+        # Newest orders first, as always
+        orders = [o for o in orders if isinstance(o, dict)][::-1]
+
         jo = {
             'event': {
                 'name': str(self.event.name),
@@ -57,41 +123,7 @@ class JSONExporter(BaseExporter):
                         'type': question.type
                     } for question in self.event.questions.all()
                 ],
-                'orders': [
-                    {
-                        'code': order.code,
-                        'status': order.status,
-                        'user': order.email,
-                        'datetime': order.datetime,
-                        'fees': [
-                            {
-                                'type': fee.fee_type,
-                                'description': fee.description,
-                                'value': fee.value,
-                            } for fee in order.fees.all()
-                        ],
-                        'total': order.total,
-                        'positions': [
-                            {
-                                'id': position.id,
-                                'item': position.item_id,
-                                'variation': position.variation_id,
-                                'price': position.price,
-                                'attendee_name': position.attendee_name,
-                                'attendee_email': position.attendee_email,
-                                'secret': position.secret,
-                                'addon_to': position.addon_to_id,
-                                'answers': [
-                                    {
-                                        'question': answer.question_id,
-                                        'answer': answer.answer
-                                    } for answer in position.answers.all()
-                                ]
-                            } for position in order.positions.all()
-                        ]
-                    } for order in
-                    self.event.orders.all().prefetch_related('positions', 'positions__answers', 'fees')
-                ],
+                'orders': orders,
                 'quotas': [
                     {
                         'id': quota.id,
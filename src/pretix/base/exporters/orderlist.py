@@ -21,7 +21,7 @@ from pretix.base.settings import PERSON_NAME_SCHEMES
 from ...control.forms.filter import get_all_payment_providers
 from ...helpers import GroupConcat
 from ...helpers.iter import chunked_iterable
-from ..exporter import ListExporter, MultiSheetListExporter
+from ..exporter import ListExporter, MultiSheetListExporter, OrderSnapshot
 from ..signals import (
     register_data_exporters, register_multievent_data_exporters,
 )
@@ -30,6 +30,8 @@ from ..signals import (
 class OrderListExporter(MultiSheetListExporter):
     identifier = 'orderlist'
     verbose_name = gettext_lazy('Order data')
+    # Number of rows fetched and processed at once, to keep the memory usage independent of the export size
+    chunk_size = 1000
 
     @cached_property
     def providers(self):
@@ -65,6 +67,13 @@ class OrderListExporter(MultiSheetListExporter):
                      initial=False,
                      required=False
                  )),
+                ('incremental',
+                 forms.BooleanField(
+                     label=_('Only update orders that changed since the last export'),
+                     help_text=_('This makes repeated exports of large events a lot faster.'),
+                     initial=False,
+                     required=False
+                 )),
             ]
         )
 
@@ -93,18 +102,34 @@ class OrderListExporter(MultiSheetListExporter):
         return tax_rates
 
     def iterate_sheet(self, form_data, sheet):
+        if form_data.get('incremental'):
+            orders = Order.objects.filter(event__in=self.events)
+            if form_data['paid_only']:
+                orders = orders.filter(status=Order.STATUS_PAID)
+            snapshot = OrderSnapshot(
+                self.events, '{}:{}'.format(self.identifier, sheet),
+                {k: v for k, v in form_data.items() if not k.startswith('_')}
+            )
+            return snapshot.iterate(
+                orders,
+                lambda order_ids: self._iterate_sheet(form_data, sheet, order_ids),
+                lambda row: (row[0], row[1])
+            )
+        return self._iterate_sheet(form_data, sheet)
+
+    def _iterate_sheet(self, form_data, sheet, order_ids=None):
         if sheet == 'orders':
-            return self.iterate_orders(form_data)
+            return self.iterate_orders(form_data, order_ids)
         elif sheet == 'positions':
-            return self.iterate_positions(form_data)
+            return self.iterate_positions(form_data, order_ids)
         elif sheet == 'fees':
-            return self.iterate_fees(form_data)
+            return self.iterate_fees(form_data, order_ids)
 
     @cached_property
     def event_object_cache(self):
         return {e.pk: e for e in self.events}
 
-    def iterate_orders(self, form_data: dict):
+    def iterate_orders(self, form_data: dict, order_ids=None):
         p_date = OrderPayment.objects.filter(
             order=OuterRef('pk'),
             state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED),
@@ -142,6 +167,8 @@ class OrderListExporter(MultiSheetListExporter):
         ).select_related('invoice_address')
         if form_data['paid_only']:
             qs = qs.filter(status=Order.STATUS_PAID)
+        if order_ids is not None:
+            qs = qs.filter(pk__in=order_ids)
         tax_rates = self._get_all_tax_rates(qs)
 
         headers = [
@@ -177,117 +204,118 @@ class OrderListExporter(MultiSheetListExporter):
 
         yield headers
 
-        full_fee_sum_cache = {
-            o['order__id']: o['grosssum'] for o in
-            OrderFee.objects.values('tax_rate', 'order__id').order_by().annotate(grosssum=Sum('value'))
-        }
-        fee_sum_cache = {
-            (o['order__id'], o['tax_rate']): o for o in
-            OrderFee.objects.values('tax_rate', 'order__id').order_by().annotate(
-                taxsum=Sum('tax_value'), grosssum=Sum('value')
-            )
-        }
-        if form_data.get('include_payment_amounts'):
-            payment_sum_cache = {
-                (o['order__id'], o['provider']): o['grosssum'] for o in
-                OrderPayment.objects.values('provider', 'order__id').order_by().filter(
-                    state__in=[OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED]
-                ).annotate(
-                    grosssum=Sum('amount')
+        yield self.ProgressSetTotal(total=qs.count())
+        for orders in chunked_iterable(qs.order_by('datetime', 'pk').iterator(chunk_size=self.chunk_size), self.chunk_size):
+            order_ids = [o.pk for o in orders]
+            full_fee_sum_cache = {
+                o['order__id']: o['grosssum'] for o in
+                OrderFee.objects.filter(order_id__in=order_ids).values('tax_rate', 'order__id').order_by().annotate(grosssum=Sum('value'))
+            }
+            fee_sum_cache = {
+                (o['order__id'], o['tax_rate']): o for o in
+                OrderFee.objects.filter(order_id__in=order_ids).values('tax_rate', 'order__id').order_by().annotate(
+                    taxsum=Sum('tax_value'), grosssum=Sum('value')
                 )
             }
-            refund_sum_cache = {
-                (o['order__id'], o['provider']): o['grosssum'] for o in
-                OrderRefund.objects.values('provider', 'order__id').order_by().filter(
-                    state__in=[OrderRefund.REFUND_STATE_DONE, OrderRefund.REFUND_STATE_TRANSIT]
-                ).annotate(
-                    grosssum=Sum('amount')
+            if form_data.get('include_payment_amounts'):
+                payment_sum_cache = {
+                    (o['order__id'], o['provider']): o['grosssum'] for o in
+                    OrderPayment.objects.filter(order_id__in=order_ids).values('provider', 'order__id').order_by().filter(
+                        state__in=[OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED]
+                    ).annotate(
+                        grosssum=Sum('amount')
+                    )
+                }
+                refund_sum_cache = {
+                    (o['order__id'], o['provider']): o['grosssum'] for o in
+                    OrderRefund.objects.filter(order_id__in=order_ids).values('provider', 'order__id').order_by().filter(
+                        state__in=[OrderRefund.REFUND_STATE_DONE, OrderRefund.REFUND_STATE_TRANSIT]
+                    ).annotate(
+                        grosssum=Sum('amount')
+                    )
+                }
+            sum_cache = {
+                (o['order__id'], o['tax_rate']): o for o in
+                OrderPosition.objects.filter(order_id__in=order_ids).values('tax_rate', 'order__id').order_by().annotate(
+                    taxsum=Sum('tax_value'), grosssum=Sum('price')
                 )
             }
-        sum_cache = {
-            (o['order__id'], o['tax_rate']): o for o in
-            OrderPosition.objects.values('tax_rate', 'order__id').order_by().annotate(
-                taxsum=Sum('tax_value'), grosssum=Sum('price')
-            )
-        }
 
-        yield self.ProgressSetTotal(total=qs.count())
-        for order in qs.order_by('datetime').iterator():
-            tz = pytz.timezone(self.event_object_cache[order.event_id].settings.timezone)
+            for order in orders:
+                tz = pytz.timezone(self.event_object_cache[order.event_id].settings.timezone)
 
-            row = [
-                self.event_object_cache[order.event_id].slug,
-                order.code,
-                order.total,
-                order.get_status_display(),
-                order.email,
-                str(order.phone) if order.phone else '',
-                order.datetime.astimezone(tz).strftime('%Y-%m-%d'),
-                order.datetime.astimezone(tz).strftime('%H:%M:%S'),
-            ]
-            try:
-                row += [
-                    order.invoice_address.company,
-                    order.invoice_address.name,
+                row = [
+                    self.event_object_cache[order.event_id].slug,
+                    order.code,
+                    order.total,
+                    order.get_status_display(),
+                    order.email,
+                    str(order.phone) if order.phone else '',
+                    order.datetime.astimezone(tz).strftime('%Y-%m-%d'),
+                    order.datetime.astimezone(tz).strftime('%H:%M:%S'),
                 ]
-                if name_scheme and len(name_scheme['fields']) > 1:
-                    for k, label, w in name_scheme['fields']:
-                        row.append(
-                            order.invoice_address.name_parts.get(k, '')
-                        )
+                try:
+                    row += [
+                        order.invoice_address.company,
+                        order.invoice_address.name,
+                    ]
+                    if name_scheme and len(name_scheme['fields']) > 1:
+                        for k, label, w in name_scheme['fields']:
+                            row.append(
+                                order.invoice_address.name_parts.get(k, '')
+                            )
+                    row += [
+                        order.invoice_address.street,
+                        order.invoice_address.zipcode,
+                        order.invoice_address.city,
+                        order.invoice_address.country if order.invoice_address.country else
+                        order.invoice_address.country_old,
+                        order.invoice_address.state,
+                        order.invoice_address.custom_field,
+                        order.invoice_address.vat_id,
+                    ]
+                except InvoiceAddress.DoesNotExist:
+                    row += [''] * (9 + (len(name_scheme['fields']) if name_scheme and len(name_scheme['fields']) > 1 else 0))
+
                 row += [
-                    order.invoice_address.street,
-                    order.invoice_address.zipcode,
-                    order.invoice_address.city,
-                    order.invoice_address.country if order.invoice_address.country else
-                    order.invoice_address.country_old,
-                    order.invoice_address.state,
-                    order.invoice_address.custom_field,
-                    order.invoice_address.vat_id,
+                    order.payment_date.astimezone(tz).strftime('%Y-%m-%d') if order.payment_date else '',
+                    full_fee_sum_cache.get(order.id) or Decimal('0.00'),
+                    order.locale,
                 ]
-            except InvoiceAddress.DoesNotExist:
-                row += [''] * (9 + (len(name_scheme['fields']) if name_scheme and len(name_scheme['fields']) > 1 else 0))
-
-            row += [
-                order.payment_date.astimezone(tz).strftime('%Y-%m-%d') if order.payment_date else '',
-                full_fee_sum_cache.get(order.id) or Decimal('0.00'),
-                order.locale,
-            ]
 
-            for tr in tax_rates:
-                taxrate_values = sum_cache.get((order.id, tr), {'grosssum': Decimal('0.00'), 'taxsum': Decimal('0.00')})
-                fee_taxrate_values = fee_sum_cache.get((order.id, tr),
-                                                       {'grosssum': Decimal('0.00'), 'taxsum': Decimal('0.00')})
+                for tr in tax_rates:
+                    taxrate_values = sum_cache.get((order.id, tr), {'grosssum': Decimal('0.00'), 'taxsum': Decimal('0.00')})
+                    fee_taxrate_values = fee_sum_cache.get((order.id, tr),
+                                                           {'grosssum': Decimal('0.00'), 'taxsum': Decimal('0.00')})
 
-                row += [
-                    taxrate_values['grosssum'] + fee_taxrate_values['grosssum'],
-                    (
-                        taxrate_values['grosssum'] - taxrate_values['taxsum'] +
-                        fee_taxrate_values['grosssum'] - fee_taxrate_values['taxsum']
-                    ),
-                    taxrate_values['taxsum'] + fee_taxrate_values['taxsum'],
-                ]
+                    row += [
+                        taxrate_values['grosssum'] + fee_taxrate_values['grosssum'],
+                        (
+                            taxrate_values['grosssum'] - taxrate_values['taxsum'] +
+                            fee_taxrate_values['grosssum'] - fee_taxrate_values['taxsum']
+                        ),
+                        taxrate_values['taxsum'] + fee_taxrate_values['taxsum'],
+                    ]
 
-            row.append(order.invoice_numbers)
-            row.append(order.sales_channel)
-            row.append(_('Yes') if order.checkin_attention else _('No'))
-            row.append(order.comment or "")
-            row.append(order.pcnt)
-            row.append(', '.join([
-                str(self.providers.get(p, p)) for p in sorted(set((order.payment_providers or '').split(',')))
-                if p and p != 'free'
-            ]))
+                row.append(order.invoice_numbers)
+                row.append(order.sales_channel)
+                row.append(_('Yes') if order.checkin_attention else _('No'))
+                row.append(order.comment or "")
+                row.append(order.pcnt)
+                row.append(', '.join([
+                    str(self.providers.get(p, p)) for p in sorted(set((order.payment_providers or '').split(',')))
+                    if p and p != 'free'
+                ]))
 
-            if form_data.get('include_payment_amounts'):
-                payment_methods = self._get_all_payment_methods(qs)
-                for id, vn in payment_methods:
-                    row.append(
-                        payment_sum_cache.get((order.id, id), Decimal('0.00')) -
-                        refund_sum_cache.get((order.id, id), Decimal('0.00'))
-                    )
-            yield row
+                if form_data.get('include_payment_amounts'):
+                    for id, vn in payment_methods:
+                        row.append(
+                            payment_sum_cache.get((order.id, id), Decimal('0.00')) -
+                            refund_sum_cache.get((order.id, id), Decimal('0.00'))
+                        )
+                yield row
 
-    def iterate_fees(self, form_data: dict):
+    def iterate_fees(self, form_data: dict, order_ids=None):
         p_providers = OrderPayment.objects.filter(
             order=OuterRef('order'),
             state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED,
@@ -304,6 +332,8 @@ class OrderListExporter(MultiSheetListExporter):
         ).select_related('order', 'order__invoice_address', 'tax_rule')
         if form_data['paid_only']:
             qs = qs.filter(order__status=Order.STATUS_PAID)
+        if order_ids is not None:
+            qs = qs.filter(order_id__in=order_ids)
 
         headers = [
             _('Event slug'),
@@ -334,7 +364,7 @@ class OrderListExporter(MultiSheetListExporter):
         yield headers
 
         yield self.ProgressSetTotal(total=qs.count())
-        for op in qs.order_by('order__datetime').iterator():
+        for op in qs.order_by('order__datetime', 'order_id', 'pk').iterator():
             order = op.order
             tz = pytz.timezone(order.event.settings.timezone)
             row = [
@@ -379,7 +409,7 @@ class OrderListExporter(MultiSheetListExporter):
             ]))
             yield row
 
-    def iterate_positions(self, form_data: dict):
+    def iterate_positions(self, form_data: dict, order_ids=None):
         p_providers = OrderPayment.objects.filter(
             order=OuterRef('order'),
             state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED,
@@ -392,6 +422,8 @@ class OrderListExporter(MultiSheetListExporter):
         base_qs = OrderPosition.objects.filter(
             order__event__in=self.events,
         )
+        if order_ids is not None:
+            base_qs = base_qs.filter(order_id__in=order_ids)
         qs = base_qs.annotate(
             payment_providers=Subquery(p_providers, output_field=CharField()),
         ).select_related(
@@ -482,10 +514,11 @@ class OrderListExporter(MultiSheetListExporter):
 
         yield headers
 
-        all_ids = list(base_qs.order_by('order__datetime', 'positionid').values_list('pk', flat=True))
+        all_ids = list(base_qs.order_by('order__datetime', 'order_id', 'positionid').values_list('pk', flat=True))
         yield self.ProgressSetTotal(total=len(all_ids))
-        for ids in chunked_iterable(all_ids, 1000):
-            ops = sorted(qs.filter(id__in=ids), key=lambda k: ids.index(k.pk))
+        for ids in chunked_iterable(all_ids, self.chunk_size):
+            positions = {op.pk: op for op in qs.filter(id__in=ids)}
+            ops = [positions[i] for i in ids if i in positions]
 
             for op in ops:
                 order = op.order
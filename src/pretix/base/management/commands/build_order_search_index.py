@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Order
+from pretix.base.services.search import build_search_index, update_search_index
+
+
+class Command(BaseCommand):
+    help = "Add all orders that are missing from the order search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild the index entries of all orders')
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        if options.get('rebuild'):
+            update_search_index(Order.objects.order_by().values_list('pk', flat=True).iterator())
+        added = build_search_index()
+        self.stdout.write(self.style.SUCCESS(f'Done, {added} orders added.'))
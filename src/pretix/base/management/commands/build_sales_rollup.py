@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Event, OutdatedSalesRollup
+from pretix.base.services.stats import (
+    mark_sales_rollup_outdated, refresh_sales_rollup,
+)
+
+
+class Command(BaseCommand):
+    help = "Recompute all outdated parts of the sales rollup used by the order overview and the dashboard"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute the sales rollup of all events')
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        if options.get('rebuild'):
+            for event in Event.objects.all():
+                mark_sales_rollup_outdated(event)
+        n = 0
+        for event in Event.objects.filter(pk__in=OutdatedSalesRollup.objects.values('event_id')):
+            refresh_sales_rollup(event, full=True)
+            n += 1
+        self.stdout.write(self.style.SUCCESS(f'Done, {n} events updated.'))
@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+from tqdm import tqdm
+
+from pretix.base.models import Event
+from pretix.base.services.tickets import pregenerate, pregenerate_queryset
+
+
+class Command(BaseCommand):
+    help = "Render all ticket files of an event that are not cached yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('organizer_slug', type=str)
+        parser.add_argument('event_slug', type=str)
+        parser.add_argument('--provider', action='store', type=str, help='Only render files of this ticket output '
+                                                                         '(identifier)')
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        try:
+            event = Event.objects.select_related('organizer').get(
+                organizer__slug=options['organizer_slug'], slug=options['event_slug']
+            )
+        except Event.DoesNotExist:
+            self.stderr.write(self.style.ERROR('Event not found.'))
+            sys.exit(1)
+
+        orders = pregenerate_queryset(event).select_related('event').order_by('pk')
+        rendered = 0
+        for order in tqdm(orders.iterator(), total=orders.count()):
+            rendered += pregenerate(order, options.get('provider'))
+        self.stdout.write(self.style.SUCCESS(f'Done, {rendered} files rendered.'))
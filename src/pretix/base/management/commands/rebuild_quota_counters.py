@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django_scopes import scopes_disabled
+from tqdm import tqdm
+
+from pretix.base.models import Event
+from pretix.base.services.quotas import rebuild_position_counters
+
+
+class Command(BaseCommand):
+    help = "Build or repair the position counters used for quota calculation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organizer', action='store', type=str, help='Only process events of this organizer '
+                                                                          '(slug)')
+
+    @scopes_disabled()
+    def handle(self, *args, **options):
+        events = Event.objects.select_related('organizer').order_by('pk')
+        if options.get('organizer'):
+            events = events.filter(organizer__slug=options['organizer'])
+
+        repaired = 0
+        for e in tqdm(events, total=events.count()):
+            repaired += rebuild_position_counters(e)
+        self.stdout.write(self.style.SUCCESS(f'Done, {repaired} counters changed.'))
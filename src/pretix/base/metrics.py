@@ -1,8 +1,13 @@
+import atexit
 import json
+import logging
 import math
+import os
+import threading
 import time
 from collections import defaultdict
 
+from celery.signals import worker_process_shutdown
 from django.apps import apps
 from django.conf import settings
 from django.db import connection
@@ -14,10 +19,90 @@ if settings.HAS_REDIS:
     import django_redis
     redis = django_redis.get_redis_connection("redis")
 
+logger = logging.getLogger(__name__)
+
 REDIS_KEY = "pretix_metrics"
 _INF = float("inf")
 _MINUS_INF = float("-inf")
 
+# Values are collected in-process and written to redis in one pipeline every METRICS_FLUSH_INTERVAL seconds, by a
+# background thread so that values do not get stuck in processes that go idle
+_buffer_lock = threading.Lock()
+_buffer_increments = defaultdict(float)
+_buffer_values = {}
+_last_flush = time.monotonic()
+_flush_thread = None
+
+
+def flush():
+    """
+    Writes all metric values collected in this process to redis. If redis cannot be reached, the values are kept
+    for the next attempt.
+    """
+    global _last_flush
+    with _buffer_lock:
+        increments = dict(_buffer_increments)
+        values = dict(_buffer_values)
+        _buffer_increments.clear()
+        _buffer_values.clear()
+        _last_flush = time.monotonic()
+
+    if not settings.HAS_REDIS or not (increments or values):
+        return
+    try:
+        pipe = redis.pipeline()
+        for key, value in values.items():
+            pipe.hset(REDIS_KEY, key, value)
+        for key, amount in increments.items():
+            pipe.hincrbyfloat(REDIS_KEY, key, amount)
+        pipe.execute()
+    except Exception:
+        logger.exception('Could not write metrics to redis')
+        with _buffer_lock:
+            # Values that have been set in the meantime replace ours, increments are added up
+            for key, amount in increments.items():
+                if key not in _buffer_values:
+                    _buffer_increments[key] += amount
+            for key, value in values.items():
+                _buffer_values.setdefault(key, value)
+
+
+def flush_if_due():
+    if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        flush_if_due()
+
+
+def _ensure_flush_thread():
+    # Threads do not survive a fork, so we check on every value whether ours is still running
+    global _flush_thread
+    if _flush_thread is None or not _flush_thread.is_alive():
+        with _buffer_lock:
+            if _flush_thread is None or not _flush_thread.is_alive():
+                _flush_thread = threading.Thread(target=_flush_periodically, name='metrics-flush', daemon=True)
+                _flush_thread.start()
+
+
+def _clear_buffer():
+    # A forked process must not send the values collected by its parent again
+    _buffer_increments.clear()
+    _buffer_values.clear()
+
+
+@worker_process_shutdown.connect
+def _flush_on_worker_shutdown(**kwargs):
+    flush()
+
+
+atexit.register(flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_clear_buffer)
+
 
 def _float_to_go_string(d):
     # inspired by https://github.com/prometheus/client_python/blob/master/prometheus_client/core.py
@@ -71,31 +156,24 @@ class Metric(object):
 
             return metricname + "{" + ",".join(named_labels) + "}"
 
-    def _inc_in_redis(self, key, amount, pipeline=None):
+    def _inc_in_redis(self, key, amount):
         """
         Increments given key in Redis.
         """
         if settings.HAS_REDIS:
-            if not pipeline:
-                pipeline = redis
-            pipeline.hincrbyfloat(REDIS_KEY, key, amount)
+            _ensure_flush_thread()
+            with _buffer_lock:
+                _buffer_increments[key] += amount
 
-    def _set_in_redis(self, key, value, pipeline=None):
+    def _set_in_redis(self, key, value):
         """
         Sets given key in Redis.
         """
         if settings.HAS_REDIS:
-            if not pipeline:
-                pipeline = redis
-            pipeline.hset(REDIS_KEY, key, value)
-
-    def _get_redis_pipeline(self):
-        if settings.HAS_REDIS:
-            return redis.pipeline()
-
-    def _execute_redis_pipeline(self, pipeline):
-        if settings.HAS_REDIS:
-            return pipeline.execute()
+            _ensure_flush_thread()
+            with _buffer_lock:
+                _buffer_increments.pop(key, None)
+                _buffer_values[key] = value
 
 
 class Counter(Metric):
@@ -116,6 +194,7 @@ class Counter(Metric):
 
         fullmetric = self._construct_metric_identifier(self.name, kwargs)
         self._inc_in_redis(fullmetric, amount)
+        flush_if_due()
 
 
 class Gauge(Metric):
@@ -132,6 +211,7 @@ class Gauge(Metric):
 
         fullmetric = self._construct_metric_identifier(self.name, kwargs)
         self._set_in_redis(fullmetric, value)
+        flush_if_due()
 
     def inc(self, amount=1, **kwargs):
         """
@@ -144,6 +224,7 @@ class Gauge(Metric):
 
         fullmetric = self._construct_metric_identifier(self.name, kwargs)
         self._inc_in_redis(fullmetric, amount)
+        flush_if_due()
 
     def dec(self, amount=1, **kwargs):
         """
@@ -156,6 +237,7 @@ class Gauge(Metric):
 
         fullmetric = self._construct_metric_identifier(self.name, kwargs)
         self._inc_in_redis(fullmetric, amount * -1)
+        flush_if_due()
 
 
 class Histogram(Metric):
@@ -188,13 +270,11 @@ class Histogram(Metric):
 
         self._check_label_consistency(kwargs)
 
-        pipe = self._get_redis_pipeline()
-
         countmetric = self._construct_metric_identifier(self.name + '_count', kwargs)
-        self._inc_in_redis(countmetric, 1, pipeline=pipe)
+        self._inc_in_redis(countmetric, 1)
 
         summetric = self._construct_metric_identifier(self.name + '_sum', kwargs)
-        self._inc_in_redis(summetric, amount, pipeline=pipe)
+        self._inc_in_redis(summetric, amount)
 
         kwargs_le = dict(kwargs.items())
         for i, bound in enumerate(self.buckets):
@@ -202,9 +282,9 @@ class Histogram(Metric):
                 kwargs_le['le'] = _float_to_go_string(bound)
                 bmetric = self._construct_metric_identifier(self.name + '_bucket', kwargs_le,
                                                             labelnames=self.labelnames + ["le"])
-                self._inc_in_redis(bmetric, 1, pipeline=pipe)
+                self._inc_in_redis(bmetric, 1)
 
-        self._execute_redis_pipeline(pipe)
+        flush_if_due()
 
 
 def estimate_count_fast(type):
@@ -228,6 +308,7 @@ def metric_values():
 
     # Metrics from redis
     if settings.HAS_REDIS:
+        flush()
         for key, value in redis.hscan_iter(REDIS_KEY):
             dkey = key.decode("utf-8")
             splitted = dkey.split("{", 2)
@@ -276,3 +357,29 @@ pretix_task_runs_total = Counter("pretix_task_runs_total", "Total calls to a cel
                                  ["task_name", "status"])
 pretix_task_duration_seconds = Histogram("pretix_task_duration_seconds", "Call time of a celery task",
                                          ["task_name"])
+pretix_lock_wait_seconds = Histogram("pretix_lock_wait_seconds", "Time spent waiting for a lock",
+                                     ["scope"])
+pretix_lock_hold_seconds = Histogram("pretix_lock_hold_seconds", "Time a lock has been held",
+                                     ["scope"])
+pretix_lock_timeouts_total = Counter("pretix_lock_timeouts_total", "Total lock acquisitions that timed out",
+                                     ["scope"])
+pretix_cache_requests_total = Counter("pretix_cache_requests_total", "Lookups in namespaced caches",
+                                      ["layer", "result"])
+
+_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, _INF)
+pretix_view_db_queries = Histogram("pretix_view_db_queries", "Database queries per view call",
+                                   ["url_name"], buckets=_COUNT_BUCKETS)
+pretix_view_db_seconds = Histogram("pretix_view_db_seconds", "Time spent in the database per view call",
+                                   ["url_name"])
+pretix_view_redis_calls = Histogram("pretix_view_redis_calls", "Redis calls per view call",
+                                    ["url_name"], buckets=_COUNT_BUCKETS)
+pretix_view_cache_requests_total = Counter("pretix_view_cache_requests_total", "Cache lookups in views",
+                                           ["url_name", "result"])
+pretix_task_db_queries = Histogram("pretix_task_db_queries", "Database queries per celery task call",
+                                   ["task_name"], buckets=_COUNT_BUCKETS)
+pretix_task_db_seconds = Histogram("pretix_task_db_seconds", "Time spent in the database per celery task call",
+                                   ["task_name"])
+pretix_task_redis_calls = Histogram("pretix_task_redis_calls", "Redis calls per celery task call",
+                                    ["task_name"], buckets=_COUNT_BUCKETS)
+pretix_task_cache_requests_total = Counter("pretix_task_cache_requests_total", "Cache lookups in celery tasks",
+                                           ["task_name", "result"])
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.14 on 2026-10-18 06:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0176_auto_20210205_1512'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderPositionCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('status', models.CharField(max_length=3)),
+                ('count', models.IntegerField(default=0)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='position_counters', to='pretixbase.Event')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='pretixbase.Item')),
+                ('subevent', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='pretixbase.SubEvent')),
+                ('variation', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='pretixbase.ItemVariation')),
+            ],
+        ),
+    ]
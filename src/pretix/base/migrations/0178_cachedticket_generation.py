@@ -0,0 +1,23 @@
+# Generated by Django 3.0.14 on 2026-10-18 07:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0177_orderpositioncounter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cachedcombinedticket',
+            name='generation',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cachedticket',
+            name='generation',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.0.14 on 2026-10-18 07:47
+
+import django.db.models.deletion
+from django.db import DatabaseError, migrations, models, transaction
+
+
+def create_trigram_index(app, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        # The extension is not available or we are not allowed to create it. The search still works, just slower.
+        return
+    for column in ('text', 'keys'):
+        schema_editor.execute(
+            'CREATE INDEX pretixbase_ordersearchindex_{0}_trgm ON pretixbase_ordersearchindex '
+            'USING gin ({0} gin_trgm_ops)'.format(column)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0178_cachedticket_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderSearchIndex',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_index', serialize=False, to='pretixbase.Order')),
+                ('text', models.TextField()),
+                ('keys', models.TextField(default='')),
+            ],
+        ),
+        migrations.RunPython(create_trigram_index, migrations.RunPython.noop),
+    ]
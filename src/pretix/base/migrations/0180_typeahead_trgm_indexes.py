@@ -0,0 +1,53 @@
+from django.db import DatabaseError, migrations, transaction
+
+# Columns searched with icontains by the typeahead views in the backend. Django compiles these lookups to
+# UPPER("column"::text) LIKE UPPER(%s), so we index exactly that expression.
+TYPEAHEAD_COLUMNS = [
+    ('pretixbase_event', 'name'),
+    ('pretixbase_event', 'slug'),
+    ('pretixbase_organizer', 'name'),
+    ('pretixbase_organizer', 'slug'),
+    ('pretixbase_subevent', 'name'),
+    ('pretixbase_subevent', 'location'),
+    ('pretixbase_quota', 'name'),
+    ('pretixbase_item', 'name'),
+    ('pretixbase_user', 'email'),
+    ('pretixbase_user', 'fullname'),
+    ('pretixbase_eventmetavalue', 'value'),
+    ('pretixbase_order', 'code'),
+    ('pretixbase_voucher', 'code'),
+]
+
+
+def create_trigram_indexes(app, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        # The extension is not available or we are not allowed to create it. The typeahead still works, just slower.
+        return
+    for table, column in TYPEAHEAD_COLUMNS:
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS {table}_{column}_upper_trgm ON {table} '
+            'USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'.format(table=table, column=column)
+        )
+
+
+def drop_trigram_indexes(app, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table, column in TYPEAHEAD_COLUMNS:
+        schema_editor.execute('DROP INDEX IF EXISTS {table}_{column}_upper_trgm'.format(table=table, column=column))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0179_ordersearchindex'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.0.14 on 2026-10-18 07:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_all_outdated(apps, schema_editor):
+    Event = apps.get_model('pretixbase', 'Event')
+    OutdatedSalesRollup = apps.get_model('pretixbase', 'OutdatedSalesRollup')
+    OutdatedSalesRollup.objects.bulk_create(
+        [OutdatedSalesRollup(event_id=pk, date=None) for pk in Event.objects.values_list('pk', flat=True)],
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0180_typeahead_trgm_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('status', models.CharField(max_length=190)),
+                ('date', models.DateField()),
+                ('count', models.IntegerField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=13)),
+                ('tax_value', models.DecimalField(decimal_places=2, max_digits=13)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.Event')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.Item')),
+                ('subevent', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.SubEvent')),
+                ('variation', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.ItemVariation')),
+            ],
+            options={
+                'index_together': {('event', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='OutdatedSalesRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('date', models.DateField(null=True)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.Event')),
+            ],
+            options={
+                'unique_together': {('event', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SalesRollupLock',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='pretixbase.Event')),
+            ],
+        ),
+        migrations.RunPython(mark_all_outdated, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_all_outdated(apps, schema_editor):
+    Event = apps.get_model('pretixbase', 'Event')
+    OutdatedSalesRollup = apps.get_model('pretixbase', 'OutdatedSalesRollup')
+    OutdatedSalesRollup.objects.bulk_create(
+        [OutdatedSalesRollup(event_id=pk, date=None) for pk in Event.objects.values_list('pk', flat=True)],
+        batch_size=500, ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pretixbase', '0181_salesrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticsRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('payment_date', models.DateField(null=True)),
+                ('orders', models.IntegerField()),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=13)),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.Event')),
+                ('subevent', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pretixbase.SubEvent')),
+            ],
+            options={
+                'index_together': {('event', 'date')},
+            },
+        ),
+        migrations.RunPython(mark_all_outdated, migrations.RunPython.noop),
+    ]
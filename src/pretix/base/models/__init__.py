@@ -18,14 +18,19 @@ from .log import LogEntry
 from .notifications import NotificationSetting
 from .orders import (
     AbstractPosition, CachedCombinedTicket, CachedTicket, CartPosition,
-    InvoiceAddress, Order, OrderFee, OrderPayment, OrderPosition, OrderRefund,
-    QuestionAnswer, RevokedTicketSecret, cachedcombinedticket_name,
-    cachedticket_name, generate_position_secret, generate_secret,
+    InvoiceAddress, Order, OrderFee, OrderPayment, OrderPosition,
+    OrderPositionCounter, OrderRefund, QuestionAnswer, RevokedTicketSecret,
+    cachedcombinedticket_name, cachedticket_name, generate_position_secret,
+    generate_secret,
 )
 from .organizer import (
     Organizer, Organizer_SettingsStore, Team, TeamAPIToken, TeamInvite,
 )
+from .search import OrderSearchIndex
 from .seating import Seat, SeatCategoryMapping, SeatingPlan
+from .stats import (
+    OutdatedSalesRollup, SalesRollup, SalesRollupLock, StatisticsRollup,
+)
 from .tax import TaxRule
 from .vouchers import Voucher
 from .waitinglist import WaitingListEntry
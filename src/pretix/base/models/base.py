@@ -1,8 +1,11 @@
 import json
+import threading
 import uuid
+from contextlib import contextmanager
+from functools import partial
 
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import connection, models, transaction
 from django.db.models.constants import LOOKUP_SEP
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
@@ -39,6 +42,92 @@ def cached_file_delete(sender, instance, **kwargs):
         instance.file.delete(False)
 
 
+LOG_BATCH_SIZE = 1000
+_log_batch = threading.local()
+
+
+def _dispatch_logentries(logentries):
+    from pretix.api.webhooks import notify_webhooks
+
+    from ..services.notifications import notify
+
+    notification_ids = [le.pk for le in logentries if le.notification_type]
+    webhook_ids = [le.pk for le in logentries if le.webhook_type]
+    if len(notification_ids) == 1:
+        notify.apply_async(args=(notification_ids[0],))
+    elif notification_ids:
+        notify.apply_async(args=(notification_ids,))
+    if len(webhook_ids) == 1:
+        notify_webhooks.apply_async(args=(webhook_ids[0],))
+    elif webhook_ids:
+        notify_webhooks.apply_async(args=(webhook_ids,))
+
+
+def _flush_log_batch():
+    from .log import LogEntry
+
+    entries, _log_batch.entries = _log_batch.entries, []
+    saved, _log_batch.saved = _log_batch.saved, []
+    if entries:
+        if connection.features.can_return_rows_from_bulk_insert:
+            LogEntry.objects.bulk_create(entries)
+        else:
+            # We need the IDs to send notifications
+            for e in entries:
+                e.save()
+    if entries or saved:
+        _dispatch_logentries(sorted(saved + entries, key=lambda e: e.pk))
+
+
+def _add_to_log_batch(logentry, saved=False):
+    if getattr(_log_batch, 'entries', None) is None:
+        if not saved:
+            logentry.save()
+        _dispatch_logentries([logentry])
+        return
+    if saved:
+        _log_batch.saved.append(logentry)
+    else:
+        _log_batch.entries.append(logentry)
+    if len(_log_batch.entries) + len(_log_batch.saved) >= LOG_BATCH_SIZE:
+        _flush_log_batch()
+
+
+@contextmanager
+def log_batch():
+    """
+    Collects the log entries created with :py:meth:`LoggingMixin.log_action` while this context is active and
+    writes them with one query per ``LOG_BATCH_SIZE`` entries, at the latest when the context exits. Notifications
+    and webhooks for all entries of a batch are then sent by one task each, instead of two tasks per entry. Nesting
+    this context has no additional effect.
+
+    Log entries returned by ``log_action`` inside this context have usually not been saved yet. If the context is
+    left with an exception inside a transaction, the collected entries are discarded together with the transaction.
+    If the context is entered outside of a transaction, entries logged inside a transaction are still saved right
+    away, so that they are committed together with the change they record, and only their notifications and
+    webhooks wait for the batch. Entries of transactions that are rolled back are dropped, so the context can wrap
+    a series of transactions that might roll back. Keep such a context short, e.g. one per order, since
+    notifications are lost if the process ends before the context exits.
+    """
+    if getattr(_log_batch, 'entries', None) is not None:
+        yield
+        return
+    _log_batch.entries = []
+    _log_batch.saved = []
+    _log_batch.in_transaction = connection.in_atomic_block
+    try:
+        yield
+    except BaseException:
+        if not connection.in_atomic_block:
+            _flush_log_batch()
+        raise
+    else:
+        _flush_log_batch()
+    finally:
+        _log_batch.entries = None
+        _log_batch.saved = None
+
+
 class LoggingMixin:
 
     def log_action(self, action, data=None, user=None, api_token=None, auth=None, save=True):
@@ -51,9 +140,7 @@ class LoggingMixin:
         :param user: The user performing the action (optional)
         """
         from pretix.api.models import OAuthAccessToken, OAuthApplication
-        from pretix.api.webhooks import notify_webhooks
 
-        from ..services.notifications import notify
         from .devices import Device
         from .event import Event
         from .log import LogEntry
@@ -91,13 +178,16 @@ class LoggingMixin:
             logentry.data = json.dumps(data, cls=CustomJSONEncoder, sort_keys=True)
         elif data:
             raise TypeError("You should only supply dictionaries as log data.")
-        if save:
+        if save and getattr(_log_batch, 'entries', None) is not None:
+            if connection.in_atomic_block and not _log_batch.in_transaction:
+                logentry.save()
+                # Dropped by Django if the transaction is rolled back
+                transaction.on_commit(partial(_add_to_log_batch, logentry, saved=True))
+            else:
+                _add_to_log_batch(logentry)
+        elif save:
             logentry.save()
-
-            if logentry.notification_type:
-                notify.apply_async(args=(logentry.pk,))
-            if logentry.webhook_type:
-                notify_webhooks.apply_async(args=(logentry.pk,))
+            _dispatch_logentries([logentry])
 
         return logentry
 
@@ -13,7 +13,7 @@ from django.core.mail import get_connection
 from django.core.validators import (
     MaxValueValidator, MinLengthValidator, MinValueValidator, RegexValidator,
 )
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Exists, OuterRef, Prefetch, Q, Subquery, Value
 from django.template.defaultfilters import date as _date
 from django.urls import reverse
@@ -534,13 +534,16 @@ class Event(EventMixin, LoggedModel):
 
         return ObjectRelatedCache(self)
 
-    def lock(self):
+    def lock(self, quotas=None, seats=None, vouchers=None):
         """
         Returns a contextmanager that can be used to lock an event for bookings.
+
+        If you pass a list of ``quotas`` (and optionally ``seats`` and ``vouchers``) and fine-grained
+        locking is enabled, only these objects will be locked instead of the whole event.
         """
         from pretix.base.services import locking
 
-        return locking.LockManager(self)
+        return locking.LockManager(self, quotas=quotas, seats=seats, vouchers=vouchers)
 
     def get_mail_backend(self, timeout=None, force_custom=False):
         """
@@ -1255,6 +1258,8 @@ class SubEvent(EventMixin, LoggedModel):
         self.__original_dates = (self.date_from, self.date_to)
 
     def save(self, *args, **kwargs):
+        from pretix.api.changes import record_changes
+
         from .orders import Order
 
         clear_cache = kwargs.pop('clear_cache', False)
@@ -1270,7 +1275,10 @@ class SubEvent(EventMixin, LoggedModel):
             the app needs to know when a subevent is moved to a date in the future, since that
             might require it to re-download and re-store the orders.
             """
-            Order.objects.filter(all_positions__subevent=self).update(last_modified=now())
+            orders = Order.objects.filter(all_positions__subevent=self)
+            with transaction.atomic():
+                orders.update(last_modified=now())
+                record_changes((self.event_id, 'order', c) for c in orders.values_list('code', flat=True).distinct())
 
     @staticmethod
     def clean_items(event, items):
@@ -193,6 +193,7 @@ class Invoice(models.Model):
     def save(self, *args, **kwargs):
         if not self.order:
             raise ValueError('Every invoice needs to be connected to an order')
+        self.order.touch()
         if not self.event:
             self.event = self.order.event
         if not self.organizer:
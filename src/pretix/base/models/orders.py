@@ -14,10 +14,10 @@ import pytz
 from django.conf import settings
 from django.db import models, transaction
 from django.db.models import (
-    Case, Exists, F, Max, OuterRef, Q, Subquery, Sum, Value, When,
+    Case, Count, Exists, F, Max, OuterRef, Q, Subquery, Sum, Value, When,
 )
 from django.db.models.functions import Coalesce, Greatest
-from django.db.models.signals import post_delete
+from django.db.models.signals import post_delete, pre_delete
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.crypto import get_random_string
@@ -214,6 +214,8 @@ class Order(LockModel, LoggedModel):
         return self.full_code
 
     def gracefully_delete(self, user=None, auth=None):
+        from pretix.api.changes import record_objects
+
         from . import GiftCard, GiftCardTransaction, Voucher
 
         if not self.testmode:
@@ -231,6 +233,7 @@ class Order(LockModel, LoggedModel):
             for position in self.positions.all():
                 if position.voucher:
                     Voucher.objects.filter(pk=position.voucher.pk).update(redeemed=Greatest(0, F('redeemed') - 1))
+                    record_objects([position.voucher])
 
         GiftCardTransaction.objects.filter(payment__in=self.payments.all()).update(payment=None)
         GiftCardTransaction.objects.filter(refund__in=self.refunds.all()).update(refund=None)
@@ -392,7 +395,14 @@ class Order(LockModel, LoggedModel):
             self.datetime = now()
         if not self.expires:
             self.set_expires()
+        track_counters = settings.PRETIX_QUOTA_COUNTERS and self.pk and (
+            'update_fields' not in kwargs or 'status' in kwargs['update_fields']
+        )
+        if track_counters:
+            old_status = Order._base_manager.filter(pk=self.pk).values_list('status', flat=True).first()
         super().save(**kwargs)
+        if track_counters and old_status != self.status:
+            OrderPositionCounter.order_status_changed(self, old_status)
 
     def touch(self):
         self.save(update_fields=['last_modified'])
@@ -1600,6 +1610,7 @@ class OrderPayment(models.Model):
     def save(self, *args, **kwargs):
         if not self.local_id:
             self.local_id = (self.order.payments.aggregate(m=Max('local_id'))['m'] or 0) + 1
+        self.order.touch()
         super().save(*args, **kwargs)
 
     def create_external_refund(self, amount=None, execution_date=None, info='{}'):
@@ -1798,6 +1809,7 @@ class OrderRefund(models.Model):
     def save(self, *args, **kwargs):
         if not self.local_id:
             self.local_id = (self.order.refunds.aggregate(m=Max('local_id'))['m'] or 0) + 1
+        self.order.touch()
         super().save(*args, **kwargs)
 
 
@@ -2008,6 +2020,8 @@ class OrderPosition(AbstractPosition):
 
     @classmethod
     def transform_cart_positions(cls, cp: List, order) -> list:
+        from pretix.api.changes import record_objects
+
         from . import Voucher
 
         ops = []
@@ -2030,6 +2044,7 @@ class OrderPosition(AbstractPosition):
                 answ.save()
             if cartpos.voucher:
                 Voucher.objects.filter(pk=cartpos.voucher.pk).update(redeemed=F('redeemed') + 1)
+                record_objects([cartpos.voucher])
                 cartpos.voucher.log_action('pretix.voucher.redeemed', {
                     'order_code': order.code
                 })
@@ -2088,7 +2103,16 @@ class OrderPosition(AbstractPosition):
         if not self.pseudonymization_id:
             self.assign_pseudonymization_id()
 
-        return super().save(*args, **kwargs)
+        track_counters = settings.PRETIX_QUOTA_COUNTERS and (
+            'update_fields' not in kwargs or
+            set(kwargs['update_fields']) & {'order', 'item', 'variation', 'subevent', 'canceled'}
+        )
+        if track_counters:
+            old_key = OrderPositionCounter.position_key(self.pk) if self.pk else None
+        ret = super().save(*args, **kwargs)
+        if track_counters:
+            OrderPositionCounter.position_changed(old_key, OrderPositionCounter.position_key(self.pk))
+        return ret
 
     @scopes_disabled()
     def assign_pseudonymization_id(self):
@@ -2178,6 +2202,99 @@ class OrderPosition(AbstractPosition):
             )
 
 
+class OrderPositionCounter(models.Model):
+    """
+    Keeps the number of non-canceled order positions per product, variation, event date and order
+    status for all paid and pending orders. This allows to compute quota availability without
+    aggregating over all positions sold within a quota, which becomes slow for very large quotas.
+
+    Counters are only maintained if ``PRETIX_QUOTA_COUNTERS`` is enabled. They are adjusted by the
+    difference whenever an order changes its status or a position is created, changed or deleted
+    and are regularly compared against the actual order positions and repaired if necessary, see
+    :py:func:`pretix.base.services.quotas.rebuild_position_counters`.
+
+    There is no uniqueness constraint on the counted combination, as we do not want concurrent
+    transactions to fail when creating the first counter of a combination. If multiple rows exist
+    for the same combination, the sum of all of them is the correct value.
+    """
+    COUNTED_STATUSES = (Order.STATUS_PAID, Order.STATUS_PENDING)
+
+    event = models.ForeignKey(
+        Event,
+        related_name='position_counters',
+        on_delete=models.CASCADE
+    )
+    subevent = models.ForeignKey(
+        SubEvent,
+        null=True, blank=True,
+        on_delete=models.CASCADE
+    )
+    item = models.ForeignKey(
+        Item,
+        on_delete=models.CASCADE
+    )
+    variation = models.ForeignKey(
+        ItemVariation,
+        null=True, blank=True,
+        on_delete=models.CASCADE
+    )
+    status = models.CharField(
+        max_length=3,
+        choices=Order.STATUS_CHOICE,
+    )
+    count = models.IntegerField(default=0)
+
+    @classmethod
+    def apply_delta(cls, event_id, subevent_id, item_id, variation_id, status, delta):
+        if not delta or status not in cls.COUNTED_STATUSES:
+            return
+        pk = cls.objects.filter(
+            event_id=event_id, subevent_id=subevent_id, item_id=item_id, variation_id=variation_id, status=status
+        ).order_by('pk').values_list('pk', flat=True).first()
+        if pk:
+            cls.objects.filter(pk=pk).update(count=F('count') + delta)
+        else:
+            cls.objects.create(
+                event_id=event_id, subevent_id=subevent_id, item_id=item_id, variation_id=variation_id,
+                status=status, count=delta
+            )
+
+    @classmethod
+    def position_key(cls, pk):
+        """
+        Returns the combination a position with the given ID is currently counted towards, based on the
+        data currently stored in the database, or ``None`` if it is not counted at all.
+        """
+        row = OrderPosition._base_manager.filter(pk=pk).values(
+            'order__event_id', 'order__status', 'subevent_id', 'item_id', 'variation_id', 'canceled'
+        ).first()
+        if not row or row['canceled'] or row['order__status'] not in cls.COUNTED_STATUSES:
+            return None
+        return row['order__event_id'], row['subevent_id'], row['item_id'], row['variation_id'], row['order__status']
+
+    @classmethod
+    def position_changed(cls, old_key, new_key):
+        if old_key == new_key:
+            return
+        if old_key:
+            cls.apply_delta(*old_key, delta=-1)
+        if new_key:
+            cls.apply_delta(*new_key, delta=1)
+
+    @classmethod
+    def order_status_changed(cls, order, old_status):
+        if old_status not in cls.COUNTED_STATUSES and order.status not in cls.COUNTED_STATUSES:
+            return
+        lines = OrderPosition._base_manager.filter(order_id=order.pk, canceled=False).order_by().values(
+            'subevent_id', 'item_id', 'variation_id'
+        ).annotate(c=Count('*'))
+        for line in lines:
+            cls.apply_delta(order.event_id, line['subevent_id'], line['item_id'], line['variation_id'], old_status,
+                            -line['c'])
+            cls.apply_delta(order.event_id, line['subevent_id'], line['item_id'], line['variation_id'], order.status,
+                            line['c'])
+
+
 class CartPosition(AbstractPosition):
     """
     A cart position is similar to an order line, except that it is not
@@ -2346,6 +2463,14 @@ def cachedcombinedticket_name(instance, filename: str) -> str:
     )
 
 
+class CachedTicketQuerySet(models.QuerySet):
+    def current(self, event):
+        """
+        Only returns files that have been rendered since the tickets of ``event`` have last been invalidated.
+        """
+        return self.filter(generation=event.settings.ticket_cache_generation)
+
+
 class CachedTicket(models.Model):
     order_position = models.ForeignKey(OrderPosition, on_delete=models.CASCADE)
     provider = models.CharField(max_length=255)
@@ -2353,6 +2478,9 @@ class CachedTicket(models.Model):
     extension = models.CharField(max_length=255)
     file = models.FileField(null=True, blank=True, upload_to=cachedticket_name, max_length=255)
     created = models.DateTimeField(auto_now_add=True)
+    generation = models.IntegerField(default=0)
+
+    objects = CachedTicketQuerySet.as_manager()
 
 
 class CachedCombinedTicket(models.Model):
@@ -2362,6 +2490,9 @@ class CachedCombinedTicket(models.Model):
     extension = models.CharField(max_length=255)
     file = models.FileField(null=True, blank=True, upload_to=cachedcombinedticket_name, max_length=255)
     created = models.DateTimeField(auto_now_add=True)
+    generation = models.IntegerField(default=0)
+
+    objects = CachedTicketQuerySet.as_manager()
 
 
 class CancellationRequest(models.Model):
@@ -2397,6 +2528,12 @@ def cachedcombinedticket_delete(sender, instance, **kwargs):
         instance.file.delete(False)
 
 
+@receiver(pre_delete, sender=OrderPosition)
+def orderposition_delete(sender, instance, **kwargs):
+    if settings.PRETIX_QUOTA_COUNTERS and instance.pk:
+        OrderPositionCounter.position_changed(OrderPositionCounter.position_key(instance.pk), None)
+
+
 @receiver(post_delete, sender=QuestionAnswer)
 def answer_delete(sender, instance, **kwargs):
     if instance.file:
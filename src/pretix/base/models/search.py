@@ -0,0 +1,19 @@
+from django.db import models
+
+
+class OrderSearchIndex(models.Model):
+    """
+    A lowercased copy of all the text an order can be found by in the order search, so that the search only
+    needs to look at one table instead of joining five. ``text`` contains everything that is matched as a
+    substring, i.e. the email address, comment and invoice address of the order and the names, email addresses
+    and voucher codes of its positions. ``keys`` contains everything that is matched from its start or as a
+    whole, i.e. the secrets and pseudonymization IDs of the positions and the invoice numbers, one per line
+    and prefixed by their kind. The order code is not part of the index, it is searched in the order table.
+    On PostgreSQL, both columns have a trigram index if the ``pg_trgm`` extension is available, which makes
+    substring searches fast.
+
+    Entries are kept up to date by :py:mod:`pretix.base.services.search`.
+    """
+    order = models.OneToOneField('Order', primary_key=True, related_name='search_index', on_delete=models.CASCADE)
+    text = models.TextField()
+    keys = models.TextField(default='')
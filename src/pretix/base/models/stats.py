@@ -0,0 +1,68 @@
+from django.db import models
+
+
+class SalesRollup(models.Model):
+    """
+    The number, gross and tax value of all order positions of an event with the same date, product, variation
+    and status, where the date is the day the order was placed in the event's timezone and the status is the
+    status of the order, ``"canceled_position"`` for canceled positions or ``"unapproved"`` for pending orders
+    that still require approval. Canceled positions are kept apart from the positions of canceled orders, which
+    are not canceled themselves. This is what the order overview and the dashboard show, so they do not need to
+    look at every single order position.
+
+    Rows are kept up to date by :py:mod:`pretix.base.services.stats`.
+    """
+    STATUS_CANCELED_POSITION = 'canceled_position'
+
+    event = models.ForeignKey('Event', on_delete=models.CASCADE, related_name='+')
+    subevent = models.ForeignKey('SubEvent', null=True, on_delete=models.CASCADE, related_name='+')
+    item = models.ForeignKey('Item', on_delete=models.CASCADE, related_name='+')
+    variation = models.ForeignKey('ItemVariation', null=True, on_delete=models.CASCADE, related_name='+')
+    status = models.CharField(max_length=190)
+    date = models.DateField()
+    count = models.IntegerField()
+    price = models.DecimalField(max_digits=13, decimal_places=2)
+    tax_value = models.DecimalField(max_digits=13, decimal_places=2)
+
+    class Meta:
+        index_together = (('event', 'date'),)
+
+
+class OutdatedSalesRollup(models.Model):
+    """
+    Marks the :py:class:`SalesRollup` and :py:class:`StatisticsRollup` rows of one day of an event, or of
+    the whole event if ``date`` is ``None``, as outdated because an order has changed.
+    """
+    event = models.ForeignKey('Event', on_delete=models.CASCADE, related_name='+')
+    date = models.DateField(null=True)
+
+    class Meta:
+        unique_together = (('event', 'date'),)
+
+
+class SalesRollupLock(models.Model):
+    """
+    One row per event that refreshes of the event's rollups lock to run one at a time. Nothing references this
+    table, so unlike a lock on the event itself, it does not block orders from being placed meanwhile.
+    """
+    event = models.OneToOneField('Event', primary_key=True, on_delete=models.CASCADE, related_name='+')
+
+
+class StatisticsRollup(models.Model):
+    """
+    The number of orders of an event placed on ``date`` whose latest payment was made on ``payment_date``,
+    and the revenue of those that are paid, for the charts of the statistics plugin. Rows with a ``subevent``
+    only count orders with a position in that date and only the revenue of those positions, rows without a
+    ``subevent`` count all orders of the event and their full total. Both dates are in the event's timezone.
+
+    Rows are kept up to date by :py:mod:`pretix.base.services.stats` together with :py:class:`SalesRollup`.
+    """
+    event = models.ForeignKey('Event', on_delete=models.CASCADE, related_name='+')
+    subevent = models.ForeignKey('SubEvent', null=True, on_delete=models.CASCADE, related_name='+')
+    date = models.DateField()
+    payment_date = models.DateField(null=True)
+    orders = models.IntegerField()
+    revenue = models.DecimalField(max_digits=13, decimal_places=2)
+
+    class Meta:
+        index_together = (('event', 'date'),)
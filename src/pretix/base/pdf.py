@@ -6,8 +6,9 @@ import os
 import subprocess
 import tempfile
 import uuid
+import zlib
 from collections import OrderedDict
-from functools import partial
+from functools import lru_cache, partial
 from io import BytesIO
 
 from arabic_reshaper import ArabicReshaper
@@ -16,10 +17,15 @@ from django.conf import settings
 from django.contrib.staticfiles import finders
 from django.dispatch import receiver
 from django.utils.formats import date_format
+from django.utils.functional import cached_property
 from django.utils.html import conditional_escape
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from PyPDF2 import PdfFileReader
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, EncodedStreamObject,
+    IndirectObject, NameObject, NullObject, StreamObject,
+)
 from pytz import timezone
 from reportlab.graphics import renderPDF
 from reportlab.graphics.barcode.qr import QrCodeWidget
@@ -479,6 +485,97 @@ def get_variables(event):
     return v
 
 
+class Background:
+    """
+    The first page of a background file, prepared to be placed below other pages as a form XObject. The
+    file is only parsed once, and every document references the background only once, no matter how many
+    pages it has.
+    """
+    name = NameObject('/PretixBackground')
+
+    def __init__(self, bg_bytes):
+        page = PdfFileReader(BytesIO(bg_bytes), strict=False).getPage(0)
+        self.width = page.mediaBox[2]
+        self.height = page.mediaBox[3]
+        self.bbox = page.mediaBox
+        self.resources = page.raw_get('/Resources') if '/Resources' in page else DictionaryObject()
+        contents = page['/Contents'] if '/Contents' in page else None
+        if contents is None:
+            data = b''
+        elif isinstance(contents, ArrayObject):
+            data = b'\n'.join(c.getObject().getData() for c in contents)
+        else:
+            data = contents.getData()
+        self.content = zlib.compress(data)
+
+    def _copy(self, writer, obj, refs):
+        # PdfFileWriter rewrites the references of objects from other files in place when it writes a document,
+        # so every document gets its own copy of the resources instead of the objects of the parsed file
+        if isinstance(obj, IndirectObject):
+            key = (obj.idnum, obj.generation)
+            if key not in refs:
+                refs[key] = writer._addObject(NullObject())
+                writer._objects[refs[key].idnum - 1] = self._copy(writer, obj.getObject(), refs)
+            return refs[key]
+        elif isinstance(obj, StreamObject):
+            copied = obj.__class__()
+            copied._data = obj._data
+        elif isinstance(obj, DictionaryObject):
+            copied = DictionaryObject()
+        elif isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(writer, v, refs) for v in obj)
+        else:
+            return obj
+        copied.update({k: self._copy(writer, v, refs) for k, v in obj.items()})
+        return copied
+
+    def add_to(self, writer):
+        """
+        Adds the background to a ``PdfFileWriter``. Returns a function that places it below a page.
+        """
+        xobject = EncodedStreamObject()
+        xobject._data = self.content
+        xobject.update({
+            NameObject('/Type'): NameObject('/XObject'),
+            NameObject('/Subtype'): NameObject('/Form'),
+            NameObject('/Filter'): NameObject('/FlateDecode'),
+            NameObject('/BBox'): ArrayObject(self.bbox),
+            NameObject('/Resources'): self._copy(writer, self.resources, {}),
+        })
+        xobject_ref = writer._addObject(xobject)
+        draw = DecodedStreamObject()
+        draw.setData(b'q ' + self.name.encode() + b' Do Q\n')
+        draw_ref = writer._addObject(draw)
+
+        def stamp(page):
+            resources = page['/Resources'] if '/Resources' in page else None
+            if resources is None:
+                resources = DictionaryObject()
+                page[NameObject('/Resources')] = resources
+            xobjects = resources['/XObject'] if '/XObject' in resources else None
+            if xobjects is None:
+                xobjects = DictionaryObject()
+                resources[NameObject('/XObject')] = xobjects
+            xobjects[self.name] = xobject_ref
+
+            contents = page['/Contents'] if '/Contents' in page else None
+            if isinstance(contents, ArrayObject):
+                contents = list(contents)
+            elif contents is not None:
+                contents = [page.raw_get('/Contents')]
+            else:
+                contents = []
+            page[NameObject('/Contents')] = ArrayObject([draw_ref] + contents)
+            return page
+
+        return stamp
+
+
+@lru_cache(maxsize=32)
+def get_background(bg_bytes: bytes) -> Background:
+    return Background(bg_bytes)
+
+
 class Renderer:
 
     def __init__(self, event, layout, background_file):
@@ -489,10 +586,16 @@ class Renderer:
         self.event = event
         if self.background_file:
             self.bg_bytes = self.background_file.read()
-            self.bg_pdf = PdfFileReader(BytesIO(self.bg_bytes), strict=False)
+            self.background = get_background(self.bg_bytes)
         else:
             self.bg_bytes = None
-            self.bg_pdf = None
+            self.background = None
+
+    @cached_property
+    def bg_pdf(self):
+        if not self.bg_bytes:
+            return None
+        return PdfFileReader(BytesIO(self.bg_bytes), strict=False)
 
     @classmethod
     def _register_fonts(cls):
@@ -678,8 +781,8 @@ class Renderer:
                 self._draw_textarea(canvas, op, order, o)
             elif o['type'] == "poweredby":
                 self._draw_poweredby(canvas, op, o)
-            if self.bg_pdf:
-                canvas.setPageSize((self.bg_pdf.getPage(0).mediaBox[2], self.bg_pdf.getPage(0).mediaBox[3]))
+            if self.background:
+                canvas.setPageSize((self.background.width, self.background.height))
         if show_page:
             canvas.showPage()
 
@@ -707,11 +810,10 @@ class Renderer:
             buffer.seek(0)
             new_pdf = PdfFileReader(buffer)
             output = PdfFileWriter()
+            stamp = self.background.add_to(output) if self.background else None
 
             for page in new_pdf.pages:
-                bg_page = copy.copy(self.bg_pdf.getPage(0))
-                bg_page.mergePage(page)
-                output.addPage(bg_page)
+                output.addPage(stamp(page) if stamp else page)
 
             output.addMetadata({
                 '/Title': str(title),
@@ -13,6 +13,7 @@ from pretix.base.models import (
     Event, InvoiceAddress, Order, OrderFee, OrderPosition, OrderRefund,
     SubEvent, User, WaitingListEntry,
 )
+from pretix.base.models.base import log_batch
 from pretix.base.services.locking import LockTimeoutException
 from pretix.base.services.mail import SendMailException, TolerantDict, mail
 from pretix.base.services.orders import (
@@ -132,29 +133,31 @@ def cancel_event(self, event: Event, subevent: int, auto_refund: bool,
             has_subevent=True, has_other_subevent=False
         )
 
-        for se in subevents:
-            se.log_action(
-                'pretix.subevent.canceled', user=user,
-            )
-            se.active = False
-            se.save(update_fields=['active'])
-            se.log_action(
-                'pretix.subevent.changed', user=user, data={'active': False, '_source': 'cancel_event'}
-            )
+        with log_batch():
+            for se in subevents:
+                se.log_action(
+                    'pretix.subevent.canceled', user=user,
+                )
+                se.active = False
+                se.save(update_fields=['active'])
+                se.log_action(
+                    'pretix.subevent.changed', user=user, data={'active': False, '_source': 'cancel_event'}
+                )
     else:
         subevents = None
         subevent_ids = set()
         orders_to_change = event.orders.none()
-        event.log_action(
-            'pretix.event.canceled', user=user,
-        )
-
-        for i in event.items.filter(active=True):
-            i.active = False
-            i.save(update_fields=['active'])
-            i.log_action(
-                'pretix.event.item.changed', user=user, data={'active': False, '_source': 'cancel_event'}
+        with log_batch():
+            event.log_action(
+                'pretix.event.canceled', user=user,
             )
+
+            for i in event.items.filter(active=True):
+                i.active = False
+                i.save(update_fields=['active'])
+                i.log_action(
+                    'pretix.event.item.changed', user=user, data={'active': False, '_source': 'cancel_event'}
+                )
     failed = 0
     total = orders_to_cancel.count() + orders_to_change.count()
     qs_wl = event.waitinglistentries.filter(voucher__isnull=True).select_related('subevent')
@@ -169,54 +172,57 @@ def cancel_event(self, event: Event, subevent: int, auto_refund: bool,
     )
 
     for o in orders_to_cancel.only('id', 'total').iterator():
-        try:
-            fee = Decimal('0.00')
-            fee_sum = Decimal('0.00')
-            keep_fee_objects = []
-            if keep_fees:
-                for f in o.fees.all():
-                    if f.fee_type in keep_fees:
-                        fee += f.value
-                        keep_fee_objects.append(f)
-                    fee_sum += f.value
-            if keep_fee_percentage:
-                fee += Decimal(keep_fee_percentage) / Decimal('100.00') * (o.total - fee_sum)
-            if keep_fee_fixed:
-                fee += Decimal(keep_fee_fixed)
-            if keep_fee_per_ticket:
-                for p in o.positions.all():
-                    if p.addon_to_id is None:
-                        fee += min(p.price, Decimal(keep_fee_per_ticket))
-            fee = round_decimal(min(fee, o.payment_refund_sum), event.currency)
+        # Collects the log entries of the cancellation, the refund and the emails of every order. Entries are
+        # written in the transaction they record, their notifications are sent once the order is done.
+        with log_batch():
+            try:
+                fee = Decimal('0.00')
+                fee_sum = Decimal('0.00')
+                keep_fee_objects = []
+                if keep_fees:
+                    for f in o.fees.all():
+                        if f.fee_type in keep_fees:
+                            fee += f.value
+                            keep_fee_objects.append(f)
+                        fee_sum += f.value
+                if keep_fee_percentage:
+                    fee += Decimal(keep_fee_percentage) / Decimal('100.00') * (o.total - fee_sum)
+                if keep_fee_fixed:
+                    fee += Decimal(keep_fee_fixed)
+                if keep_fee_per_ticket:
+                    for p in o.positions.all():
+                        if p.addon_to_id is None:
+                            fee += min(p.price, Decimal(keep_fee_per_ticket))
+                fee = round_decimal(min(fee, o.payment_refund_sum), event.currency)
 
-            _cancel_order(o.pk, user, send_mail=False, cancellation_fee=fee, keep_fees=keep_fee_objects)
-            refund_amount = o.payment_refund_sum
+                _cancel_order(o.pk, user, send_mail=False, cancellation_fee=fee, keep_fees=keep_fee_objects)
+                refund_amount = o.payment_refund_sum
 
-            try:
-                if auto_refund:
-                    _try_auto_refund(o.pk, manual_refund=manual_refund, allow_partial=True,
-                                     source=OrderRefund.REFUND_SOURCE_ADMIN, refund_as_giftcard=refund_as_giftcard,
-                                     giftcard_expires=giftcard_expires, giftcard_conditions=giftcard_conditions,
-                                     comment=gettext('Event canceled'))
-            finally:
-                if send:
-                    _send_mail(o, send_subject, send_message, subevent, refund_amount, user, o.positions.all())
+                try:
+                    if auto_refund:
+                        _try_auto_refund(o.pk, manual_refund=manual_refund, allow_partial=True,
+                                         source=OrderRefund.REFUND_SOURCE_ADMIN, refund_as_giftcard=refund_as_giftcard,
+                                         giftcard_expires=giftcard_expires, giftcard_conditions=giftcard_conditions,
+                                         comment=gettext('Event canceled'))
+                finally:
+                    if send:
+                        _send_mail(o, send_subject, send_message, subevent, refund_amount, user, o.positions.all())
 
-            counter += 1
-            if not self.request.called_directly and counter % max(10, total // 100) == 0:
-                self.update_state(
-                    state='PROGRESS',
-                    meta={'value': round(counter / total * 100, 2)}
-                )
-        except LockTimeoutException:
-            logger.exception("Could not cancel order")
-            failed += 1
-        except OrderError:
-            logger.exception("Could not cancel order")
-            failed += 1
+                counter += 1
+                if not self.request.called_directly and counter % max(10, total // 100) == 0:
+                    self.update_state(
+                        state='PROGRESS',
+                        meta={'value': round(counter / total * 100, 2)}
+                    )
+            except LockTimeoutException:
+                logger.exception("Could not cancel order")
+                failed += 1
+            except OrderError:
+                logger.exception("Could not cancel order")
+                failed += 1
 
     for o in orders_to_change.values_list('id', flat=True).iterator():
-        with transaction.atomic():
+        with log_batch(), transaction.atomic():
             o = event.orders.select_for_update().get(pk=o)
             total = Decimal('0.00')
             fee = Decimal('0.00')
@@ -1,6 +1,7 @@
 from collections import Counter, defaultdict, namedtuple
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from functools import partial
 from typing import List, Optional
 
 from celery.exceptions import MaxRetriesExceededError
@@ -1042,7 +1043,12 @@ class CartManager:
 
         lockfn = NoLockManager
         if self._require_locking():
-            lockfn = self.event.lock
+            lockfn = partial(
+                self.event.lock,
+                quotas=[q for q, d in self._quota_diff.items() if d > 0],
+                seats=[o.seat for o in self._operations if getattr(o, 'seat', None)],
+                vouchers=[v for v, d in self._voucher_use_diff.items() if d > 0],
+            )
 
         with lockfn() as now_dt:
             with transaction.atomic():
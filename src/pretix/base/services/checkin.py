@@ -1,8 +1,12 @@
+import json
+from collections import defaultdict
 from datetime import timedelta
+from functools import lru_cache
 
 import dateutil
 from django.core.files import File
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Count, Q, prefetch_related_objects
 from django.db.models.functions import TruncDate
 from django.dispatch import receiver
 from django.utils.functional import cached_property
@@ -10,11 +14,13 @@ from django.utils.timezone import now, override
 from django.utils.translation import gettext as _
 from django_scopes import scope, scopes_disabled
 
+from pretix.api.changes import record_objects
 from pretix.base.models import (
-    Checkin, CheckinList, Device, Order, OrderPosition, QuestionOption,
+    Checkin, CheckinList, Device, Order, OrderPosition, QuestionAnswer,
+    QuestionOption,
 )
 from pretix.base.signals import checkin_created, order_placed, periodic_task
-from pretix.helpers.jsonlogic import Logic
+from pretix.helpers.jsonlogic import Logic, used_variables
 
 
 def get_logic_environment(ev):
@@ -44,11 +50,31 @@ def get_logic_environment(ev):
     return logic
 
 
+@lru_cache(maxsize=256)
+def _compile_rules(rules, ev, date_from, date_to, date_admission):
+    # The dates of the event are part of the cache key since the compiled rules refer to them
+    rules = json.loads(rules)
+    return get_logic_environment(ev).compile(rules), used_variables(rules)
+
+
+def compile_rules(clist, ev):
+    """
+    Returns the rules of the check-in list compiled for the given event or subevent, as well as the
+    names of the variables they use, or ``None`` if that can't be determined.
+    """
+    return _compile_rules(
+        json.dumps(clist.rules, sort_keys=True), ev, ev.date_from, ev.date_to, ev.date_admission
+    )
+
+
 class LazyRuleVars:
-    def __init__(self, position, clist, dt):
+    ENTRY_COUNTS = ('entries_number', 'entries_today', 'entries_days')
+
+    def __init__(self, position, clist, dt, variables=None):
         self._position = position
         self._clist = clist
         self._dt = dt
+        self._variables = variables
 
     def __getitem__(self, item):
         if item[0] != '_' and hasattr(self, item):
@@ -68,22 +94,34 @@ class LazyRuleVars:
         return self._position.variation_id
 
     @cached_property
+    def _entry_counts(self):
+        # Fetch all counts the rules need in one query
+        needed = [v for v in self.ENTRY_COUNTS if self._variables is None or v in self._variables]
+        tz = self._clist.event.timezone
+        aggregates = {}
+        if 'entries_number' in needed:
+            aggregates['entries_number'] = Count('id')
+        if 'entries_today' in needed:
+            midnight = now().astimezone(tz).replace(hour=0, minute=0, second=0, microsecond=0)
+            aggregates['entries_today'] = Count('id', filter=Q(datetime__gte=midnight))
+        if 'entries_days' in needed:
+            aggregates['entries_days'] = Count(TruncDate('datetime'), distinct=True)
+        with override(tz):
+            return Checkin.objects.filter(
+                position=self._position, list=self._clist, type=Checkin.TYPE_ENTRY
+            ).aggregate(**aggregates)
+
+    @property
     def entries_number(self):
-        return self._position.checkins.filter(type=Checkin.TYPE_ENTRY, list=self._clist).count()
+        return self._entry_counts['entries_number']
 
-    @cached_property
+    @property
     def entries_today(self):
-        tz = self._clist.event.timezone
-        midnight = now().astimezone(tz).replace(hour=0, minute=0, second=0, microsecond=0)
-        return self._position.checkins.filter(type=Checkin.TYPE_ENTRY, list=self._clist, datetime__gte=midnight).count()
+        return self._entry_counts['entries_today']
 
-    @cached_property
+    @property
     def entries_days(self):
-        tz = self._clist.event.timezone
-        with override(tz):
-            return self._position.checkins.filter(list=self._clist, type=Checkin.TYPE_ENTRY).annotate(
-                day=TruncDate('datetime')
-            ).values('day').distinct().count()
+        return self._entry_counts['entries_days']
 
 
 class CheckInError(Exception):
@@ -154,6 +192,40 @@ def _save_answers(op, answers, given_answers):
             del prefetched_objects_cache['answers']
 
 
+def _check_entry_permitted(op, clist, dt, type, force, ignore_unpaid, require_answers, questions_supported):
+    if not clist.all_products and op.item_id not in [i.pk for i in clist.limit_products.all()]:
+        raise CheckInError(
+            _('This order position has an invalid product for this check-in list.'),
+            'product'
+        )
+    elif clist.subevent_id and op.subevent_id != clist.subevent_id:
+        raise CheckInError(
+            _('This order position has an invalid date for this check-in list.'),
+            'product'
+        )
+    elif op.order.status != Order.STATUS_PAID and not force and not (
+        ignore_unpaid and clist.include_pending and op.order.status == Order.STATUS_PENDING
+    ):
+        raise CheckInError(
+            _('This order is not marked as paid.'),
+            'unpaid'
+        )
+    elif require_answers and not force and questions_supported:
+        raise RequiredQuestionsError(
+            _('You need to answer questions to complete this check-in.'),
+            'incomplete',
+            require_answers
+        )
+
+    if type == Checkin.TYPE_ENTRY and clist.rules and not force:
+        rules, variables = compile_rules(clist, op.subevent or clist.event)
+        if not rules(LazyRuleVars(op, clist, dt, variables)):
+            raise CheckInError(
+                _('This entry is not permitted due to custom rules.'),
+                'rules'
+            )
+
+
 def perform_checkin(op: OrderPosition, clist: CheckinList, given_answers: dict, force=False,
                     ignore_unpaid=False, nonce=None, datetime=None, questions_supported=True,
                     user=None, auth=None, canceled_supported=False, type=Checkin.TYPE_ENTRY):
@@ -196,38 +268,7 @@ def perform_checkin(op: OrderPosition, clist: CheckinList, given_answers: dict,
         # Lock order positions
         op = OrderPosition.all.select_for_update().get(pk=op.pk)
 
-        if not clist.all_products and op.item_id not in [i.pk for i in clist.limit_products.all()]:
-            raise CheckInError(
-                _('This order position has an invalid product for this check-in list.'),
-                'product'
-            )
-        elif clist.subevent_id and op.subevent_id != clist.subevent_id:
-            raise CheckInError(
-                _('This order position has an invalid date for this check-in list.'),
-                'product'
-            )
-        elif op.order.status != Order.STATUS_PAID and not force and not (
-            ignore_unpaid and clist.include_pending and op.order.status == Order.STATUS_PENDING
-        ):
-            raise CheckInError(
-                _('This order is not marked as paid.'),
-                'unpaid'
-            )
-        elif require_answers and not force and questions_supported:
-            raise RequiredQuestionsError(
-                _('You need to answer questions to complete this check-in.'),
-                'incomplete',
-                require_answers
-            )
-
-        if type == Checkin.TYPE_ENTRY and clist.rules and not force:
-            rule_data = LazyRuleVars(op, clist, dt)
-            logic = get_logic_environment(op.subevent or clist.event)
-            if not logic.apply(clist.rules, rule_data):
-                raise CheckInError(
-                    _('This entry is not permitted due to custom rules.'),
-                    'rules'
-                )
+        _check_entry_permitted(op, clist, dt, type, force, ignore_unpaid, require_answers, questions_supported)
 
         device = None
         if isinstance(auth, Device):
@@ -272,6 +313,143 @@ def perform_checkin(op: OrderPosition, clist: CheckinList, given_answers: dict,
             )
 
 
+def _create_checkins(checkins):
+    if connection.features.can_return_rows_from_bulk_insert:
+        Checkin.objects.bulk_create(checkins)
+        record_objects(checkins)
+    else:
+        # We need primary keys for the checkin_created signal
+        for ci in checkins:
+            ci.save()
+
+
+def perform_checkin_batch(clist: CheckinList, scans: list, user=None, auth=None, questions_supported=True,
+                          canceled_supported=False):
+    """
+    Create checkins for a number of scans on the same check-in list at once, e.g. when an offline device
+    uploads its queue. Scans are processed in the given order with the same rules as in
+    :py:func:`perform_checkin`, but positions and previous checkins are loaded in bulk and new checkins are
+    inserted together.
+
+    :param scans: A list of dictionaries with the keys ``position``, ``type``, ``datetime``, ``nonce``, ``force``
+        and ``ignore_unpaid``, with the same meaning as the parameters of :py:func:`perform_checkin`.
+    :return: A list with one entry per scan, either ``None`` if the checkin was successful or the
+        ``CheckInError`` or ``RequiredQuestionsError`` that prevented it.
+    """
+    device = None
+    if isinstance(auth, Device):
+        device = auth
+
+    results = [None] * len(scans)
+    position_ids = {s['position'].pk for s in scans}
+    prefetch_related_objects([clist], 'limit_products')
+
+    checkin_questions = defaultdict(list)
+    for q in clist.event.questions.filter(ask_during_checkin=True).prefetch_related('items'):
+        for i in q.items.all():
+            checkin_questions[i.pk].append(q)
+    answered = set(
+        QuestionAnswer.objects.filter(
+            orderposition_id__in=position_ids, question__ask_during_checkin=True
+        ).values_list('orderposition_id', 'question_id')
+    )
+
+    with transaction.atomic():
+        # Lock order positions
+        positions = {
+            p.pk: p for p in OrderPosition.all.select_for_update().filter(pk__in=position_ids).order_by('pk')
+        }
+        orders = Order.objects.in_bulk({p.order_id for p in positions.values()})
+        for p in positions.values():
+            p.order = orders[p.order_id]
+
+        previous = defaultdict(list)
+        for ci in Checkin.objects.filter(list=clist, position_id__in=position_ids).only(
+            'position_id', 'type', 'nonce', 'device_id', 'datetime'
+        ):
+            previous[ci.position_id].append(ci)
+
+        pending = []
+        created = []
+        for i, scan in enumerate(scans):
+            op = positions[scan['position'].pk]
+            type = scan.get('type') or Checkin.TYPE_ENTRY
+            dt = scan.get('datetime') or now()
+            nonce = scan.get('nonce')
+            force = scan.get('force', False)
+            try:
+                if op.canceled or op.order.status not in (Order.STATUS_PAID, Order.STATUS_PENDING):
+                    raise CheckInError(
+                        _('This order position has been canceled.'),
+                        'canceled' if canceled_supported else 'unpaid'
+                    )
+
+                require_answers = [q for q in checkin_questions[op.item_id] if (op.pk, q.pk) not in answered]
+                if clist.rules and any(ci.position_id == op.pk for ci in pending):
+                    # Rules look at previous entries, so these need to be in the database
+                    _create_checkins(pending)
+                    pending = []
+                _check_entry_permitted(op, clist, dt, type, force, scan.get('ignore_unpaid', False),
+                                       require_answers, questions_supported)
+
+                last_ci = max(previous[op.pk], key=lambda ci: ci.datetime, default=None)
+                entry_allowed = (
+                    type == Checkin.TYPE_EXIT or
+                    clist.allow_multiple_entries or
+                    last_ci is None or
+                    (clist.allow_entry_after_exit and last_ci.type == Checkin.TYPE_EXIT)
+                )
+
+                if nonce and ((last_ci and last_ci.nonce == nonce) or any(
+                    ci.type == type and ci.device_id == (device.pk if device else None) and ci.nonce == nonce
+                    for ci in previous[op.pk]
+                )):
+                    continue
+
+                if not entry_allowed and not force:
+                    raise CheckInError(
+                        _('This ticket has already been redeemed.'),
+                        'already_redeemed',
+                    )
+            except (CheckInError, RequiredQuestionsError) as e:
+                results[i] = e
+                continue
+
+            ci = Checkin(
+                position=op,
+                type=type,
+                list=clist,
+                datetime=dt,
+                device=device,
+                gate=device.gate if device else None,
+                nonce=nonce,
+                forced=force and not entry_allowed,
+            )
+            pending.append(ci)
+            created.append(ci)
+            previous[op.pk].append(ci)
+            op.order.log_action('pretix.event.checkin', data={
+                'position': op.id,
+                'positionid': op.positionid,
+                'first': True,
+                'forced': force or op.order.status != Order.STATUS_PAID,
+                'datetime': dt,
+                'type': type,
+                'list': clist.pk
+            }, user=user, auth=auth)
+
+        _create_checkins(pending)
+
+        for o in {ci.position.order for ci in created}:
+            o.touch()
+        clist.event.cache.delete('checkin_count')
+        clist.touch()
+        for ci in created:
+            checkin_created.send(clist.event, checkin=ci)
+
+    return results
+
+
 @receiver(order_placed, dispatch_uid="autocheckin_order_placed")
 def order_placed(sender, **kwargs):
     order = kwargs['order']
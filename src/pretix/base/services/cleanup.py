@@ -2,16 +2,28 @@ from datetime import timedelta
 
 from django.conf import settings
 from django.core.management import call_command
+from django.db.models import Q
 from django.dispatch import receiver
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
-from pretix.base.models import CachedCombinedTicket, CachedTicket
+from pretix.base.models import CachedCombinedTicket, CachedTicket, Event
 
+from ...helpers.periodic import minimum_interval
 from ..models import CachedFile, CartPosition, InvoiceAddress
 from ..signals import periodic_task
 
 
+def _delete_in_batches(qs, batch_size=1000):
+    # Deleting through a queryset still sends post_delete per object, which removes the files, but it
+    # needs only a few queries per batch instead of a few per object.
+    while True:
+        pks = list(qs.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            break
+        qs.model.objects.filter(pk__in=pks).delete()
+
+
 @receiver(signal=periodic_task)
 @scopes_disabled()
 def clean_cart_positions(sender, **kwargs):
@@ -33,14 +45,24 @@ def clean_cached_files(sender, **kwargs):
 @receiver(signal=periodic_task)
 @scopes_disabled()
 def clean_cached_tickets(sender, **kwargs):
-    for cf in CachedTicket.objects.filter(created__lte=now() - timedelta(hours=settings.CACHE_TICKETS_HOURS)):
-        cf.delete()
-    for cf in CachedCombinedTicket.objects.filter(created__lte=now() - timedelta(hours=settings.CACHE_TICKETS_HOURS)):
-        cf.delete()
-    for cf in CachedTicket.objects.filter(created__lte=now() - timedelta(minutes=30), file__isnull=True):
-        cf.delete()
-    for cf in CachedCombinedTicket.objects.filter(created__lte=now() - timedelta(minutes=30), file__isnull=True):
-        cf.delete()
+    _delete_in_batches(CachedTicket.objects.filter(created__lte=now() - timedelta(hours=settings.CACHE_TICKETS_HOURS)))
+    _delete_in_batches(CachedCombinedTicket.objects.filter(created__lte=now() - timedelta(hours=settings.CACHE_TICKETS_HOURS)))
+    _delete_in_batches(CachedTicket.objects.filter(created__lte=now() - timedelta(minutes=30), file__isnull=True))
+    _delete_in_batches(CachedCombinedTicket.objects.filter(created__lte=now() - timedelta(minutes=30), file__isnull=True))
+
+
+@receiver(signal=periodic_task)
+@minimum_interval(minutes_after_success=60)
+@scopes_disabled()
+def clean_outdated_cached_tickets(sender, **kwargs):
+    events = Event.objects.filter(
+        Q(pk__in=CachedTicket.objects.values('order_position__order__event_id'))
+        | Q(pk__in=CachedCombinedTicket.objects.values('order__event_id'))
+    )
+    for event in events:
+        generation = event.settings.ticket_cache_generation
+        _delete_in_batches(CachedTicket.objects.filter(order_position__order__event=event).exclude(generation=generation))
+        _delete_in_batches(CachedCombinedTicket.objects.filter(order__event=event).exclude(generation=generation))
 
 
 @receiver(signal=periodic_task)
@@ -1,6 +1,10 @@
+import inspect
+import os
+import tempfile
 from typing import Any, Dict
 
 from django.conf import settings
+from django.core.files import File
 from django.core.files.base import ContentFile
 from django.utils.timezone import override
 from django.utils.translation import gettext
@@ -22,6 +26,39 @@ class ExportError(LazyLocaleException):
     pass
 
 
+def _render_to_file(ex, form_data: Dict[str, Any], file: CachedFile) -> None:
+    """
+    Renders the export into ``file``. Exporters that accept an ``output_file`` write to a temporary file
+    that is then copied to the storage in chunks, so the export never needs to be kept in memory as a whole.
+    """
+    if 'output_file' not in inspect.signature(ex.render).parameters:
+        d = ex.render(form_data)
+        if d is None:
+            raise ExportError(
+                gettext('Your export did not contain any data.')
+            )
+        file.filename, file.type, data = d
+        file.file.save(cachedfile_name(file, file.filename), ContentFile(data))
+        file.save()
+        return
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'export')
+        with open(path, 'wb') as f:
+            d = ex.render(form_data, output_file=f)
+        if d is None:
+            raise ExportError(
+                gettext('Your export did not contain any data.')
+            )
+        file.filename, file.type, data = d
+        if data is None:
+            with open(path, 'rb') as f:
+                file.file.save(cachedfile_name(file, file.filename), File(f))
+        else:
+            file.file.save(cachedfile_name(file, file.filename), ContentFile(data))
+        file.save()
+
+
 @app.task(base=ProfiledEventTask, throws=(ExportError,), bind=True)
 def export(self, event: Event, fileid: str, provider: str, form_data: Dict[str, Any]) -> None:
     def set_progress(val):
@@ -37,14 +74,7 @@ def export(self, event: Event, fileid: str, provider: str, form_data: Dict[str,
         for receiver, response in responses:
             ex = response(event, set_progress)
             if ex.identifier == provider:
-                d = ex.render(form_data)
-                if d is None:
-                    raise ExportError(
-                        gettext('Your export did not contain any data.')
-                    )
-                file.filename, file.type, data = d
-                file.file.save(cachedfile_name(file, file.filename), ContentFile(data))
-                file.save()
+                _render_to_file(ex, form_data, file)
     return file.pk
 
 
@@ -90,12 +120,5 @@ def multiexport(self, organizer: Organizer, user: User, device: int, token: int,
                 continue
             ex = response(events, set_progress)
             if ex.identifier == provider:
-                d = ex.render(form_data)
-                if d is None:
-                    raise ExportError(
-                        gettext('Your export did not contain any data.')
-                    )
-                file.filename, file.type, data = d
-                file.file.save(cachedfile_name(file, file.filename), ContentFile(data))
-                file.save()
+                _render_to_file(ex, form_data, file)
     return file.pk
@@ -4,7 +4,7 @@ import uuid
 from datetime import timedelta
 
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from django.utils.timezone import now
 
 from pretix.base.models import EventLock
@@ -26,15 +26,52 @@ class NoLockManager:
 
 
 class LockManager:
-    def __init__(self, event):
+    """
+    Context manager that locks an event for bookings.
+
+    If fine-grained locking is enabled in the configuration and you pass the quotas, seats and
+    vouchers that your operation touches, only those objects are locked. Operations on other
+    objects of the same event can run in parallel, while operations that lock the whole event
+    wait for all of them. If you do not pass any objects, the whole event is locked.
+    """
+
+    def __init__(self, event, quotas=None, seats=None, vouchers=None):
         self.event = event
+        self.keys = None
+        self.token = None
+        if settings.LOCK_FINE_GRAINED and quotas is not None:
+            self.keys = lock_keys(event, quotas, seats or [], vouchers or [])
 
     def __enter__(self):
-        lock_event(self.event)
+        scope = 'event' if self.keys is None else 'objects'
+        t0 = time.perf_counter()
+        try:
+            if self.keys is None:
+                lock_event(self.event)
+            elif self.keys and not (hasattr(self.event, '_lock') and self.event._lock):
+                # If the whole event is already locked by us, there's nothing left to do
+                self.token = lock_objects(self.event, self.keys)
+        except LockTimeoutException:
+            if settings.METRICS_ENABLED:
+                from pretix.base.metrics import pretix_lock_timeouts_total
+                pretix_lock_timeouts_total.inc(1, scope=scope)
+            raise
+        self.t_acquired = time.perf_counter()
+        if settings.METRICS_ENABLED:
+            from pretix.base.metrics import pretix_lock_wait_seconds
+            pretix_lock_wait_seconds.observe(self.t_acquired - t0, scope=scope)
         return now()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        release_event(self.event)
+        if self.keys is None:
+            release_event(self.event)
+        elif self.token:
+            release_objects(self.event, self.keys, self.token)
+            self.token = None
+        if settings.METRICS_ENABLED:
+            from pretix.base.metrics import pretix_lock_hold_seconds
+            pretix_lock_hold_seconds.observe(time.perf_counter() - self.t_acquired,
+                                             scope='event' if self.keys is None else 'objects')
         if exc_type is not None:
             return False
 
@@ -47,10 +84,38 @@ class LockReleaseException(Exception):
     pass
 
 
+def lock_keys(event, quotas, seats, vouchers):
+    """
+    Returns the sorted list of lock names for the given objects. Locks are always acquired in this
+    order to prevent deadlocks between operations touching overlapping sets of objects.
+    """
+    keys = {'%s:quota:%s' % (event.id, q.pk) for q in quotas if q.size is not None}
+    keys |= {'%s:seat:%s' % (event.id, s.pk) for s in seats}
+    keys |= {'%s:voucher:%s' % (event.id, v.pk) for v in vouchers}
+    return sorted(keys)
+
+
+def _until_deadline(max_interval):
+    """
+    Yields repeatedly until ``LOCK_MAX_WAIT`` seconds have passed, sleeping with an exponential
+    backoff of up to ``max_interval`` seconds in between. Yields at least once.
+    """
+    deadline = time.monotonic() + settings.LOCK_MAX_WAIT
+    i = 0
+    while True:
+        yield
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(2 ** i / 100, max_interval, remaining))
+        i += 1
+
+
 def lock_event(event):
     """
     Issue a lock on this event so nobody can book tickets for this event until
-    you release the lock. Will retry 5 times on failure.
+    you release the lock. Will wait up to ``LOCK_MAX_WAIT`` seconds for the lock
+    to become available.
 
     :raises LockTimeoutException: if the event is locked every time we try
                                   to obtain the lock
@@ -80,23 +145,52 @@ def release_event(event):
         return release_event_db(event)
 
 
+def lock_objects(event, keys):
+    """
+    Issue locks on a set of objects within an event, as returned by :py:func:`lock_keys`. Either
+    all or none of the locks are obtained. Will wait up to ``LOCK_MAX_WAIT`` seconds for the locks
+    to become available.
+
+    :returns: a token that needs to be passed to :py:func:`release_objects`
+    :raises LockTimeoutException: if any of the objects or the whole event is locked every time
+                                  we try to obtain the locks
+    """
+    if settings.HAS_REDIS:
+        return lock_objects_redis(event, keys)
+    else:
+        return lock_objects_db(event, keys)
+
+
+def release_objects(event, keys, token):
+    """
+    Release locks placed by :py:func:`lock_objects`.
+    """
+    if settings.HAS_REDIS:
+        return release_objects_redis(event, keys, token)
+    else:
+        return release_objects_db(event, keys, token)
+
+
 def lock_event_db(event):
-    retries = 5
-    for i in range(retries):
+    for _ in _until_deadline(.1):
         with transaction.atomic():
             dt = now()
             l, created = EventLock.objects.get_or_create(event=event.id)
             if created:
                 event._lock = l
-                return True
             elif l.date < now() - timedelta(seconds=LOCK_TIMEOUT):
                 newtoken = str(uuid.uuid4())
                 updated = EventLock.objects.filter(event=event.id, token=l.token).update(date=dt, token=newtoken)
                 if updated:
                     l.token = newtoken
                     event._lock = l
-                    return True
-        time.sleep(2 ** i / 100)
+        if hasattr(event, '_lock') and event._lock:
+            if not settings.LOCK_FINE_GRAINED or not EventLock.objects.filter(
+                event__startswith='%s:' % event.id, date__gte=now() - timedelta(seconds=LOCK_TIMEOUT)
+            ).exists():
+                return True
+            # Some objects of this event are locked, so we can't lock the event as a whole
+            release_event_db(event)
     raise LockTimeoutException()
 
 
@@ -112,39 +206,181 @@ def release_event_db(event):
         raise LockReleaseException('Lock is no longer owned by this thread')
 
 
-def redis_lock_from_event(event):
-    from django_redis import get_redis_connection
-    from redis.lock import Lock
+def lock_objects_db(event, keys):
+    token = uuid.uuid4()
+    for _ in _until_deadline(.1):
+        stale = now() - timedelta(seconds=LOCK_TIMEOUT)
+        try:
+            with transaction.atomic():
+                EventLock.objects.filter(event__in=keys, date__lt=stale).delete()
+                # bulk_create inserts in the given order, so concurrent calls with overlapping keys can't deadlock
+                EventLock.objects.bulk_create([EventLock(event=k, token=token) for k in keys])
+        except IntegrityError:
+            pass
+        else:
+            if not EventLock.objects.filter(event=str(event.id), date__gte=stale).exists():
+                return token
+            # The whole event is locked, so we need to back off
+            release_objects_db(event, keys, token)
+    raise LockTimeoutException()
 
-    if not hasattr(event, '_lock') or not event._lock:
-        rc = get_redis_connection("redis")
-        event._lock = Lock(redis=rc, name='pretix_event_%s' % event.id, timeout=LOCK_TIMEOUT)
-    return event._lock
+
+def release_objects_db(event, keys, token):
+    EventLock.objects.filter(event__in=keys, token=token).delete()
+
+
+def redis_event_key(event):
+    return 'pretix_event_%s' % event.id
+
+
+def redis_queue_key(event):
+    # Sorted set of all tokens currently waiting for the event lock, scored by time of arrival
+    return 'pretix_event_%s_queue' % event.id
+
+
+def redis_objects_key(event):
+    # Sorted set of all tokens currently holding object locks within this event, scored by expiry
+    return 'pretix_event_%s_objects' % event.id
+
+
+# Waiters enter a queue and only the first one in line may take the lock, so the lock is handed out
+# in order of arrival. Waiters give up after max_wait, so older entries belong to crashed processes.
+# KEYS: event lock, queue, objects set
+# ARGV: token, current time in milliseconds, timeout in milliseconds, max wait in milliseconds,
+#       whether to check for object locks
+LUA_LOCK_EVENT = """
+redis.call('zremrangebyscore', KEYS[2], '-inf', ARGV[2] - 2 * ARGV[4])
+if not redis.call('zscore', KEYS[2], ARGV[1]) then
+    redis.call('zadd', KEYS[2], ARGV[2], ARGV[1])
+end
+redis.call('pexpire', KEYS[2], 2 * ARGV[4] + ARGV[3])
+if redis.call('zrange', KEYS[2], 0, 0)[1] ~= ARGV[1] then
+    return 0
+end
+if ARGV[5] == '1' and redis.call('zcount', KEYS[3], ARGV[2], '+inf') > 0 then
+    return 0
+end
+if redis.call('set', KEYS[1], ARGV[1], 'nx', 'px', ARGV[3]) then
+    redis.call('zrem', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+# KEYS: event lock
+# ARGV: token
+LUA_RELEASE_EVENT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
 
 
 def lock_event_redis(event):
+    from django_redis import get_redis_connection
     from redis.exceptions import RedisError
 
-    lock = redis_lock_from_event(event)
-    retries = 5
-    for i in range(retries):
-        try:
-            if lock.acquire(False):
+    rc = get_redis_connection("redis")
+    token = uuid.uuid4().hex
+    script = rc.register_script(LUA_LOCK_EVENT)
+    try:
+        for _ in _until_deadline(.05):
+            if script(
+                keys=[redis_event_key(event), redis_queue_key(event), redis_objects_key(event)],
+                args=[token, int(time.time() * 1000), LOCK_TIMEOUT * 1000, int(settings.LOCK_MAX_WAIT * 1000),
+                      int(settings.LOCK_FINE_GRAINED)]
+            ):
+                event._lock = token
                 return True
-        except RedisError:
-            logger.exception('Error locking an event')
-            raise LockTimeoutException()
-        time.sleep(2 ** i / 100)
+        rc.zrem(redis_queue_key(event), token)
+    except RedisError:
+        logger.exception('Error locking an event')
     raise LockTimeoutException()
 
 
 def release_event_redis(event):
-    from redis import RedisError
+    from django_redis import get_redis_connection
+    from redis.exceptions import RedisError
 
-    lock = redis_lock_from_event(event)
+    rc = get_redis_connection("redis")
     try:
-        lock.release()
+        released = rc.register_script(LUA_RELEASE_EVENT)(keys=[redis_event_key(event)], args=[event._lock])
     except RedisError:
         logger.exception('Error releasing an event lock')
         raise LockTimeoutException()
     event._lock = None
+    if not released:
+        raise LockReleaseException('Lock is no longer owned by this thread')
+
+
+# Object locks are not handed out while somebody waits for the whole event, so that a steady stream
+# of object locks can not starve operations that need to lock the event.
+# KEYS: event lock, objects set, queue, object locks…
+# ARGV: token, timeout in milliseconds, current time in milliseconds, max wait in milliseconds
+LUA_LOCK_OBJECTS = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+if redis.call('zcount', KEYS[3], ARGV[3] - 2 * ARGV[4], '+inf') > 0 then
+    return 0
+end
+for i = 4, #KEYS do
+    if redis.call('exists', KEYS[i]) == 1 then
+        return 0
+    end
+end
+for i = 4, #KEYS do
+    redis.call('set', KEYS[i], ARGV[1], 'px', ARGV[2])
+end
+redis.call('zremrangebyscore', KEYS[2], '-inf', ARGV[3])
+redis.call('zadd', KEYS[2], ARGV[3] + ARGV[2], ARGV[1])
+redis.call('pexpire', KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS: objects set, object locks…
+# ARGV: token
+LUA_RELEASE_OBJECTS = """
+for i = 2, #KEYS do
+    if redis.call('get', KEYS[i]) == ARGV[1] then
+        redis.call('del', KEYS[i])
+    end
+end
+redis.call('zrem', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+def lock_objects_redis(event, keys):
+    from django_redis import get_redis_connection
+    from redis.exceptions import RedisError
+
+    rc = get_redis_connection("redis")
+    token = uuid.uuid4().hex
+    script = rc.register_script(LUA_LOCK_OBJECTS)
+    try:
+        for _ in _until_deadline(.05):
+            if script(
+                keys=[redis_event_key(event), redis_objects_key(event), redis_queue_key(event)] + [
+                    'pretix_lock_%s' % k for k in keys
+                ],
+                args=[token, LOCK_TIMEOUT * 1000, int(time.time() * 1000), int(settings.LOCK_MAX_WAIT * 1000)]
+            ):
+                return token
+    except RedisError:
+        logger.exception('Error locking objects')
+    raise LockTimeoutException()
+
+
+def release_objects_redis(event, keys, token):
+    from django_redis import get_redis_connection
+    from redis.exceptions import RedisError
+
+    rc = get_redis_connection("redis")
+    script = rc.register_script(LUA_RELEASE_OBJECTS)
+    try:
+        script(keys=[redis_objects_key(event)] + ['pretix_lock_%s' % k for k in keys], args=[token])
+    except RedisError:
+        logger.exception('Error releasing object locks')
+        raise LockTimeoutException()
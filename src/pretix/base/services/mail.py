@@ -1,20 +1,32 @@
+import hashlib
 import inspect
 import logging
 import os
+import posixpath
 import re
 import smtplib
 import ssl
+import threading
+import time
 import warnings
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from email.mime.image import MIMEImage
 from email.utils import formataddr
-from typing import Any, Dict, List, Sequence, Union
-from urllib.parse import urljoin, urlparse
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import unquote, urljoin, urlparse
 
 import cssutils
 import requests
 from bs4 import BeautifulSoup
 from celery import chain
 from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.files.storage import default_storage
 from django.core.mail import (
     EmailMultiAlternatives, SafeMIMEMultipart, get_connection,
 )
@@ -39,7 +51,14 @@ from pretix.presale.ical import get_ical
 
 logger = logging.getLogger('pretix.base.mail')
 INVALID_ADDRESS = 'invalid-pretix-mail-address'
+IMAGE_TIMEOUT = 10
+IMAGE_CACHE_TTL = 3600
+IMAGE_CACHE_MAX_SIZE = 512 * 1024
+CONNECTION_MAX_AGE = 60
+BATCH_SIZE = 100
 cssutils.log.setLevel(logging.CRITICAL)
+_connections = threading.local()
+_batch = threading.local()
 
 
 class TolerantDict(dict):
@@ -239,6 +258,14 @@ def mail(email: Union[str, Sequence[str]], subject: str, template: Union[str, La
         else:
             task_chain = []
 
+        if not task_chain and getattr(_batch, 'messages', None) is not None:
+            messages = _batch.messages[send_task.kwargs['event']]
+            messages.append(send_task.kwargs)
+            if len(messages) >= BATCH_SIZE:
+                _send_batch(messages)
+                messages.clear()
+            return
+
         task_chain.append(send_task)
         chain(*task_chain).apply_async()
 
@@ -257,11 +284,79 @@ class CustomEmail(EmailMultiAlternatives):
         return super()._create_mime_attachment(content, mimetype)
 
 
-@app.task(base=TransactionAwareTask, bind=True, acks_late=True)
-def mail_send_task(self, *args, to: List[str], subject: str, body: str, html: str, sender: str,
-                   event: int = None, position: int = None, headers: dict = None, bcc: List[str] = None,
-                   invoices: List[int] = None, order: int = None, attach_tickets=False, user=None,
-                   attach_ical=False, attach_cached_files: List[int] = None) -> bool:
+class _TemporaryMailError(Exception):
+    pass
+
+
+def _mail_backend_key(event):
+    if event and event.settings.smtp_use_custom:
+        return (
+            'custom', event.settings.smtp_host, event.settings.smtp_port, event.settings.smtp_username,
+            event.settings.smtp_password, event.settings.smtp_use_tls, event.settings.smtp_use_ssl,
+        )
+    return ('default', settings.EMAIL_BACKEND)
+
+
+def _get_pooled_backend(event, key):
+    pool = _connections.__dict__.setdefault('pool', {})
+    if key in pool:
+        backend, opened = pool[key]
+        if time.monotonic() - opened < CONNECTION_MAX_AGE:
+            return backend
+        _drop_pooled_backend(key)
+
+    backend = event.get_mail_backend() if event else get_connection(fail_silently=False)
+    backend.open()
+    pool[key] = (backend, time.monotonic())
+    return backend
+
+
+def _drop_pooled_backend(key):
+    pool = _connections.__dict__.setdefault('pool', {})
+    if key in pool:
+        backend, opened = pool.pop(key)
+        try:
+            backend.close()
+        except Exception:
+            pass
+
+
+def send_pooled(email, event=None):
+    """
+    Sends an email through a connection that is kept open and reused by all emails sent from the same
+    worker with the same mail server configuration, instead of doing a new SMTP handshake for every email.
+    Connections are replaced after ``CONNECTION_MAX_AGE`` seconds or if the server closed them.
+    """
+    key = _mail_backend_key(event)
+    try:
+        try:
+            _get_pooled_backend(event, key).send_messages([email])
+        except smtplib.SMTPServerDisconnected:
+            # The server probably timed out our idle connection, try once more with a fresh one
+            _drop_pooled_backend(key)
+            _get_pooled_backend(event, key).send_messages([email])
+    except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ssl.SSLError, OSError):
+        _drop_pooled_backend(key)
+        raise
+
+
+def _log_mail_error(order, subject, message):
+    if order:
+        order.log_action(
+            'pretix.event.order.email.error',
+            data={
+                'subject': subject,
+                'message': message,
+                'recipient': '',
+                'invoices': [],
+            }
+        )
+
+
+def _send_mail(to: List[str], subject: str, body: str, html: str, sender: str,
+               event: int = None, position: int = None, headers: dict = None, bcc: List[str] = None,
+               invoices: List[int] = None, order: int = None, attach_tickets=False, user=None,
+               attach_ical=False, attach_cached_files: List[int] = None, can_retry=False) -> bool:
     email = CustomEmail(subject, body, sender, to=to, bcc=bcc, headers=headers)
     if html is not None:
         html_message = SafeMIMEMultipart(_subtype='related', encoding=settings.DEFAULT_CHARSET)
@@ -276,10 +371,8 @@ def mail_send_task(self, *args, to: List[str], subject: str, body: str, html: st
     if event:
         with scopes_disabled():
             event = Event.objects.get(id=event)
-        backend = event.get_mail_backend()
         cm = lambda: scope(organizer=event.organizer)  # noqa
     else:
-        backend = get_connection(fail_silently=False)
         cm = lambda: scopes_disabled()  # noqa
 
     with cm():
@@ -371,39 +464,88 @@ def mail_send_task(self, *args, to: List[str], subject: str, body: str, html: st
         email = global_email_filter.send_chained(event, 'message', message=email, user=user, order=order)
 
         try:
-            backend.send_messages([email])
+            send_pooled(email, event)
         except smtplib.SMTPResponseException as e:
-            if e.smtp_code in (101, 111, 421, 422, 431, 442, 447, 452):
-                self.retry(max_retries=5, countdown=2 ** (self.request.retries * 3))  # max is 2 ** (4*3) = 4096 seconds = 68 minutes
+            if can_retry and e.smtp_code in (101, 111, 421, 422, 431, 442, 447, 452):
+                raise _TemporaryMailError()
             logger.exception('Error sending email')
-
-            if order:
-                order.log_action(
-                    'pretix.event.order.email.error',
-                    data={
-                        'subject': 'SMTP code {}'.format(e.smtp_code),
-                        'message': e.smtp_error.decode() if isinstance(e.smtp_error, bytes) else str(e.smtp_error),
-                        'recipient': '',
-                        'invoices': [],
-                    }
-                )
-
+            _log_mail_error(
+                order,
+                'SMTP code {}'.format(e.smtp_code),
+                e.smtp_error.decode() if isinstance(e.smtp_error, bytes) else str(e.smtp_error)
+            )
             raise SendMailException('Failed to send an email to {}.'.format(to))
         except Exception as e:
-            if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ssl.SSLError, OSError)):
-                self.retry(max_retries=5, countdown=2 ** (self.request.retries * 3))  # max is 2 ** (4*3) = 4096 seconds = 68 minutes
-            if order:
-                order.log_action(
-                    'pretix.event.order.email.error',
-                    data={
-                        'subject': 'Internal error',
-                        'message': str(e),
-                        'recipient': '',
-                        'invoices': [],
-                    }
-                )
+            if can_retry and isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ssl.SSLError, OSError)):
+                raise _TemporaryMailError()
+            _log_mail_error(order, 'Internal error', str(e))
             logger.exception('Error sending email')
             raise SendMailException('Failed to send an email to {}.'.format(to))
+        return True
+
+
+@app.task(base=TransactionAwareTask, bind=True, acks_late=True)
+def mail_send_task(self, *args, **kwargs) -> bool:
+    try:
+        return _send_mail(*args, can_retry=self.request.retries < 5, **kwargs)
+    except _TemporaryMailError:
+        self.retry(max_retries=5, countdown=2 ** (self.request.retries * 3))  # max is 2 ** (4*3) = 4096 seconds = 68 minutes
+
+
+@app.task(base=TransactionAwareTask, bind=True, acks_late=True)
+def mail_send_batch_task(self, messages: List[dict]) -> int:
+    """
+    Sends a list of emails, each given as the keyword arguments of ``mail_send_task``. All emails share the
+    pooled connections of this worker. Failures are logged to the respective order and do not stop the
+    rest of the batch; emails that failed temporarily are retried together later.
+    """
+    sent = 0
+    retry = []
+    for kwargs in messages:
+        try:
+            _send_mail(can_retry=self.request.retries < 5, **kwargs)
+            sent += 1
+        except _TemporaryMailError:
+            retry.append(kwargs)
+        except SendMailException:
+            pass
+        except Exception as e:
+            logger.exception('Error sending email')
+            if kwargs.get('order'):
+                try:
+                    with scopes_disabled():
+                        order = Order.objects.get(pk=kwargs['order'])
+                    _log_mail_error(order, 'Internal error', str(e))
+                except Exception:
+                    logger.exception('Could not log email error')
+    if retry:
+        self.retry(kwargs={'messages': retry}, max_retries=5, countdown=2 ** (self.request.retries * 3))
+    return sent
+
+
+def _send_batch(messages):
+    chain(mail_send_batch_task.si(messages=list(messages))).apply_async()
+
+
+@contextmanager
+def mail_batch():
+    """
+    Collects the emails queued with :py:func:`mail` while this context is active and sends them with
+    ``mail_send_batch_task`` in batches of ``BATCH_SIZE`` per event, instead of starting one task per email.
+    A batch is sent as soon as it is full, the rest when the context exits. Use this when sending many emails
+    at once.
+    """
+    if getattr(_batch, 'messages', None) is not None:
+        yield
+        return
+    _batch.messages = defaultdict(list)
+    try:
+        yield
+    finally:
+        messages, _batch.messages = _batch.messages, None
+        for event_messages in messages.values():
+            if event_messages:
+                _send_batch(event_messages)
 
 
 def mail_send(*args, **kwargs):
@@ -445,11 +587,18 @@ def attach_cid_images(msg, cid_images, verify_ssl=True):
     if cid_images and len(cid_images) > 0:
 
         msg.mixed_subtype = 'mixed'
+        urls = [image for image in cid_images if not image.startswith('data:')]
+        if len(urls) > 1:
+            with ThreadPoolExecutor(max_workers=min(len(urls), 4)) as executor:
+                loaded = dict(zip(urls, executor.map(partial(load_image, verify_ssl=verify_ssl), urls)))
+        else:
+            loaded = {url: load_image(url, verify_ssl) for url in urls}
+
         for key, image in enumerate(cid_images):
             cid = 'image_%s' % key
             try:
                 mime_image = convert_image_to_cid(
-                    image, cid, verify_ssl)
+                    image, cid, verify_ssl, loaded=loaded.get(image))
                 if mime_image:
                     msg.attach(mime_image)
             except:
@@ -471,7 +620,7 @@ def encoder_linelength(msg):
     msg.set_payload(b"\r\n".join(pieces))
 
 
-def convert_image_to_cid(image_src, cid_id, verify_ssl=True):
+def convert_image_to_cid(image_src, cid_id, verify_ssl=True, loaded=None):
     try:
         if image_src.startswith('data:image/'):
             image_type, image_content = image_src.split(',', 1)
@@ -482,14 +631,10 @@ def convert_image_to_cid(image_src, cid_id, verify_ssl=True):
             logger.exception("ERROR creating MIME element %s[%s]" % (cid_id, image_src))
             return None
         else:
-            image_src = normalize_image_url(image_src)
-
-            path = urlparse(image_src).path
-            guess_subtype = os.path.splitext(path)[1][1:]
-
-            response = requests.get(image_src, verify=verify_ssl)
-            mime_image = MIMEImage(
-                response.content, _subtype=guess_subtype)
+            content, subtype = loaded or load_image(image_src, verify_ssl) or (None, None)
+            if content is None:
+                return None
+            mime_image = MIMEImage(content, _subtype=subtype)
 
         mime_image.add_header('Content-ID', '<%s>' % cid_id)
 
@@ -499,6 +644,74 @@ def convert_image_to_cid(image_src, cid_id, verify_ssl=True):
         return None
 
 
+def _open_local_image(url) -> Optional[bytes]:
+    """
+    Reads images that are served from our own media or static files directly from the storage instead of
+    downloading them.
+    """
+    url = urljoin(settings.SITE_URL, url)
+    for prefix, storage in (
+        # Only public media files, the web server does not serve e.g. invoices or cached files to anyone
+        (urljoin(settings.SITE_URL, settings.MEDIA_URL) + 'pub/', default_storage),
+        (urljoin(settings.SITE_URL, settings.STATIC_URL), staticfiles_storage),
+    ):
+        if not url.startswith(prefix):
+            continue
+        name = unquote(urlparse(url[len(prefix):]).path)
+        if storage is default_storage:
+            name = 'pub/' + name
+        # Never leave the public directory, e.g. with an encoded "../" in the URL
+        normalized = posixpath.normpath(name)
+        if '..' in normalized.split('/') or normalized.startswith('/') or (
+                storage is default_storage and not normalized.startswith('pub/')):
+            return None
+        name = normalized
+        try:
+            with storage.open(name) as f:
+                return f.read()
+        except Exception:
+            # Static files might not have been collected, e.g. in development
+            path = finders.find(name) if storage is staticfiles_storage else None
+            if path:
+                with open(path, 'rb') as f:
+                    return f.read()
+    return None
+
+
+def load_image(image_src, verify_ssl=True) -> Optional[Tuple[bytes, str]]:
+    """
+    Returns the content and the MIME subtype of an image that is embedded in an email. Images are cached
+    by their content for all emails, so e.g. the logo of an event is only loaded once for all emails of
+    a mass mailing.
+    """
+    try:
+        url = normalize_image_url(image_src)
+        url_key = 'mail_image_url:{}'.format(hashlib.sha1(url.encode()).hexdigest())
+        digest = cache.get(url_key)
+        if digest:
+            cached = cache.get('mail_image:{}'.format(digest))
+            if cached:
+                return cached
+
+        subtype = os.path.splitext(urlparse(url).path)[1][1:]
+        content = _open_local_image(url)
+        if content is None:
+            response = requests.get(url, verify=verify_ssl, timeout=IMAGE_TIMEOUT)
+            response.raise_for_status()
+            content = response.content
+
+        if len(content) <= IMAGE_CACHE_MAX_SIZE:
+            digest = hashlib.sha256(content).hexdigest()
+            cache.set_many({
+                url_key: digest,
+                'mail_image:{}'.format(digest): (content, subtype),
+            }, IMAGE_CACHE_TTL)
+        return content, subtype
+    except:
+        logger.exception("ERROR loading image %s" % image_src)
+        return None
+
+
 def normalize_image_url(url):
     if '://' not in url:
         """
@@ -19,21 +19,25 @@ def notify(logentry_ids: list):
     if not isinstance(logentry_ids, list):
         logentry_ids = [logentry_ids]
 
-    qs = LogEntry.all.select_related('event', 'event__organizer').filter(id__in=logentry_ids)
+    qs = LogEntry.all.select_related('event', 'event__organizer').filter(id__in=logentry_ids).order_by(
+        'event_id', 'action_type', 'pk'
+    )
 
-    _event, _at, notify_specific, notify_global = None, None, None, None
+    _event, _at, _user, notify_specific, notify_global = None, None, None, None, None
     for logentry in qs:
         if not logentry.event:
-            break  # Ignore, we only have event-related notifications right now
+            continue  # Ignore, we only have event-related notifications right now
 
         notification_type = logentry.notification_type
 
         if not notification_type:
-            break  # No suitable plugin
+            continue  # No suitable plugin
 
-        if _event != logentry.event or _at != logentry.action_type or notify_global is None:
+        if (_event != logentry.event or _at != logentry.action_type or _user != logentry.user_id
+                or notify_global is None):
             _event = logentry.event
             _at = logentry.action_type
+            _user = logentry.user_id
             # All users that have the permission to get the notification
             users = logentry.event.get_users_with_permission(
                 notification_type.required_permission
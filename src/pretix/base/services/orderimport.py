@@ -12,6 +12,7 @@ from pretix.base.models import (
     CachedFile, Event, InvoiceAddress, Order, OrderPayment, OrderPosition,
     User,
 )
+from pretix.base.models.base import log_batch
 from pretix.base.orderimport import get_all_columns
 from pretix.base.services.invoices import generate_invoice, invoice_qualified
 from pretix.base.services.tasks import ProfiledEventTask
@@ -119,7 +120,7 @@ def import_orders(event: Event, fileid: str, settings: dict, locale: str, user)
 
         # quota check?
         with event.lock():
-            with transaction.atomic():
+            with transaction.atomic(), log_batch():
                 for o in orders:
                     o.total = sum([c.price for c in o._positions])  # currently no support for fees
                     if o.total == Decimal('0.00'):
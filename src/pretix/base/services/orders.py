@@ -3,6 +3,7 @@ import logging
 from collections import Counter, namedtuple
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from functools import partial
 from typing import List, Optional
 
 from celery.exceptions import MaxRetriesExceededError
@@ -20,6 +21,7 @@ from django.utils.timezone import make_aware, now
 from django.utils.translation import gettext as _
 from django_scopes import scopes_disabled
 
+from pretix.api.changes import record_objects
 from pretix.api.models import OAuthApplication
 from pretix.base.channels import get_all_sales_channels
 from pretix.base.email import get_email_context
@@ -132,6 +134,7 @@ def reactivate_order(order: Order, force: bool=False, user: User=None, auth=None
                 for position in order.positions.all():
                     if position.voucher:
                         Voucher.objects.filter(pk=position.voucher.pk).update(redeemed=Greatest(0, F('redeemed') + 1))
+                        record_objects([position.voucher])
 
                     for gc in position.issued_gift_cards.all():
                         gc = GiftCard.objects.select_for_update().get(pk=gc.pk)
@@ -307,6 +310,7 @@ def deny_order(order, comment='', user=None, send_mail: bool=True, auth=None):
         for position in order.positions.all():
             if position.voucher:
                 Voucher.objects.filter(pk=position.voucher.pk).update(redeemed=Greatest(0, F('redeemed') - 1))
+                record_objects([position.voucher])
 
     order_denied.send(order.event, order=order)
 
@@ -373,6 +377,7 @@ def _cancel_order(order, user=None, send_mail: bool=True, api_token=None, device
                 for position in order.positions.all():
                     if position.voucher:
                         Voucher.objects.filter(pk=position.voucher.pk).update(redeemed=Greatest(0, F('redeemed') - 1))
+                        record_objects([position.voucher])
                     position.canceled = True
                     assign_ticket_secret(
                         event=order.event, position=position, force_invalidate_if_revokation_list_used=True, force_invalidate=False, save=False
@@ -417,6 +422,7 @@ def _cancel_order(order, user=None, send_mail: bool=True, api_token=None, device
                 )
                 if position.voucher:
                     Voucher.objects.filter(pk=position.voucher.pk).update(redeemed=Greatest(0, F('redeemed') - 1))
+                    record_objects([position.voucher])
 
         order.log_action('pretix.event.order.canceled', user=user, auth=api_token or oauth_application or device,
                          data={'cancellation_fee': cancellation_fee})
@@ -888,6 +894,19 @@ def _order_placed_email_attendee(event: Event, order: Order, position: OrderPosi
         logger.exception('Order received email could not be sent to attendee')
 
 
+def _lock_quotas_for_positions(event, positions):
+    """
+    Returns all quotas that could be affected by creating an order from the given cart positions. This is a
+    superset of the quotas actually checked, since we do not look at variations here.
+    """
+    item_ids = {p.item_id for p in positions}
+    subevent_ids = {p.subevent_id for p in positions}
+    return [
+        q for q in Quota.objects.filter(event=event, items__id__in=item_ids).distinct()
+        if q.subevent_id in subevent_ids
+    ]
+
+
 def _perform_order(event: Event, payment_provider: str, position_ids: List[str],
                    email: str, locale: str, address: int, meta_info: dict=None, sales_channel: str='web',
                    gift_cards: list=None, shown_total=None):
@@ -933,6 +952,15 @@ def _perform_order(event: Event, payment_provider: str, position_ids: List[str],
         # creating this order shouldn't be prone to any race conditions and we don't need to lock the event.
         locked = True
         lockfn = event.lock
+        if settings.LOCK_FINE_GRAINED:
+            # Only needed to pick the locks, the whole event is locked otherwise
+            lock_positions = list(positions.select_related('seat', 'voucher'))
+            lockfn = partial(
+                event.lock,
+                quotas=_lock_quotas_for_positions(event, lock_positions),
+                seats=[p.seat for p in lock_positions if p.seat],
+                vouchers=[p.voucher for p in lock_positions if p.voucher],
+            )
 
     with lockfn() as now_dt:
         positions = list(
@@ -1712,6 +1740,7 @@ class OrderChangeManager:
                     opa.canceled = True
                     if opa.voucher:
                         Voucher.objects.filter(pk=opa.voucher.pk).update(redeemed=Greatest(0, F('redeemed') - 1))
+                        record_objects([opa.voucher])
                     assign_ticket_secret(
                         event=self.event, position=op.position, force_invalidate_if_revokation_list_used=True, force_invalidate=False, save=False
                     )
@@ -1727,6 +1756,7 @@ class OrderChangeManager:
                 op.position.canceled = True
                 if op.position.voucher:
                     Voucher.objects.filter(pk=op.position.voucher.pk).update(redeemed=Greatest(0, F('redeemed') - 1))
+                    record_objects([op.position.voucher])
                 assign_ticket_secret(
                     event=self.event, position=op.position, force_invalidate_if_revokation_list_used=True, force_invalidate=False, save=False
                 )
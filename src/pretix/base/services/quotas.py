@@ -1,10 +1,11 @@
+import logging
 import sys
 from collections import Counter, defaultdict
 from datetime import timedelta
 from itertools import zip_longest
 
 from django.conf import settings
-from django.db import OperationalError, models
+from django.db import OperationalError, connection, models, transaction
 from django.db.models import (
     Case, Count, F, Func, Max, OuterRef, Q, Subquery, Sum, Value, When,
 )
@@ -13,14 +14,16 @@ from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
 from pretix.base.models import (
-    CartPosition, Checkin, Event, LogEntry, Order, OrderPosition, Quota,
-    Voucher, WaitingListEntry,
+    CartPosition, Checkin, Event, LogEntry, Order, OrderPosition,
+    OrderPositionCounter, Quota, Voucher, WaitingListEntry,
 )
 from pretix.celery_app import app
 
 from ...helpers.periodic import minimum_interval
 from ..signals import periodic_task, quota_availability
 
+logger = logging.getLogger(__name__)
+
 
 class QuotaAvailability:
     """
@@ -43,6 +46,12 @@ class QuotaAvailability:
     * count_vouchers (dict mapping quotas to ints)
     * count_waitinglist (dict mapping quotas to ints)
     * count_cart (dict mapping quotas to ints)
+
+    If ``PRETIX_QUOTA_COUNTERS`` is enabled, the number of paid and pending orders is read from
+    :py:class:`pretix.base.models.OrderPositionCounter` instead of being counted from all order
+    positions, as long as the counters of the event have been built at least once. Quotas with
+    ``release_after_exit`` set are always counted from the order positions, since the counters do
+    not know about check-ins.
     """
 
     def __init__(self, count_waitinglist=True, ignore_closed=False, full_results=False, early_out=True):
@@ -212,6 +221,50 @@ class QuotaAvailability:
                     raise ValueError("inconclusive quota")
 
     def _compute_orders(self, quotas, q_items, q_vars, size_left):
+        counted_quotas = []
+        if settings.PRETIX_QUOTA_COUNTERS:
+            counted_quotas = [
+                q for q in quotas if not q.release_after_exit and q.event.settings.quota_counters_synced
+            ]
+        if counted_quotas:
+            self._apply_order_lines(
+                counted_quotas, self._order_lines_from_counters(counted_quotas, q_items, q_vars), size_left
+            )
+        remaining_quotas = [q for q in quotas if q not in counted_quotas]
+        if remaining_quotas:
+            self._apply_order_lines(
+                remaining_quotas, self._order_lines_from_positions(remaining_quotas, q_items, q_vars), size_left
+            )
+
+    def _order_lines_from_counters(self, quotas, q_items, q_vars):
+        events = {q.event_id for q in quotas}
+        subevents = {q.subevent_id for q in quotas}
+        seq = Q(subevent_id__in=subevents)
+        if None in subevents:
+            seq |= Q(subevent__isnull=True)
+        c_lookup = OrderPositionCounter.objects.filter(
+            event_id__in=events,
+            status__in=[Order.STATUS_PAID, Order.STATUS_PENDING],
+        ).filter(seq).filter(
+            Q(
+                Q(variation_id__isnull=True) &
+                Q(item_id__in={i['item_id'] for i in q_items if self._quota_objects[i['quota_id']] in quotas})
+            ) | Q(
+                variation_id__in={i['itemvariation_id'] for i in q_vars if self._quota_objects[i['quota_id']] in quotas})
+        ).order_by().values('status', 'item_id', 'subevent_id', 'variation_id').annotate(c=Sum('count'))
+        return [
+            {
+                'order__status': line['status'],
+                'item_id': line['item_id'],
+                'subevent_id': line['subevent_id'],
+                'variation_id': line['variation_id'],
+                'is_exited': 0,
+                'c': line['c'],
+            }
+            for line in c_lookup
+        ]
+
+    def _order_lines_from_positions(self, quotas, q_items, q_vars):
         events = {q.event_id for q in quotas}
         subevents = {q.subevent_id for q in quotas}
         seq = Q(subevent_id__in=subevents)
@@ -261,14 +314,17 @@ class QuotaAvailability:
             op_lookup = op_lookup.annotate(
                 is_exited=Value(0, output_field=models.IntegerField())
             )
-        op_lookup = op_lookup.values('order__status', 'item_id', 'subevent_id', 'variation_id', 'is_exited').annotate(c=Count('*'))
-        for line in sorted(op_lookup, key=lambda li: (int(li['is_exited']), li['order__status']), reverse=True):  # p before n, exited before non-exited
+        return op_lookup.values('order__status', 'item_id', 'subevent_id', 'variation_id', 'is_exited').annotate(c=Count('*'))
+
+    def _apply_order_lines(self, quotas, lines, size_left):
+        quotas = set(quotas)
+        for line in sorted(lines, key=lambda li: (int(li['is_exited']), li['order__status']), reverse=True):  # p before n, exited before non-exited
             if line['variation_id']:
                 qs = self._var_to_quotas[line['variation_id']]
             else:
                 qs = self._item_to_quotas[line['item_id']]
             for q in qs:
-                if q.subevent_id == line['subevent_id']:
+                if q.subevent_id == line['subevent_id'] and q in quotas:
                     if line['order__status'] == Order.STATUS_PAID:
                         self.count_paid_orders[q] += line['c']
                         q.cached_availability_paid_orders = self.count_paid_orders[q]
@@ -445,3 +501,85 @@ def refresh_quota_caches():
             qa = QuotaAvailability(early_out=False)
             qa.queue(*[q for q in qs if q is not None])
             qa.compute()
+
+
+def rebuild_position_counters(event):
+    """
+    Compares the :py:class:`pretix.base.models.OrderPositionCounter` objects of an event with the
+    order positions actually stored and repairs all counters that differ. Returns the number of
+    repaired counters. Once this has run for an event, the counters will be used to compute
+    quota availability.
+
+    Orders can be placed and changed while this runs. A transaction that has changed a counter but is not
+    committed yet keeps that counter row locked, so we skip all locked rows and leave their combinations
+    alone until the next run. All other rows stay locked by us until we are done. Any change to them that is
+    not committed yet, including the order positions it belongs to, can therefore only be committed after
+    us and is neither part of the stored nor of the actual numbers.
+    """
+    with transaction.atomic():
+        locked = set(OrderPositionCounter.objects.filter(event=event).select_for_update(
+            skip_locked=connection.features.has_select_for_update_skip_locked
+        ).order_by('pk').values_list('pk', flat=True))
+
+        actual = Counter()
+        op_lookup = OrderPosition.objects.filter(
+            order__event=event,
+            order__status__in=OrderPositionCounter.COUNTED_STATUSES,
+        ).order_by().values('order__status', 'subevent_id', 'item_id', 'variation_id').annotate(c=Count('*'))
+        for line in op_lookup:
+            actual[line['subevent_id'], line['item_id'], line['variation_id'], line['order__status']] = line['c']
+
+        # Rows we did not lock are either locked by someone else or have been created since we locked the
+        # others, in both cases the order positions they count might or might not be part of ``actual``.
+        stored = Counter()
+        busy = set()
+        for c in OrderPositionCounter.objects.filter(event=event):
+            key = c.subevent_id, c.item_id, c.variation_id, c.status
+            if c.pk in locked:
+                stored[key] += c.count
+            else:
+                busy.add(key)
+
+        drifted = [k for k in set(actual) | set(stored) if actual[k] != stored[k] and k not in busy]
+        for subevent_id, item_id, variation_id, status in drifted:
+            # Rows created after we looked at them count positions that are not part of ``actual``, so we keep them
+            OrderPositionCounter.objects.filter(
+                event=event, subevent_id=subevent_id, item_id=item_id, variation_id=variation_id, status=status,
+                pk__in=locked,
+            ).delete()
+        OrderPositionCounter.objects.bulk_create([
+            OrderPositionCounter(
+                event=event, subevent_id=subevent_id, item_id=item_id, variation_id=variation_id, status=status,
+                count=actual[subevent_id, item_id, variation_id, status]
+            )
+            for subevent_id, item_id, variation_id, status in drifted
+            if actual[subevent_id, item_id, variation_id, status]
+        ])
+
+    if not event.settings.quota_counters_synced:
+        event.settings.quota_counters_synced = now()
+    elif drifted:
+        logger.warning('Repaired %d drifted position counters for event %d.', len(drifted), event.pk)
+    return len(drifted)
+
+
+@receiver(signal=periodic_task)
+@minimum_interval(minutes_after_success=60)
+def reconcile_position_counters_periodic(sender, **kwargs):
+    if settings.PRETIX_QUOTA_COUNTERS:
+        reconcile_position_counters.apply()
+
+
+@app.task
+@scopes_disabled()
+def reconcile_position_counters():
+    active = LogEntry.objects.using(settings.DATABASE_REPLICA).filter(
+        datetime__gt=now() - timedelta(days=7)
+    ).order_by().values_list('event', flat=True).distinct()
+    for event_id in active:
+        try:
+            e = Event.objects.get(pk=event_id)
+        except Event.DoesNotExist:
+            continue
+
+        rebuild_position_counters(e)
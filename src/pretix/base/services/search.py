@@ -0,0 +1,168 @@
+"""
+Maintains the :py:class:`OrderSearchIndex` and searches it.
+
+Every time an order, one of its positions, its invoice address or one of its invoices is saved, the index entry
+of the order is rebuilt after the transaction has been committed. Orders that have been created before the
+index existed are added by a periodic task. Until that task has seen every order once, searches fall back to
+looking at the original tables. The same task also rebuilds the entries of all orders modified since its last run,
+in case an update after a commit has been lost.
+"""
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import (
+    Invoice, InvoiceAddress, Order, OrderPosition, OrderSearchIndex,
+)
+from pretix.base.settings import GlobalSettingsObject
+from pretix.base.signals import periodic_task
+from pretix.helpers.database import OnCommitQueue, connect_models
+from pretix.helpers.iter import chunked_iterable
+from pretix.helpers.periodic import minimum_interval
+
+BATCH_SIZE = 1000
+BACKFILL_SIZE = 20000
+
+# Fields that are part of the index, saves that only touch other fields do not require an update
+INDEXED_FIELDS = {
+    Order: {'email', 'comment'},
+    OrderPosition: {'attendee_name_cached', 'attendee_email', 'secret', 'pseudonymization_id', 'voucher',
+                    'canceled', 'order'},
+    InvoiceAddress: {'name_cached', 'company', 'order'},
+    Invoice: {'invoice_no', 'full_invoice_no', 'order'},
+}
+
+
+# Prefixes of the lines in ``OrderSearchIndex.keys``
+KEY_PREFIX = 'p:'  # matched from the start
+KEY_EXACT = 'x:'  # matched as a whole
+
+
+def get_search_text(order: Order) -> str:
+    parts = [
+        order.email,
+        order.comment,
+    ]
+    try:
+        parts += [order.invoice_address.name_cached, order.invoice_address.company]
+    except InvoiceAddress.DoesNotExist:
+        pass
+    for p in order.positions.all():
+        parts += [p.attendee_name_cached, p.attendee_email, p.voucher.code if p.voucher else None]
+    return '\n'.join(p for p in parts if p).lower()
+
+
+def get_search_keys(order: Order) -> str:
+    keys = []
+    for i in order.invoices.all():
+        keys += [(KEY_EXACT, i.invoice_no), (KEY_EXACT, i.full_invoice_no)]
+    for p in order.positions.all():
+        keys += [(KEY_PREFIX, p.secret), (KEY_PREFIX, p.pseudonymization_id)]
+    # Every line starts and ends with a line break, so that we can anchor the search to both
+    return ''.join('\n' + prefix + value for prefix, value in keys if value).lower() + '\n'
+
+
+@scopes_disabled()
+def update_search_index(order_ids) -> None:
+    """
+    Rebuilds the index entries of the given orders.
+    """
+    for ids in chunked_iterable(order_ids, BATCH_SIZE):
+        orders = Order.objects.filter(pk__in=ids).select_related('event', 'invoice_address').prefetch_related(
+            'invoices',
+            Prefetch('positions', queryset=OrderPosition.objects.select_related('voucher'))
+        )
+        entries = [OrderSearchIndex(order=o, text=get_search_text(o), keys=get_search_keys(o)) for o in orders]
+        with transaction.atomic():
+            OrderSearchIndex.objects.filter(order_id__in=ids).delete()
+            OrderSearchIndex.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def search_index_ready() -> bool:
+    return GlobalSettingsObject().settings.get('order_search_index_ready', as_type=bool, default=False)
+
+
+def order_search_q(query: str):
+    """
+    Returns a ``Q`` object on orders that matches the same orders as the search on the original tables, or
+    ``None`` if the index is not complete yet and the caller needs to search the original tables instead.
+    """
+    if not search_index_ready():
+        return None
+
+    if "-" in query:
+        code = (Q(event__slug__icontains=query.rsplit("-", 1)[0])
+                & Q(code__icontains=Order.normalize_code(query.rsplit("-", 1)[1])))
+    else:
+        code = Q(code__icontains=Order.normalize_code(query))
+
+    q = query.lower()
+    matching = OrderSearchIndex.objects.filter(
+        Q(text__contains=q)
+        | Q(keys__contains='\n' + KEY_PREFIX + q)
+        | Q(keys__contains='\n' + KEY_EXACT + q + '\n')
+        | Q(keys__contains='\n' + KEY_EXACT + q.zfill(5) + '\n')
+    ).values('order_id')
+    return code | Q(pk__in=matching)
+
+
+_queue = OnCommitQueue(update_search_index, 'order search index')
+
+
+def _object_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not (set(update_fields) & INDEXED_FIELDS[sender]):
+        return
+    order_id = instance.pk if sender is Order else instance.order_id
+    if order_id is not None:
+        _queue.add(order_ids=[order_id])
+
+
+connect_models(post_save, _object_changed, INDEXED_FIELDS)
+# The index entry of a deleted order is deleted with it
+connect_models(post_delete, _object_changed, [m for m in INDEXED_FIELDS if m is not Order])
+
+
+# Orders only become visible once their transaction is committed, which might be a while after their modification
+# date has been set.
+RECHECK_OVERLAP = timedelta(minutes=5)
+
+
+def update_modified_orders() -> None:
+    """
+    Rebuilds the index entries of all orders that have been modified since the last call.
+    """
+    gs = GlobalSettingsObject()
+    until = now()
+    since = gs.settings.get('order_search_index_checked_until', as_type=datetime)
+    if since:
+        with scopes_disabled():
+            update_search_index(list(Order.objects.filter(
+                last_modified__gte=since - RECHECK_OVERLAP
+            ).order_by().values_list('pk', flat=True)))
+    gs.settings.set('order_search_index_checked_until', until)
+
+
+def build_search_index(limit=None) -> int:
+    """
+    Adds up to ``limit`` orders that are not in the index yet. Once no order is missing, searches start
+    to use the index. Returns the number of orders added.
+    """
+    with scopes_disabled():
+        qs = Order.objects.filter(search_index__isnull=True).order_by().values_list('pk', flat=True)
+        missing = list(qs[:limit] if limit else qs)
+    update_search_index(missing)
+    if (not limit or len(missing) < limit) and not search_index_ready():
+        GlobalSettingsObject().settings.set('order_search_index_ready', True)
+    return len(missing)
+
+
+@receiver(signal=periodic_task)
+@minimum_interval(minutes_after_success=5)
+def build_search_index_periodic(sender, **kwargs):
+    update_modified_orders()
+    build_search_index(limit=BACKFILL_SIZE)
@@ -11,6 +11,7 @@ from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
 from pretix.base.models import CachedFile, Event, cachedfile_name
+from pretix.base.services.search import update_search_index
 from pretix.base.services.tasks import ProfiledEventTask
 from pretix.base.shredder import ShredError
 from pretix.celery_app import app
@@ -90,5 +91,8 @@ def shred(event: Event, fileid: str, confirm_code: str) -> None:
     for shredder in shredders:
         shredder.shred_data()
 
+    # Shredders update the data in bulk, so the search index would still contain the old data
+    update_search_index(event.orders.order_by().values_list('pk', flat=True).iterator())
+
     cf.file.delete(save=False)
     cf.delete()
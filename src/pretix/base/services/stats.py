@@ -1,17 +1,40 @@
+from collections import defaultdict
 from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from typing import Any, Dict, Iterable, List, Tuple
 
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import (
-    Case, Count, DateTimeField, F, Max, OuterRef, Subquery, Sum, Value, When,
+    Case, Count, DateTimeField, F, Max, OuterRef, Q, Subquery, Sum, Value,
+    When,
 )
-from django.utils.timezone import make_aware
+from django.db.models.functions import Trunc
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import make_aware, now
 from django.utils.translation import gettext_lazy as _
+from django_scopes import scopes_disabled
 
-from pretix.base.models import Event, Item, ItemCategory, Order, OrderPosition
+from pretix.base.models import (
+    Event, Event_SettingsStore, Item, ItemCategory, Order, OrderPosition,
+    OutdatedSalesRollup, SalesRollup, SalesRollupLock, StatisticsRollup,
+)
 from pretix.base.models.event import SubEvent
 from pretix.base.models.orders import OrderFee, OrderPayment
-from pretix.base.signals import order_fee_type_name
+from pretix.base.settings import GlobalSettingsObject
+from pretix.base.services.tasks import EventTask
+from pretix.base.signals import order_fee_type_name, periodic_task
+from pretix.celery_app import app
+from pretix.helpers.database import OnCommitQueue, connect_models
+from pretix.helpers.periodic import minimum_interval
+
+# Fields that change the numbers in the rollups, saves that only touch other fields do not require an update
+ROLLUP_FIELDS = {
+    Order: {'status', 'require_approval', 'total'},
+    OrderPosition: {'item', 'variation', 'subevent', 'price', 'tax_value', 'canceled', 'order'},
+    OrderPayment: {'state', 'payment_date', 'order'},
+}
 
 
 class DummyObject:
@@ -75,6 +98,272 @@ def dictsum(*dicts) -> dict:
     return res
 
 
+def _status_case(canceled_position=Order.STATUS_CANCELED):
+    return Case(
+        When(order__status='n', order__require_approval=True, then=Value('unapproved')),
+        When(canceled=True, then=Value(canceled_position)),
+        default=F('order__status')
+    )
+
+
+def _day_bounds(event: Event, day: date) -> Tuple[datetime, datetime]:
+    start = make_aware(datetime.combine(day, time(hour=0, minute=0, second=0, microsecond=0)), event.timezone)
+    return start, make_aware(datetime.combine(
+        day + timedelta(days=1), time(hour=0, minute=0, second=0, microsecond=0)
+    ), event.timezone)
+
+
+def _days_q(event: Event, days, field: str) -> Q:
+    q = Q()
+    for d in days:
+        start, end = _day_bounds(event, d)
+        q |= Q(**{field + '__gte': start, field + '__lt': end})
+    return q
+
+
+def _compute_rollup(event: Event, days=None) -> List[SalesRollup]:
+    qs = OrderPosition.all.filter(order__event=event)
+    if days is not None:
+        qs = qs.filter(_days_q(event, days, 'order__datetime'))
+    rows = qs.annotate(
+        status=_status_case(canceled_position=SalesRollup.STATUS_CANCELED_POSITION),
+        day=Trunc('order__datetime', 'day', output_field=DateTimeField(), tzinfo=event.timezone),
+    ).values(
+        'subevent', 'item', 'variation', 'status', 'day'
+    ).annotate(cnt=Count('id'), price_sum=Sum('price'), tax_sum=Sum('tax_value')).order_by()
+    return [
+        SalesRollup(
+            event=event, subevent_id=r['subevent'], item_id=r['item'], variation_id=r['variation'],
+            status=r['status'], date=r['day'].astimezone(event.timezone).date(), count=r['cnt'],
+            price=r['price_sum'], tax_value=r['tax_sum'],
+        )
+        for r in rows
+    ]
+
+
+def _compute_statistics(event: Event, days=None) -> List[StatisticsRollup]:
+    tz = event.timezone
+    p_date = OrderPayment.objects.filter(
+        order=OuterRef('pk'),
+        state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED),
+        payment_date__isnull=False
+    ).values('order').annotate(
+        m=Max('payment_date')
+    ).values(
+        'm'
+    ).order_by()
+    oqs = Order.objects.filter(event=event)
+    if days is not None:
+        oqs = oqs.filter(_days_q(event, days, 'datetime'))
+
+    rows = defaultdict(lambda: [0, Decimal('0.00')])
+    orders = {}
+    for o in oqs.annotate(
+            payment_date=Subquery(p_date, output_field=DateTimeField())
+    ).values('pk', 'datetime', 'payment_date', 'status', 'total').order_by().iterator():
+        day = o['datetime'].astimezone(tz).date()
+        payment_day = o['payment_date'].astimezone(tz).date() if o['payment_date'] else None
+        paid = o['status'] == Order.STATUS_PAID and payment_day is not None
+        orders[o['pk']] = (day, payment_day, paid)
+        rows[None, day, payment_day][0] += 1
+        if paid:
+            rows[None, day, payment_day][1] += o['total']
+
+    if event.has_subevents:
+        counted = set()
+        for p in OrderPosition.objects.filter(
+                order_id__in=oqs.values('pk')
+        ).values('order_id', 'subevent_id', 'price').order_by().iterator():
+            if p['order_id'] not in orders or not p['subevent_id']:
+                # Placed after we looked at the orders
+                continue
+            day, payment_day, paid = orders[p['order_id']]
+            key = (p['subevent_id'], day, payment_day)
+            if (p['order_id'], p['subevent_id']) not in counted:
+                counted.add((p['order_id'], p['subevent_id']))
+                rows[key][0] += 1
+            if paid:
+                rows[key][1] += p['price']
+
+    return [
+        StatisticsRollup(
+            event=event, subevent_id=subevent, date=day, payment_date=payment_day, orders=cnt, revenue=revenue
+        )
+        for (subevent, day, payment_day), (cnt, revenue) in rows.items()
+    ]
+
+
+@scopes_disabled()
+def refresh_sales_rollup(event: Event, full=False) -> bool:
+    """
+    Recomputes all rows of the :py:class:`SalesRollup` and :py:class:`StatisticsRollup` of the given event
+    that have been marked as outdated. This blocks while another refresh of the same event is running, so
+    anything reading from the rollups should call :py:func:`sales_rollup_ready` instead, which leaves this
+    to a background task.
+
+    If the whole event is marked as outdated, nothing is recomputed and ``False`` is returned unless ``full``
+    is set, since that can take a while for large events. The periodic task and the ``build_sales_rollup``
+    command take care of those events.
+    """
+    outdated = OutdatedSalesRollup.objects.filter(event=event)
+    if not full and outdated.filter(date__isnull=True).exists():
+        return False
+    if not outdated.exists():
+        return True
+    with transaction.atomic():
+        # Concurrent refreshes of the same event would otherwise overwrite each other's rows. Marks are set
+        # after the order has been committed and removed before we look at the orders, so no change can
+        # slip through between reading the marks and reading the orders.
+        SalesRollupLock.objects.bulk_create([SalesRollupLock(event=event)], ignore_conflicts=True)
+        SalesRollupLock.objects.select_for_update().get(event=event)
+        outdated = list(OutdatedSalesRollup.objects.filter(event=event))
+        if not outdated:
+            return True
+        if any(o.date is None for o in outdated):
+            if not full:
+                return False
+            OutdatedSalesRollup.objects.filter(pk__in=[o.pk for o in outdated]).delete()
+            days = None
+            SalesRollup.objects.filter(event=event).delete()
+            StatisticsRollup.objects.filter(event=event).delete()
+        else:
+            OutdatedSalesRollup.objects.filter(pk__in=[o.pk for o in outdated]).delete()
+            days = {o.date for o in outdated}
+            SalesRollup.objects.filter(event=event, date__in=days).delete()
+            StatisticsRollup.objects.filter(event=event, date__in=days).delete()
+        SalesRollup.objects.bulk_create(_compute_rollup(event, days), batch_size=500)
+        StatisticsRollup.objects.bulk_create(_compute_statistics(event, days), batch_size=500)
+    return True
+
+
+def mark_sales_rollup_outdated(event: Event, day: date=None) -> None:
+    """
+    Marks the rollup of a day of the given event, or the whole event, as outdated. The rollup is then
+    recomputed the next time it is read.
+    """
+    OutdatedSalesRollup.objects.bulk_create([OutdatedSalesRollup(event=event, date=day)], ignore_conflicts=True)
+
+
+@scopes_disabled()
+def _mark_outdated(orders=(), days=(), events=()):
+    days = set(days) | set(Order.objects.filter(pk__in=orders).values_list('event_id', 'datetime'))
+    event_objects = Event.objects.in_bulk({e for e, d in days} | set(events))
+    marks = {(e, d.astimezone(event_objects[e].timezone).date()) for e, d in days if e in event_objects}
+    marks |= {(e, None) for e in events if e in event_objects}
+    OutdatedSalesRollup.objects.bulk_create(
+        [OutdatedSalesRollup(event_id=e, date=d) for e, d in marks], ignore_conflicts=True
+    )
+
+
+# Marks are only set after the commit, see refresh_sales_rollup
+_queue = OnCommitQueue(_mark_outdated, 'sales rollup')
+
+# Orders only become visible once their transaction is committed, which might be a while after their modification
+# date has been set.
+RECHECK_OVERLAP = timedelta(minutes=5)
+
+
+@scopes_disabled()
+def mark_modified_orders_outdated() -> None:
+    """
+    Marks the days of all orders that have been modified since the last call as outdated. Marks that have been
+    lost after the commit, e.g. because the process has been killed, are set again this way.
+    """
+    gs = GlobalSettingsObject()
+    until = now()
+    since = gs.settings.get('sales_rollup_checked_until', as_type=datetime)
+    if since:
+        _mark_outdated(days=Order.objects.filter(
+            last_modified__gte=since - RECHECK_OVERLAP
+        ).order_by().values_list('event_id', 'datetime').distinct())
+    gs.settings.set('sales_rollup_checked_until', until)
+
+
+def _object_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not (set(update_fields) & ROLLUP_FIELDS[sender]):
+        return
+    if sender is Order:
+        _queue.add(days=[(instance.event_id, instance.datetime)])
+    elif instance.order_id:
+        _queue.add(orders=[instance.order_id])
+
+
+connect_models(post_save, _object_changed, ROLLUP_FIELDS)
+connect_models(post_delete, _object_changed, ROLLUP_FIELDS)
+
+
+@receiver(pre_save, sender=Event_SettingsStore, dispatch_uid='sales_rollup_timezone')
+def _timezone_saved(sender, instance, **kwargs):
+    # The rollups are split into days of the event's timezone
+    if instance.key != 'timezone':
+        return
+    if instance.pk and sender.objects.filter(pk=instance.pk, value=instance.value).exists():
+        return
+    _queue.add(events=[instance.object_id])
+
+
+@receiver(post_delete, sender=Event_SettingsStore, dispatch_uid='sales_rollup_timezone_delete')
+def _timezone_deleted(sender, instance, **kwargs):
+    if instance.key == 'timezone':
+        _queue.add(events=[instance.object_id])
+
+
+REBUILD_TIMEOUT = 3600
+
+
+@app.task(base=EventTask)
+def rebuild_sales_rollup(event: Event):
+    try:
+        refresh_sales_rollup(event, full=True)
+    finally:
+        cache.delete('pretix_sales_rollup_rebuild_{}'.format(event.pk))
+
+
+def schedule_sales_rollup_refresh(event: Event, full=False) -> None:
+    """
+    Refreshes the outdated rollups of the given event in a background task. While a run is waiting or running,
+    further calls do not schedule another one. Rebuilding whole events can take a while, e.g. for all events at
+    once after an upgrade, so those runs go to the background queue.
+    """
+    # The key expires on its own in case the task is lost, so that later changes are not ignored forever.
+    if cache.add('pretix_sales_rollup_rebuild_{}'.format(event.pk), True, REBUILD_TIMEOUT):
+        if full:
+            rebuild_sales_rollup.apply_async(kwargs={'event': event.pk}, queue='background')
+        else:
+            rebuild_sales_rollup.apply_async(kwargs={'event': event.pk})
+
+
+def sales_rollup_ready(event: Event) -> bool:
+    """
+    Returns ``True`` if the rollups of the given event may be read. Anything reading from the rollups needs to
+    call this first. Outdated days are refreshed in the background, so the rollups may lag behind the orders for
+    a moment, but reading them never waits for a refresh. If the whole event is outdated, ``False`` is returned
+    until it has been rebuilt.
+    """
+    marks = list(OutdatedSalesRollup.objects.filter(event=event).order_by(
+        F('date').asc(nulls_first=True)
+    ).values_list('date', flat=True)[:1])
+    if not marks:
+        return True
+    full = marks[0] is None
+    schedule_sales_rollup_refresh(event, full=full)
+    return not full
+
+
+@receiver(signal=periodic_task)
+@minimum_interval(minutes_after_success=5)
+@scopes_disabled()
+def refresh_sales_rollups_periodic(sender, **kwargs):
+    mark_modified_orders_outdated()
+    rebuild = set(OutdatedSalesRollup.objects.filter(date__isnull=True).values_list('event_id', flat=True))
+    for event in Event.objects.filter(pk__in=OutdatedSalesRollup.objects.values('event_id')):
+        if event.pk in rebuild:
+            # This must not block the other periodic tasks
+            schedule_sales_rollup_refresh(event, full=True)
+        else:
+            refresh_sales_rollup(event, full=True)
+
+
 def order_overview(
         event: Event, subevent: SubEvent=None, date_filter='', date_from=None, date_until=None, fees=False,
         admission_only=False
@@ -85,13 +374,12 @@ def order_overview(
         'variations'
     ).order_by('category__position', 'category_id', 'position', 'name')
 
-    qs = OrderPosition.all
-    if subevent:
-        qs = qs.filter(subevent=subevent)
     if admission_only:
-        qs = qs.filter(item__admission=True)
         items = items.filter(admission=True)
 
+    day_from = date_from.date() if isinstance(date_from, datetime) else date_from
+    day_until = date_until.date() if isinstance(date_until, datetime) else date_until
+
     if date_from and isinstance(date_from, date):
         date_from = make_aware(datetime.combine(
             date_from,
@@ -104,36 +392,52 @@ def order_overview(
             time(hour=0, minute=0, second=0, microsecond=0)
         ), event.timezone)
 
-    if date_filter == 'order_date':
-        if date_from:
-            qs = qs.filter(order__datetime__gte=date_from)
-        if date_until:
-            qs = qs.filter(order__datetime__lt=date_until)
-    elif date_filter == 'last_payment_date':
-        p_date = OrderPayment.objects.filter(
-            order=OuterRef('order'),
-            state__in=[OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED],
-            payment_date__isnull=False
-        ).values('order').annotate(
-            m=Max('payment_date')
-        ).values('m').order_by()
-        qs = qs.annotate(payment_date=Subquery(p_date, output_field=DateTimeField()))
-        if date_from:
-            qs = qs.filter(payment_date__gte=date_from)
-        if date_until:
-            qs = qs.filter(payment_date__lt=date_until)
-
-    counters = qs.filter(
-        order__event=event
-    ).annotate(
-        status=Case(
-            When(order__status='n', order__require_approval=True, then=Value('unapproved')),
-            When(canceled=True, then=Value('c')),
-            default=F('order__status')
-        )
-    ).values(
-        'item', 'variation', 'status'
-    ).annotate(cnt=Count('id'), price=Sum('price'), tax_value=Sum('tax_value')).order_by()
+    p_date = OrderPayment.objects.filter(
+        order=OuterRef('order'),
+        state__in=[OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED],
+        payment_date__isnull=False
+    ).values('order').annotate(
+        m=Max('payment_date')
+    ).values('m').order_by()
+
+    # The rollup does not know about payments, so we need to look at every order position when filtering by
+    # payment date or while the rollup of the event is being built
+    if date_filter == 'last_payment_date' or not sales_rollup_ready(event):
+        qs = OrderPosition.all.filter(order__event=event)
+        if subevent:
+            qs = qs.filter(subevent=subevent)
+        if admission_only:
+            qs = qs.filter(item__admission=True)
+        if date_filter == 'order_date':
+            if date_from:
+                qs = qs.filter(order__datetime__gte=date_from)
+            if date_until:
+                qs = qs.filter(order__datetime__lt=date_until)
+        elif date_filter == 'last_payment_date':
+            qs = qs.annotate(payment_date=Subquery(p_date, output_field=DateTimeField()))
+            if date_from:
+                qs = qs.filter(payment_date__gte=date_from)
+            if date_until:
+                qs = qs.filter(payment_date__lt=date_until)
+        counters = qs.annotate(
+            status=_status_case()
+        ).values(
+            'item', 'variation', 'status'
+        ).annotate(cnt=Count('id'), price=Sum('price'), tax_value=Sum('tax_value')).order_by()
+    else:
+        qs = SalesRollup.objects.filter(event=event)
+        if subevent:
+            qs = qs.filter(subevent=subevent)
+        if admission_only:
+            qs = qs.filter(item__admission=True)
+        if date_filter == 'order_date':
+            if day_from:
+                qs = qs.filter(date__gte=day_from)
+            if day_until:
+                qs = qs.filter(date__lte=day_until)
+        counters = qs.values(
+            'item', 'variation', 'status'
+        ).annotate(cnt=Sum('count'), price=Sum('price'), tax_value=Sum('tax_value')).order_by()
 
     states = {
         'unapproved': 'unapproved',
@@ -142,12 +446,16 @@ def order_overview(
         'pending': Order.STATUS_PENDING,
         'expired': Order.STATUS_EXPIRED,
     }
-    num = {}
-    for l, s in states.items():
-        num[l] = {
-            (p['item'], p['variation']): (p['cnt'], p['price'], p['price'] - p['tax_value'])
-            for p in counters if p['status'] == s
-        }
+    num = {l: {} for l in states}
+    for p in counters:
+        # Canceled positions and positions of canceled orders are shown together
+        status = Order.STATUS_CANCELED if p['status'] == SalesRollup.STATUS_CANCELED_POSITION else p['status']
+        for l, s in states.items():
+            if status == s:
+                key = (p['item'], p['variation'])
+                num[l][key] = tuplesum([
+                    num[l].get(key, (0, 0, 0)), (p['cnt'], p['price'], p['price'] - p['tax_value'])
+                ])
 
     num['total'] = dictsum(num['pending'], num['paid'])
 
@@ -199,11 +507,7 @@ def order_overview(
         qs = OrderFee.all.filter(
             order__event=event
         ).annotate(
-            status=Case(
-                When(order__status='n', order__require_approval=True, then=Value('unapproved')),
-                When(canceled=True, then=Value('c')),
-                default=F('order__status')
-            )
+            status=_status_case()
         )
         if date_filter == 'order_date':
             if date_from:
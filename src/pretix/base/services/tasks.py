@@ -17,16 +17,44 @@ from django.db import transaction
 from django_scopes import scope, scopes_disabled
 
 from pretix.base.metrics import (
-    pretix_task_duration_seconds, pretix_task_runs_total,
+    pretix_task_cache_requests_total, pretix_task_db_queries,
+    pretix_task_db_seconds, pretix_task_duration_seconds,
+    pretix_task_redis_calls, pretix_task_runs_total,
 )
 from pretix.base.models import Event, Organizer, User
 from pretix.celery_app import app
+from pretix.helpers.metrics.instrumentation import Instrumentation
+from pretix.helpers.profile.sampling import get_profiler
 
 
 class ProfiledTask(app.Task):
     def __call__(self, *args, **kwargs):
+        if settings.INSTRUMENTATION_ENABLED:
+            with Instrumentation() as i:
+                ret, tottime = self._profiled_call(*args, **kwargs)
+            i.check_budget('Task {}'.format(self.name))
+            if settings.METRICS_ENABLED:
+                pretix_task_db_queries.observe(i.queries, task_name=self.name)
+                pretix_task_db_seconds.observe(i.db_time, task_name=self.name)
+                pretix_task_redis_calls.observe(i.redis_calls, task_name=self.name)
+                if i.cache_hits:
+                    pretix_task_cache_requests_total.inc(i.cache_hits, task_name=self.name, result='hit')
+                if i.cache_misses:
+                    pretix_task_cache_requests_total.inc(i.cache_misses, task_name=self.name, result='miss')
+        else:
+            ret, tottime = self._profiled_call(*args, **kwargs)
+
+        if settings.METRICS_ENABLED:
+            pretix_task_duration_seconds.observe(tottime, task_name=self.name)
+        return ret
 
-        if settings.PROFILING_RATE > 0 and random.random() < settings.PROFILING_RATE / 100:
+    def _profiled_call(self, *args, **kwargs):
+        if settings.PROFILING_SAMPLING:
+            with get_profiler().profile('task:' + self.name):
+                t0 = time.perf_counter()
+                ret = super().__call__(*args, **kwargs)
+                tottime = time.perf_counter() - t0
+        elif settings.PROFILING_RATE > 0 and random.random() < settings.PROFILING_RATE / 100:
             profiler = cProfile.Profile()
             profiler.enable()
             t0 = time.perf_counter()
@@ -40,10 +68,7 @@ class ProfiledTask(app.Task):
             t0 = time.perf_counter()
             ret = super().__call__(*args, **kwargs)
             tottime = time.perf_counter() - t0
-
-        if settings.METRICS_ENABLED:
-            pretix_task_duration_seconds.observe(tottime, task_name=self.name)
-        return ret
+        return ret, tottime
 
     def on_failure(self, exc, task_id, args, kwargs, einfo):
         if settings.METRICS_ENABLED:
@@ -1,7 +1,12 @@
 import logging
 import os
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from django.dispatch import receiver
 from django.utils.timezone import now
 from django.utils.translation import gettext as _
 from django_scopes import scopes_disabled
@@ -13,7 +18,9 @@ from pretix.base.models import (
 )
 from pretix.base.services.tasks import EventTask, ProfiledTask
 from pretix.base.settings import PERSON_NAME_SCHEMES
-from pretix.base.signals import allow_ticket_download, register_ticket_outputs
+from pretix.base.signals import (
+    allow_ticket_download, order_paid, register_ticket_outputs,
+)
 from pretix.celery_app import app
 from pretix.helpers.database import rolledback_transaction
 
@@ -23,9 +30,12 @@ logger = logging.getLogger(__name__)
 def generate_orderposition(order_position: int, provider: str):
     order_position = OrderPosition.objects.select_related('order', 'order__event').get(id=order_position)
 
+    # Read before rendering, so the file counts as outdated if the cache is invalidated in the meantime
+    generation = order_position.order.event.settings.ticket_cache_generation
+
     with language(order_position.order.locale, order_position.order.event.settings.region):
         responses = register_ticket_outputs.send(order_position.order.event)
-        for receiver, response in responses:
+        for recv, response in responses:
             prov = response(order_position.order.event)
             if prov.identifier == provider:
                 filename, ttype, data = prov.generate(order_position)
@@ -33,17 +43,18 @@ def generate_orderposition(order_position: int, provider: str):
                 for ct in CachedTicket.objects.filter(order_position=order_position, provider=provider):
                     ct.delete()
                 ct = CachedTicket.objects.create(order_position=order_position, provider=provider,
-                                                 extension=ext, type=ttype, file=None)
+                                                 extension=ext, type=ttype, file=None, generation=generation)
                 ct.file.save(filename, ContentFile(data))
                 return ct.pk
 
 
 def generate_order(order: int, provider: str):
     order = Order.objects.select_related('event').get(id=order)
+    generation = order.event.settings.ticket_cache_generation
 
     with language(order.locale, order.event.settings.region):
         responses = register_ticket_outputs.send(order.event)
-        for receiver, response in responses:
+        for recv, response in responses:
             prov = response(order.event)
             if prov.identifier == provider:
                 filename, ttype, data = prov.generate_order(order)
@@ -54,7 +65,7 @@ def generate_order(order: int, provider: str):
                 for ct in CachedCombinedTicket.objects.filter(order=order, provider=provider):
                     ct.delete()
                 ct = CachedCombinedTicket.objects.create(order=order, provider=provider, extension=ext,
-                                                         type=ttype, file=None)
+                                                         type=ttype, file=None, generation=generation)
                 ct.file.save(filename, ContentFile(data))
                 return ct.pk
 
@@ -96,7 +107,7 @@ def preview(event: int, provider: str):
         InvoiceAddress.objects.create(order=order, name_parts=sample, company=_("Sample company"))
 
         responses = register_ticket_outputs.send(event)
-        for receiver, response in responses:
+        for recv, response in responses:
             prov = response(event)
             if prov.identifier == provider:
                 return prov.generate(p)
@@ -111,7 +122,7 @@ def get_tickets_for_order(order, base_position=None):
 
     providers = [
         response(order.event)
-        for receiver, response
+        for recv, response
         in register_ticket_outputs.send(order.event)
     ]
 
@@ -132,7 +143,7 @@ def get_tickets_for_order(order, base_position=None):
             try:
                 if len(positions) == 0:
                     continue
-                ct = CachedCombinedTicket.objects.filter(
+                ct = CachedCombinedTicket.objects.current(order.event).filter(
                     order=order, provider=p.identifier, file__isnull=False
                 ).last()
                 if not ct or not ct.file:
@@ -151,7 +162,7 @@ def get_tickets_for_order(order, base_position=None):
         else:
             for pos in positions:
                 try:
-                    ct = CachedTicket.objects.filter(
+                    ct = CachedTicket.objects.current(order.event).filter(
                         order_position=pos, provider=p.identifier, file__isnull=False
                     ).last()
                     if not ct or not ct.file:
@@ -186,22 +197,140 @@ def get_tickets_for_order(order, base_position=None):
 
 
 @app.task(base=EventTask, acks_late=True)
-def invalidate_cache(event: Event, item: int=None, provider: str=None, order: int=None, **kwargs):
-    qs = CachedTicket.objects.filter(order_position__order__event=event)
-    qsc = CachedCombinedTicket.objects.filter(order__event=event)
+def invalidate_cache(event: Event, item: int=None, provider: str=None, order: int=None, regenerate: bool=False,
+                     **kwargs):
+    """
+    Marks cached ticket files as outdated. The files themselves are deleted later by a periodic task.
+
+    With ``TICKET_PREGENERATE``, the tickets of an order are rendered again right away. Tickets of a whole
+    event or item are only rendered again if ``regenerate`` is set, which callers do when the ticket layout
+    or output settings changed and not for every other change that happens to affect tickets.
+    """
+    if not item and not order:
+        # Invalidating all files of an event only takes a single write. This also invalidates the files of
+        # other providers, which is cheaper than touching every file of the provider.
+        event.settings.ticket_cache_generation = event.settings.ticket_cache_generation + 1
+    else:
+        qs = CachedTicket.objects.filter(order_position__order__event=event)
+        qsc = CachedCombinedTicket.objects.filter(order__event=event)
+
+        if item:
+            qs = qs.filter(order_position__item_id=item)
+
+        if provider:
+            qs = qs.filter(provider=provider)
+            qsc = qsc.filter(provider=provider)
+
+        if order:
+            qs = qs.filter(order_position__order_id=order)
+            qsc = qsc.filter(order_id=order)
+
+        # Generations are never negative, so these files are outdated no matter what happens to the event
+        qs.update(generation=-1)
+        qsc.update(generation=-1)
+
+    if settings.TICKET_PREGENERATE:
+        if order:
+            pregenerate_order.apply_async(args=(order, provider))
+        elif regenerate:
+            schedule_pregenerate_event(event, item)
+
+
+PREGENERATE_EVENT_DELAY = 60
+
+
+def _pregenerate_event_key(event: Event, item: int=None):
+    return 'pretix_pregenerate_event_{}_{}'.format(event.pk, item or 'all')
+
+
+def schedule_pregenerate_event(event: Event, item: int=None):
+    """
+    Renders all tickets of an event, or only the tickets of orders containing ``item``, again after a short
+    delay. While a run is waiting, further calls do not schedule another one, so editing a layout several times
+    in a row only renders the tickets once.
+    """
+    # The key expires on its own in case the task is lost, so that later changes are not ignored forever.
+    if cache.add(_pregenerate_event_key(event, item), True, PREGENERATE_EVENT_DELAY * 10):
+        pregenerate_event.apply_async(kwargs={'event': event.pk, 'item': item}, countdown=PREGENERATE_EVENT_DELAY)
+
+
+def pregenerate_queryset(event: Event):
+    """
+    Returns all orders of an event whose tickets can be downloaded now or as soon as the download date is
+    reached.
+    """
+    q = Q(status=Order.STATUS_PAID)
+    if event.settings.ticket_download_pending:
+        q |= Q(status=Order.STATUS_PENDING, require_approval=False)
+    else:
+        q |= Q(status=Order.STATUS_PENDING, require_approval=False, total=0)
+    return event.orders.filter(q)
+
+
+def pregenerate(order: Order, provider: str=None) -> int:
+    """
+    Renders all ticket files of an order that are not cached yet, for all enabled ticket outputs or only
+    for the output ``provider``. Returns the number of files that have been rendered.
+    """
+    if not order.event.settings.ticket_download:
+        return 0
+    positions = list(order.positions_with_tickets)
+    if not positions:
+        return 0
+
+    cached = set(CachedTicket.objects.current(order.event).filter(
+        order_position__order=order, file__isnull=False
+    ).values_list('order_position_id', 'provider'))
+    cached_combined = set(CachedCombinedTicket.objects.current(order.event).filter(
+        order=order, file__isnull=False
+    ).values_list('provider', flat=True))
+
+    rendered = 0
+    for recv, response in register_ticket_outputs.send(order.event):
+        prov = response(order.event)
+        if not prov.is_enabled or (provider and prov.identifier != provider):
+            continue
+        try:
+            if prov.multi_download_enabled and prov.identifier not in cached_combined:
+                if generate_order(order.pk, prov.identifier):
+                    rendered += 1
+            for pos in positions:
+                if (pos.pk, prov.identifier) not in cached:
+                    if generate_orderposition(pos.pk, prov.identifier):
+                        rendered += 1
+        except:
+            logger.exception('Failed to pre-generate ticket.')
+    return rendered
 
-    if item:
-        qs = qs.filter(order_position__item_id=item)
 
-    if provider:
-        qs = qs.filter(provider=provider)
-        qsc = qsc.filter(provider=provider)
+@app.task(base=ProfiledTask, rate_limit=settings.TICKET_PREGENERATE_RATE_LIMIT)
+def pregenerate_order(order: int, provider: str=None):
+    with scopes_disabled():
+        event = Event.objects.filter(orders__pk=order).first()
+        if not event:
+            return
+        # Orders whose tickets can never be downloaded, e.g. canceled ones, are skipped here instead of in every
+        # place that invalidates their tickets.
+        order = pregenerate_queryset(event).select_related('event').filter(pk=order).first()
+        if not order:
+            return
+        pregenerate(order, provider)
+
+
+@app.task(base=EventTask)
+def pregenerate_event(event: Event, provider: str=None, item: int=None):
+    # Changes made from now on need another run, as this one might already have passed their orders.
+    cache.delete(_pregenerate_event_key(event, item))
+    qs = pregenerate_queryset(event)
+    if item:
+        qs = qs.filter(all_positions__item_id=item).distinct()
+    # Tickets of freshly paid orders are rendered in the default queue, re-rendering a whole event
+    # must not delay them.
+    for pk in qs.order_by('pk').values_list('pk', flat=True).iterator():
+        pregenerate_order.apply_async(args=(pk, provider), queue='background')
 
-    if order:
-        qs = qs.filter(order_position__order_id=order)
-        qsc = qsc.filter(order_id=order)
 
-    for ct in qs:
-        ct.delete()
-    for ct in qsc:
-        ct.delete()
+@receiver(order_paid, dispatch_uid="pretixbase_order_paid_pregenerate_tickets")
+def pregenerate_on_payment(sender: Event, order: Order, **kwargs):
+    if settings.TICKET_PREGENERATE:
+        transaction.on_commit(lambda: pregenerate_order.apply_async(args=(order.pk,)))
@@ -2216,7 +2216,15 @@ Your {event} team"""))
         'form_kwargs': dict(
             label=_("Show button to copy user input from other products"),
         ),
-    }
+    },
+    'quota_counters_synced': {
+        'default': None,
+        'type': datetime
+    },
+    'ticket_cache_generation': {
+        'default': '0',
+        'type': int
+    },
 }
 SETTINGS_AFFECTING_CSS = {
     'primary_color', 'theme_color_success', 'theme_color_danger', 'primary_font',
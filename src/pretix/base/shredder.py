@@ -9,6 +9,7 @@ from django.dispatch import receiver
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
+from pretix.api.changes import record_objects
 from pretix.api.serializers.order import (
     AnswerSerializer, InvoiceAddressSerializer,
 )
@@ -172,7 +173,9 @@ class EmailAddressShredder(BaseDataShredder):
 
     @transaction.atomic
     def shred_data(self):
-        OrderPosition.all.filter(order__event=self.event, attendee_email__isnull=False).update(attendee_email=None)
+        positions = OrderPosition.all.filter(order__event=self.event, attendee_email__isnull=False)
+        record_objects(positions.select_related('order').iterator())
+        positions.update(attendee_email=None)
 
         for o in self.event.orders.all():
             o.email = None
@@ -253,13 +256,15 @@ class AttendeeInfoShredder(BaseDataShredder):
 
     @transaction.atomic
     def shred_data(self):
-        OrderPosition.all.filter(
+        positions = OrderPosition.all.filter(
             order__event=self.event
         ).filter(
             Q(attendee_name_cached__isnull=False) | Q(attendee_name_parts__isnull=False) |
             Q(company__isnull=False) | Q(street__isnull=False) | Q(zipcode__isnull=False) | Q(city__isnull=False)
-        ).update(attendee_name_cached=None, attendee_name_parts={'_shredded': True}, company=None, street=None,
-                 zipcode=None, city=None)
+        )
+        record_objects(positions.select_related('order').iterator())
+        positions.update(attendee_name_cached=None, attendee_name_parts={'_shredded': True}, company=None,
+                         street=None, zipcode=None, city=None)
 
         for le in self.event.logentry_set.filter(action_type="pretix.event.order.modified").exclude(data=""):
             d = le.parsed_data
@@ -22,6 +22,7 @@ from pretix.base.models import (
     Item, Order, OrderPayment, OrderPosition, OrderRefund, Organizer, Question,
     QuestionAnswer, SubEvent,
 )
+from pretix.base.services.search import order_search_q
 from pretix.base.signals import register_payment_providers
 from pretix.control.forms.widgets import Select2
 from pretix.control.signals import order_search_filter_q
@@ -178,42 +179,45 @@ class OrderFilterForm(FilterForm):
         if fdata.get('query'):
             u = fdata.get('query')
 
-            if "-" in u:
-                code = (Q(event__slug__icontains=u.rsplit("-", 1)[0])
-                        & Q(code__icontains=Order.normalize_code(u.rsplit("-", 1)[1])))
-            else:
-                code = Q(code__icontains=Order.normalize_code(u))
-
-            matching_invoices = Invoice.objects.filter(
-                Q(invoice_no__iexact=u)
-                | Q(invoice_no__iexact=u.zfill(5))
-                | Q(full_invoice_no__iexact=u)
-            ).values_list('order_id', flat=True)
-            matching_positions = OrderPosition.objects.filter(
-                Q(
-                    Q(attendee_name_cached__icontains=u) | Q(attendee_email__icontains=u)
-                    | Q(secret__istartswith=u)
-                    | Q(pseudonymization_id__istartswith=u)
-                )
-            ).values_list('order_id', flat=True)
-            matching_invoice_addresses = InvoiceAddress.objects.filter(
-                Q(
-                    Q(name_cached__icontains=u) | Q(company__icontains=u)
+            mainq = order_search_q(u)
+            if mainq is None:
+                # The search index is still being built
+                if "-" in u:
+                    code = (Q(event__slug__icontains=u.rsplit("-", 1)[0])
+                            & Q(code__icontains=Order.normalize_code(u.rsplit("-", 1)[1])))
+                else:
+                    code = Q(code__icontains=Order.normalize_code(u))
+
+                matching_invoices = Invoice.objects.filter(
+                    Q(invoice_no__iexact=u)
+                    | Q(invoice_no__iexact=u.zfill(5))
+                    | Q(full_invoice_no__iexact=u)
+                ).values_list('order_id', flat=True)
+                matching_positions = OrderPosition.objects.filter(
+                    Q(
+                        Q(attendee_name_cached__icontains=u) | Q(attendee_email__icontains=u)
+                        | Q(secret__istartswith=u)
+                        | Q(pseudonymization_id__istartswith=u)
+                    )
+                ).values_list('order_id', flat=True)
+                matching_invoice_addresses = InvoiceAddress.objects.filter(
+                    Q(
+                        Q(name_cached__icontains=u) | Q(company__icontains=u)
+                    )
+                ).values_list('order_id', flat=True)
+                matching_orders = Order.objects.filter(
+                    code
+                    | Q(email__icontains=u)
+                    | Q(comment__icontains=u)
+                ).values_list('id', flat=True)
+
+                mainq = (
+                    Q(pk__in=matching_orders)
+                    | Q(pk__in=matching_invoices)
+                    | Q(pk__in=matching_positions)
+                    | Q(pk__in=matching_invoice_addresses)
+                    | Q(pk__in=matching_invoices)
                 )
-            ).values_list('order_id', flat=True)
-            matching_orders = Order.objects.filter(
-                code
-                | Q(email__icontains=u)
-                | Q(comment__icontains=u)
-            ).values_list('id', flat=True)
-
-            mainq = (
-                Q(pk__in=matching_orders)
-                | Q(pk__in=matching_invoices)
-                | Q(pk__in=matching_positions)
-                | Q(pk__in=matching_invoice_addresses)
-                | Q(pk__in=matching_invoices)
-            )
             for recv, q in order_search_filter_q.send(sender=getattr(self, 'event', None), query=u):
                 mainq = mainq | q
             qs = qs.filter(
@@ -10,6 +10,7 @@ from django.urls import reverse
 from django.utils.translation import gettext_lazy as _, pgettext_lazy
 from django_scopes.forms import SafeModelChoiceField
 
+from pretix.api.changes import record_objects
 from pretix.base.email import get_available_placeholders
 from pretix.base.forms import I18nModelForm, PlaceholderValidator
 from pretix.base.models import Item, Voucher
@@ -399,4 +400,5 @@ class VoucherBulkForm(VoucherForm):
             # We need to query them again as bulk_create does not fill in .pk values on databases
             # other than PostgreSQL
             objs.append(v)
+        record_objects(objs)
         return objs
@@ -5,7 +5,7 @@ import pytz
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.db.models import (
-    Count, Exists, IntegerField, Max, Min, OuterRef, Prefetch, Q, Subquery,
+    Count, Exists, F, IntegerField, Max, Min, OuterRef, Prefetch, Q, Subquery,
     Sum,
 )
 from django.db.models.functions import Coalesce, Greatest
@@ -23,9 +23,10 @@ from django.utils.translation import gettext_lazy as _, pgettext, ungettext
 from pretix.base.decimal import round_decimal
 from pretix.base.models import (
     Item, ItemVariation, Order, OrderPosition, OrderRefund, RequiredAction,
-    SubEvent, Voucher, WaitingListEntry,
+    SalesRollup, SubEvent, Voucher, WaitingListEntry,
 )
 from pretix.base.services.quotas import QuotaAvailability
+from pretix.base.services.stats import sales_rollup_ready
 from pretix.base.timeline import timeline_for_event
 from pretix.control.forms.event import CommentForm
 from pretix.control.signals import (
@@ -49,28 +50,31 @@ def base_widgets(sender, subevent=None, lazy=False, **kwargs):
             (Q(available_from__isnull=True) | Q(available_from__lte=now()))
         ).count()
 
-        if subevent:
-            opqs = OrderPosition.objects.filter(subevent=subevent)
-        else:
-            opqs = OrderPosition.objects
-
-        tickc = opqs.filter(
-            order__event=sender, item__admission=True,
-            order__status__in=(Order.STATUS_PAID, Order.STATUS_PENDING),
-        ).count()
-
-        paidc = opqs.filter(
-            order__event=sender, item__admission=True,
-            order__status=Order.STATUS_PAID,
-        ).count()
-
-        if subevent:
-            rev = opqs.filter(
-                order__event=sender, order__status=Order.STATUS_PAID
-            ).aggregate(
-                sum=Sum('price')
-            )['sum'] or Decimal('0.00')
+        if sales_rollup_ready(sender):
+            rollup = SalesRollup.objects.filter(event=sender)
+            if subevent:
+                rollup = rollup.filter(subevent=subevent)
+            rollup = rollup.values('status', 'item__admission').annotate(cnt=Sum('count'), price=Sum('price'))
         else:
+            # The rollup of the event is still being built
+            rollup = OrderPosition.objects.filter(order__event=sender)
+            if subevent:
+                rollup = rollup.filter(subevent=subevent)
+            rollup = rollup.annotate(status=F('order__status')).values('status', 'item__admission').annotate(
+                cnt=Count('id'), price=Sum('price')
+            )
+        tickc = paidc = 0
+        rev = Decimal('0.00')
+        for r in rollup.order_by():
+            if r['item__admission'] and r['status'] in (Order.STATUS_PAID, Order.STATUS_PENDING, 'unapproved'):
+                tickc += r['cnt']
+            if r['item__admission'] and r['status'] == Order.STATUS_PAID:
+                paidc += r['cnt']
+            if r['status'] == Order.STATUS_PAID:
+                rev += r['price']
+
+        if not subevent:
+            # Includes fees, which are not part of the rollup
             rev = Order.objects.filter(
                 event=sender,
                 status=Order.STATUS_PAID
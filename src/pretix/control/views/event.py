@@ -791,7 +791,9 @@ class TicketSettings(EventSettingsViewMixin, EventPermissionRequiredMixin, FormV
                             for k in provider.form.changed_data
                         }
                     )
-                    tickets.invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'provider': provider.identifier})
+                    tickets.invalidate_cache.apply_async(kwargs={'event': self.request.event.pk,
+                                                                 'provider': provider.identifier,
+                                                                 'regenerate': True})
             else:
                 success = False
         form = self.get_form(self.get_form_class())
@@ -1,16 +1,19 @@
+import hashlib
 from datetime import datetime, time
+from functools import wraps
 
 import pytz
 from dateutil.parser import parse
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.db.models import Max, Min, Q
 from django.db.models.functions import Coalesce, Greatest
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils.formats import date_format, get_format
 from django.utils.timezone import make_aware
-from django.utils.translation import gettext as _, pgettext
+from django.utils.translation import get_language, gettext as _, pgettext
 
 from pretix.base.models import (
     EventMetaProperty, EventMetaValue, ItemMetaProperty, ItemMetaValue,
@@ -21,6 +24,42 @@ from pretix.control.permissions import event_permission_required
 from pretix.helpers.daterange import daterange
 from pretix.helpers.i18n import i18ncomp
 
+# Typeahead views are called on every keystroke, so we cache their responses for a short time. Responses that
+# depend on the user's permissions are only cached for a few seconds, as we have no way to invalidate them when
+# team memberships change. Responses of event-level views are the same for everyone who can see the event and
+# are invalidated together with the event's cache whenever something in the event changes.
+USER_CACHE_TTL = 10
+EVENT_CACHE_TTL = 60
+
+
+def cached_typeahead(per_user=True):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(request, *args, **kwargs):
+            params = sorted(
+                # Every lookup is case-insensitive, so "Foo" and "foo" can share a cache entry
+                (k, v.lower() if k in ('query', 'q') else v) for k, v in request.GET.items()
+            )
+            key = 'typeahead:{}:{}:{}'.format(
+                func.__name__, get_language(),
+                hashlib.sha1(repr(params).encode()).hexdigest()
+            )
+            if per_user:
+                key += ':{}:{}'.format(
+                    request.user.pk, request.user.has_active_staff_session(request.session.session_key)
+                )
+            c = request.event.cache if getattr(request, 'event', None) and not per_user else cache
+            content = c.get(key)
+            if content is None:
+                response = func(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                content = response.content.decode()
+                c.set(key, content, USER_CACHE_TTL if per_user else EVENT_CACHE_TTL)
+            return HttpResponse(content, content_type='application/json')
+        return wrapper
+    return decorator
+
 
 def serialize_user(u):
     return {
@@ -97,6 +136,7 @@ def serialize_voucher(v):
     }
 
 
+@cached_typeahead()
 def event_list(request):
     query = request.GET.get('query', '')
     try:
@@ -112,7 +152,10 @@ def event_list(request):
     qs = qs.filter(
         Q(name__icontains=i18ncomp(query)) | Q(slug__icontains=query) |
         Q(organizer__name__icontains=i18ncomp(query)) | Q(organizer__slug__icontains=query)
-    ).annotate(
+    )
+    # Count before annotating, otherwise the database needs to aggregate the subevents of every match
+    total = qs.count()
+    qs = qs.annotate(
         min_from=Min('subevents__date_from'),
         max_from=Max('subevents__date_from'),
         max_to=Max('subevents__date_to'),
@@ -121,7 +164,6 @@ def event_list(request):
         order_from=Coalesce('min_from', 'date_from'),
     ).order_by('-order_from')
 
-    total = qs.count()
     pagesize = 20
     offset = (page - 1) * pagesize
     doc = {
@@ -135,6 +177,7 @@ def event_list(request):
     return JsonResponse(doc)
 
 
+@cached_typeahead()
 def nav_context_list(request):
     query = request.GET.get('query', '').strip()
     organizer = request.GET.get('organizer', None)
@@ -146,7 +189,9 @@ def nav_context_list(request):
 
     qs_events = request.user.get_events_with_any_permission(request).filter(
         Q(name__icontains=i18ncomp(query)) | Q(slug__icontains=query)
-    ).annotate(
+    )
+    total_events = qs_events.count()
+    qs_events = qs_events.annotate(
         min_from=Min('subevents__date_from'),
         max_from=Max('subevents__date_from'),
         max_to=Max('subevents__date_to'),
@@ -193,7 +238,7 @@ def nav_context_list(request):
     ) or (
         query and request.user.fullname and query.lower() in request.user.fullname.lower()
     )
-    total = qs_events.count() + qs_orga.count()
+    total = total_events + qs_orga.count()
     pagesize = 20
     offset = (page - 1) * pagesize
     results = ([
@@ -230,6 +275,7 @@ def nav_context_list(request):
 
 
 @event_permission_required(None)
+@cached_typeahead(per_user=False)
 def subevent_select2(request, **kwargs):
     query = request.GET.get('query', '')
     try:
@@ -280,6 +326,7 @@ def subevent_select2(request, **kwargs):
 
 
 @event_permission_required(None)
+@cached_typeahead(per_user=False)
 def quotas_select2(request, **kwargs):
     query = request.GET.get('query', '')
     try:
@@ -327,6 +374,7 @@ def quotas_select2(request, **kwargs):
 
 
 @event_permission_required(None)
+@cached_typeahead(per_user=False)
 def items_select2(request, **kwargs):
     query = request.GET.get('query', '')
     try:
@@ -579,6 +627,7 @@ def organizer_select2(request):
     return JsonResponse(doc)
 
 
+@cached_typeahead()
 def users_select2(request):
     if not request.user.has_active_staff_session(request.session.session_key):
         raise PermissionDenied()
@@ -611,6 +660,7 @@ def users_select2(request):
     return JsonResponse(doc)
 
 
+@cached_typeahead()
 def meta_values(request):
     q = request.GET.get('q')
     propname = request.GET.get('property')
@@ -632,12 +682,12 @@ def meta_values(request):
 
         defaults = defaults.filter(organizer_id=organizer.pk)
         matches = matches.filter(event__organizer_id=organizer.pk)
-        all_access = (
-            (request and request.user.has_active_staff_session(request.session.session_key))
-            or request.user.teams.filter(all_events=True, organizer=organizer).exists()
-        )
-        if not all_access:
-            matches = matches.filter(event__id__in=request.user.teams.values_list('limit_events__id', flat=True))
+        if not request.user.has_active_staff_session(request.session.session_key):
+            matches = matches.filter(
+                Q(event__organizer_id__in=request.user.teams.filter(
+                    all_events=True, organizer=organizer).values_list('organizer', flat=True))
+                | Q(event__id__in=request.user.teams.values_list('limit_events__id', flat=True))
+            )
 
     else:
         # We ignore superuser permissions here. This is intentional – we do not want to show super
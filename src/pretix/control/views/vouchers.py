@@ -19,7 +19,8 @@ from django.views.generic import (
     CreateView, DeleteView, ListView, TemplateView, UpdateView, View,
 )
 
-from pretix.base.models import CartPosition, LogEntry, OrderPosition, Voucher
+from pretix.base.models import CartPosition, OrderPosition, Voucher
+from pretix.base.models.base import log_batch
 from pretix.base.models.vouchers import _generate_random_code
 from pretix.base.services.vouchers import vouchers_send
 from pretix.control.forms.filter import VoucherFilterForm, VoucherTagFilterForm
@@ -321,15 +322,12 @@ class VoucherBulkCreate(EventPermissionRequiredMixin, CreateView):
 
     @transaction.atomic
     def form_valid(self, form):
-        log_entries = []
         objs = form.save(self.request.event)
         voucherids = []
-        for v in objs:
-            log_entries.append(
-                v.log_action('pretix.voucher.added', data=form.cleaned_data, user=self.request.user, save=False)
-            )
-            voucherids.append(v.pk)
-        LogEntry.objects.bulk_create(log_entries, batch_size=200)
+        with log_batch():
+            for v in objs:
+                v.log_action('pretix.voucher.added', data=form.cleaned_data, user=self.request.user)
+                voucherids.append(v.pk)
 
         if form.cleaned_data['send']:
             vouchers_send.apply_async(kwargs={
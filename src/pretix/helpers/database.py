@@ -1,9 +1,14 @@
 import contextlib
+import logging
+import threading
+from collections import defaultdict
 
 from django.db import transaction
 from django.db.models import Aggregate, Field, Lookup
 from django.db.models.expressions import OrderBy
 
+logger = logging.getLogger(__name__)
+
 
 class DummyRollbackException(Exception):
     pass
@@ -105,3 +110,49 @@ class NotEqual(Lookup):
         rhs, rhs_params = self.process_rhs(compiler, connection)
         params = lhs_params + rhs_params
         return '%s <> %s' % (lhs, rhs), params
+
+
+class OnCommitQueue:
+    """
+    Collects items in thread-local sets while a transaction is running and passes all of them to ``callback``
+    once the transaction has been committed, e.g. to update a denormalized copy of the changed data in one go.
+    Every keyword argument of :py:meth:`add` is a separate set, which ``callback`` receives as a keyword
+    argument of the same name. Errors in ``callback`` are logged, so they never break the change itself. Items
+    are also lost if the process ends right after the commit, so anything relying on this needs a way to catch
+    up, e.g. a periodic task that looks at the objects that have been modified since its last run.
+
+    If the transaction is rolled back, the items stay in the sets and are passed on after the next commit,
+    so ``callback`` needs to cope with items that have not changed at all.
+    """
+
+    def __init__(self, callback, description):
+        self.callback = callback
+        self.description = description
+        self._local = threading.local()
+
+    def add(self, **items):
+        if not hasattr(self._local, 'pending'):
+            self._local.pending = defaultdict(set)
+        for key, values in items.items():
+            self._local.pending[key].update(values)
+        transaction.on_commit(self.flush)
+
+    def flush(self):
+        pending = getattr(self._local, 'pending', None)
+        if not pending:
+            return
+        self._local.pending = defaultdict(set)
+        try:
+            self.callback(**pending)
+        except Exception:
+            logger.exception('Could not update the %s', self.description)
+
+
+def connect_models(signal, receiver, models):
+    """
+    Connects ``receiver`` to ``signal`` for each of the given models.
+    """
+    for model in models:
+        signal.connect(receiver, sender=model, dispatch_uid='{}.{}_{}'.format(
+            receiver.__module__, receiver.__name__, model.__name__
+        ))
@@ -12,6 +12,8 @@ In particular, we changed:
 * Full test coverage
 * Fully passing tests against shared tests suite at 2020-04-19
 * Option to add custom operations
+* Option to compile rules into a tree of Python closures
+* Static analysis of the variables used by rules
 """
 import logging
 from functools import reduce
@@ -177,6 +179,48 @@ operations = {
 }
 
 
+ARRAY_OPERATIONS = ('none', 'all', 'some', 'reduce', 'map', 'filter')
+
+
+def used_variables(tests):
+    """
+    Returns the set of variable names that the given rules might read from the data passed to them, or
+    ``None`` if this can't be determined statically, e.g. because a variable name is computed.
+    Variables that are read from the elements of an array operation are not included.
+    """
+    if tests is None or not isinstance(tests, dict):
+        return set()
+
+    operator = list(tests.keys())[0]
+    values = tests[operator]
+    if not isinstance(values, list) and not isinstance(values, tuple):
+        values = [values]
+
+    if operator in ARRAY_OPERATIONS:
+        # The second argument is evaluated with the array elements as data
+        values = [v for i, v in enumerate(values) if i != 1]
+    elif operator in ('var', 'missing', 'missing_some'):
+        if any(isinstance(v, dict) for v in values):
+            return None
+        if operator == 'var':
+            names = values[:1]
+        elif operator == 'missing':
+            names = values[0] if values and isinstance(values[0], list) else values
+        else:
+            names = values[1] if len(values) > 1 else []
+        if any(n == "" or n is None for n in names):
+            return None
+        return {str(n).split('.')[0] for n in names}
+
+    result = set()
+    for v in values:
+        u = used_variables(v)
+        if u is None:
+            return None
+        result |= u
+    return result
+
+
 class Logic():
     def __init__(self):
         self._operations = {}
@@ -242,3 +286,73 @@ class Logic():
             return self._operations[operator](*values)
         else:
             raise ValueError("Unrecognized operation %s" % operator)
+
+    def compile(self, tests):
+        """
+        Compiles the json-logic into a function that takes the data and returns the same result as
+        :py:meth:`apply`. Custom operations need to be added before compiling.
+        """
+        # You've recursed to a primitive, stop!
+        if tests is None or not isinstance(tests, dict):
+            return lambda data: tests
+
+        operator = list(tests.keys())[0]
+        values = tests[operator]
+
+        if not isinstance(values, list) and not isinstance(values, tuple):
+            values = [values]
+
+        args = [self.compile(val) for val in values]
+
+        # Array-level operations
+        if operator == 'none':
+            def f(data):
+                return not any(args[1](i) for i in args[0](data or {}))
+        elif operator == 'all':
+            def f(data):
+                elements = args[0](data or {})
+                if not elements:
+                    return False
+                return all(args[1](i) for i in elements)
+        elif operator == 'some':
+            def f(data):
+                return any(args[1](i) for i in args[0](data or {}))
+        elif operator == 'reduce':
+            def f(data):
+                data = data or {}
+                return reduce(
+                    lambda acc, el: args[1]({'current': el, 'accumulator': acc}),
+                    args[0](data) or [],
+                    args[2](data)
+                )
+        elif operator == 'map':
+            def f(data):
+                return [args[1](i) for i in (args[0](data or {}) or [])]
+        elif operator == 'filter':
+            def f(data):
+                return [i for i in args[0](data or {}) if args[1](i)]
+        else:
+            if operator == 'var':
+                func = get_var
+            elif operator == 'missing':
+                func = missing
+            elif operator == 'missing_some':
+                func = missing_some
+            elif operator in operations:
+                func = operations[operator]
+            elif operator in self._operations:
+                func = self._operations[operator]
+            else:
+                def func(*a):
+                    raise ValueError("Unrecognized operation %s" % operator)
+
+            if operator in ('var', 'missing', 'missing_some'):
+                def f(data):
+                    data = data or {}
+                    return func(data, *[a(data) for a in args])
+            else:
+                def f(data):
+                    data = data or {}
+                    return func(*[a(data) for a in args])
+
+        return f
@@ -0,0 +1,128 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_patched = False
+_MISSING = object()
+
+
+class Instrumentation:
+    """
+    Context manager that counts the database queries, the time spent in the database, cache hits and misses
+    and redis calls made by the current thread while it is active. Instrumentations can be nested, e.g.
+    for a task that runs eagerly within a request, in which case every active instrumentation counts.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.redis_calls = 0
+        self._stack = None
+
+    def __enter__(self):
+        _install_hooks()
+        if not hasattr(_local, 'active'):
+            _local.active = []
+        _local.active.append(self)
+        self._stack = ExitStack()
+        for conn in connections.all():
+            self._stack.enter_context(conn.execute_wrapper(self._execute_wrapper))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stack.close()
+        _local.active.remove(self)
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        t0 = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - t0
+
+    def check_budget(self, name):
+        """
+        Logs a warning if more queries than ``INSTRUMENTATION_QUERY_BUDGET`` have been executed.
+        """
+        if settings.INSTRUMENTATION_QUERY_BUDGET and self.queries > settings.INSTRUMENTATION_QUERY_BUDGET:
+            logger.warning('%s executed %d database queries (%.3fs), exceeding the budget of %d queries.',
+                           name, self.queries, self.db_time, settings.INSTRUMENTATION_QUERY_BUDGET)
+
+
+def _active():
+    return getattr(_local, 'active', ())
+
+
+def _count_cache_get(func):
+    @wraps(func)
+    def wrapper(self, key, default=None, *args, **kwargs):
+        value = func(self, key, _MISSING, *args, **kwargs)
+        if not getattr(_local, 'in_get_many', False):
+            for i in _active():
+                if value is _MISSING:
+                    i.cache_misses += 1
+                else:
+                    i.cache_hits += 1
+        return default if value is _MISSING else value
+    return wrapper
+
+
+def _count_cache_get_many(func):
+    @wraps(func)
+    def wrapper(self, keys, *args, **kwargs):
+        keys = list(keys)
+        # Some backends implement get_many through get
+        _local.in_get_many = True
+        try:
+            values = func(self, keys, *args, **kwargs)
+        finally:
+            _local.in_get_many = False
+        for i in _active():
+            i.cache_hits += len(values)
+            i.cache_misses += len(keys) - len(values)
+        return values
+    return wrapper
+
+
+def _count_redis_call(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        for i in _active():
+            i.redis_calls += 1
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _install_hooks():
+    """
+    Wraps the cache backends and the redis client once, so they report to the active instrumentations.
+    """
+    global _patched
+    if _patched:
+        return
+    _patched = True
+
+    from django.core.cache import caches
+
+    classes = {type(caches[alias]) for alias in settings.CACHES}
+    for cls in classes:
+        cls.get = _count_cache_get(cls.get)
+        cls.get_many = _count_cache_get_many(cls.get_many)
+
+    if settings.HAS_REDIS:
+        from redis.client import Pipeline, Redis
+
+        # Every command outside of a pipeline and every pipeline execution is one round trip
+        Redis.execute_command = _count_redis_call(Redis.execute_command)
+        Pipeline.execute = _count_redis_call(Pipeline.execute)
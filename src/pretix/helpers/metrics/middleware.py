@@ -1,8 +1,14 @@
 import time
 
+from django.conf import settings
 from django.urls import resolve
 
-from pretix.base.metrics import pretix_view_duration_seconds
+from pretix.base.metrics import (
+    pretix_view_cache_requests_total, pretix_view_db_queries,
+    pretix_view_db_seconds, pretix_view_duration_seconds,
+    pretix_view_redis_calls,
+)
+from pretix.helpers.metrics.instrumentation import Instrumentation
 
 
 class MetricsMiddleware(object):
@@ -32,3 +38,36 @@ class MetricsMiddleware(object):
                                              url_name=url.namespace + ':' + url.url_name)
 
         return resp
+
+
+class InstrumentationMiddleware(object):
+    """
+    Counts database queries, cache lookups and redis calls per view and logs a warning if a view exceeds
+    the query budget.
+    """
+    banlist = MetricsMiddleware.banlist
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for b in self.banlist:
+            if b in request.path:
+                return self.get_response(request)
+
+        with Instrumentation() as i:
+            resp = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = '{}:{}'.format(match.namespace, match.url_name) if match else 'unresolved'
+        i.check_budget('View {}'.format(url_name))
+        if settings.METRICS_ENABLED:
+            pretix_view_db_queries.observe(i.queries, url_name=url_name)
+            pretix_view_db_seconds.observe(i.db_time, url_name=url_name)
+            pretix_view_redis_calls.observe(i.redis_calls, url_name=url_name)
+            if i.cache_hits:
+                pretix_view_cache_requests_total.inc(i.cache_hits, url_name=url_name, result='hit')
+            if i.cache_misses:
+                pretix_view_cache_requests_total.inc(i.cache_misses, url_name=url_name, result='miss')
+
+        return resp
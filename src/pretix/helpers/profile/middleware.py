@@ -5,6 +5,8 @@ import time
 
 from django.conf import settings
 
+from pretix.helpers.profile.sampling import get_profiler
+
 
 class CProfileMiddleware(object):
     banlist = (
@@ -36,3 +38,22 @@ class CProfileMiddleware(object):
             return response
         else:
             return self.get_response(request)
+
+
+class SamplingProfilerMiddleware(object):
+    banlist = CProfileMiddleware.banlist
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        for b in self.banlist:
+            if b in request.path:
+                return self.get_response(request)
+
+        def label():
+            match = getattr(request, 'resolver_match', None)
+            return 'view:{}:{}'.format(match.namespace, match.url_name) if match else 'view:unresolved'
+
+        with get_profiler().profile(label):
+            return self.get_response(request)
@@ -0,0 +1,141 @@
+"""
+A statistical profiler that is cheap enough to run on all requests and tasks in production.
+
+A background thread looks at the stacks of all threads that are currently handling a request or task at a
+fixed interval and counts how often every stack has been seen. The counts are written regularly to files in
+``PROFILE_DIR`` in the "folded stacks" format that is understood by flame graph tools like ``flamegraph.pl``
+or speedscope. Every stack starts with the name of the view or task it was sampled in.
+"""
+import atexit
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+MAX_DEPTH = 128
+
+
+class SamplingProfiler:
+
+    def __init__(self, interval, write_interval, retention):
+        self.interval = interval
+        self.write_interval = write_interval
+        self.retention = retention
+        self.contexts = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.last_write = time.monotonic()
+        self.thread = None
+        self.pid = None
+
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # Threads do not survive a fork, so we need one sampler per process
+            self.pid = os.getpid()
+            self.counts = Counter()
+            self.contexts = {}
+            self.thread = threading.Thread(target=self.run, name='pretix-sampling-profiler', daemon=True)
+            self.thread.start()
+        atexit.register(self.write)
+
+    @contextmanager
+    def profile(self, label):
+        """
+        Samples the current thread while the context is active. ``label`` can be a string or a callable
+        returning a string, which is only evaluated when the context exits. Nested contexts on the same thread
+        do nothing, their samples are counted for the outermost context.
+        """
+        self.start()
+        ident = threading.get_ident()
+        stacks = Counter()
+        with self.lock:
+            if ident in self.contexts:
+                stacks = None
+            else:
+                self.contexts[ident] = stacks
+        if stacks is None:
+            yield
+            return
+        try:
+            yield
+        finally:
+            label = (label() if callable(label) else label).replace(';', ':')
+            with self.lock:
+                del self.contexts[ident]
+                for stack, count in stacks.items():
+                    self.counts[label + ';' + stack] += count
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self.lock:
+            for ident, stacks in self.contexts.items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    stack.append('{}:{}'.format(frame.f_globals.get('__name__', '?'), frame.f_code.co_name))
+                    frame = frame.f_back
+                stacks[';'.join(reversed(stack))] += 1
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+                if time.monotonic() - self.last_write >= self.write_interval:
+                    self.write()
+            except Exception:
+                logger.exception('Sampling profiler failed')
+
+    def write(self):
+        """
+        Appends the stacks collected since the last call to this hour's file of the current process and
+        removes files older than the retention period.
+        """
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.last_write = time.monotonic()
+        if not counts:
+            return
+
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        fname = os.path.join(settings.PROFILE_DIR, 'sampling_{}_{}.folded'.format(
+            time.strftime('%Y%m%d%H'), os.getpid()
+        ))
+        with open(fname, 'a') as f:
+            for stack, count in counts.items():
+                f.write('{} {}\n'.format(stack, count))
+
+        cutoff = time.time() - self.retention
+        for name in os.listdir(settings.PROFILE_DIR):
+            path = os.path.join(settings.PROFILE_DIR, name)
+            if name.startswith('sampling_') and name.endswith('.folded') and os.path.getmtime(path) < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+_profiler = None
+
+
+def get_profiler():
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(
+            interval=settings.PROFILING_SAMPLING_INTERVAL / 1000,
+            write_interval=60,
+            retention=settings.PROFILING_SAMPLING_RETENTION * 3600,
+        )
+    return _profiler
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.14 on 2026-10-18 08:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banktransfer', '0007_refundexport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bankimportjob',
+            name='transactions_processed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bankimportjob',
+            name='transactions_total',
+            field=models.IntegerField(null=True),
+        ),
+    ]
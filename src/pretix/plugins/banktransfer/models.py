@@ -23,6 +23,8 @@ class BankImportJob(models.Model):
     organizer = models.ForeignKey('pretixbase.Organizer', null=True, on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
     state = models.CharField(max_length=32, choices=STATES, default=STATE_PENDING)
+    transactions_total = models.IntegerField(null=True)
+    transactions_processed = models.IntegerField(default=0)
 
     class Meta:
         ordering = ('id',)
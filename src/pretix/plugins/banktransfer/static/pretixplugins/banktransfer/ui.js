@@ -170,6 +170,12 @@ var bankimport_transactionlist = {
     check_state: function () {
         $.getJSON($("[data-job-waiting-url]").attr("data-job-waiting-url"), function (data) {
             if (data.state == 'running' || data.state == 'pending') {
+                if (data.transactions_total) {
+                    var $progress = $("[data-job-progress]");
+                    $progress.text($progress.attr("data-job-progress-text")
+                        .replace("__processed__", data.transactions_processed)
+                        .replace("__total__", data.transactions_total));
+                }
                 window.setTimeout(bankimport_transactionlist.check_state, 750);
             } else {
                 location.reload();
@@ -20,10 +20,12 @@ from pretix.base.services.mail import SendMailException
 from pretix.base.services.orders import change_payment_provider
 from pretix.base.services.tasks import TransactionAwareTask
 from pretix.celery_app import app
+from pretix.helpers.iter import chunked_iterable
 
 from .models import BankImportJob, BankTransaction
 
 logger = logging.getLogger(__name__)
+BATCH_SIZE = 200
 
 
 def notify_incomplete_payment(o: Order):
@@ -65,34 +67,48 @@ def cancel_old_payments(order):
             )
 
 
-def _find_order_for_code(base_qs, code):
-    try_codes = [
+def _try_codes(code):
+    return [
         code,
         Order.normalize_code(code, is_fallback=True),
         code[:settings.ENTROPY['order_code']],
         Order.normalize_code(code[:settings.ENTROPY['order_code']], is_fallback=True)
     ]
-    for c in try_codes:
-        try:
-            return base_qs.get(code=c)
-        except Order.DoesNotExist:
-            pass
+
+
+def _find_orders(matches: list, event: Event = None, organizer: Organizer = None) -> dict:
+    """
+    Looks up all orders that any of the given ``(slug, code)`` matches could refer to at once. Returns a dictionary
+    mapping the order code, or a tuple of the upper-case event slug and the order code if no event is given, to
+    the order.
+    """
+    codes = {c for slug, code in matches for c in _try_codes(code)}
+    qs = event.orders.all() if event else Order.objects.filter(event__organizer=organizer).select_related('event')
+    known = {}
+    for chunk in chunked_iterable(codes, 500):
+        for o in qs.filter(code__in=chunk):
+            known[o.code if event else (o.event.slug.upper(), o.code)] = o
+    return known
+
+
+def _find_order_for_code(known: dict, slug, code, event: Event = None):
+    for c in _try_codes(code):
+        order = known.get(c if event else (slug.upper(), c))
+        if order:
+            return order
 
 
 @transaction.atomic
-def _handle_transaction(trans: BankTransaction, matches: tuple, event: Event = None, organizer: Organizer = None):
+def _handle_transaction(trans: BankTransaction, matches: tuple, event: Event = None, organizer: Organizer = None,
+                        known_orders: dict = None):
+    if known_orders is None:
+        known_orders = _find_orders(matches, event=event, organizer=organizer)
+
     orders = []
-    if event:
-        for slug, code in matches:
-            order = _find_order_for_code(event.orders, code)
-            if order and order.code not in {o.code for o in orders}:
-                orders.append(order)
-    else:
-        qs = Order.objects.filter(event__organizer=organizer)
-        for slug, code in matches:
-            order = _find_order_for_code(qs.filter(event__slug__iexact=slug), code)
-            if order and order.code not in {o.code for o in orders}:
-                orders.append(order)
+    for slug, code in matches:
+        order = _find_order_for_code(known_orders, slug, code, event=event)
+        if order and order.code not in {o.code for o in orders}:
+            orders.append(order)
 
     if not orders:
         # No match
@@ -228,12 +244,49 @@ def _get_unknown_transactions(job: BankImportJob, data: list, event: Event = Non
         trans.checksum = trans.calculate_checksum()
         if trans.checksum not in known_checksums:
             trans.state = BankTransaction.STATE_UNCHECKED
-            trans.save()
             transactions.append(trans)
 
+    BankTransaction.objects.bulk_create(transactions, batch_size=BATCH_SIZE)
+    if transactions and transactions[0].pk is None:
+        # Not every database returns the IDs of rows created in bulk, but we need them for the payment info
+        transactions = list(BankTransaction.objects.filter(
+            import_job=job, state=BankTransaction.STATE_UNCHECKED
+        ).order_by('pk'))
     return transactions
 
 
+def _handle_transactions(transactions: list, pattern, event: Event = None, organizer: Organizer = None):
+    """
+    Matches a batch of transactions with one query for all orders they could refer to. Every matched transaction
+    is still handled in a database transaction of its own, since confirming a payment releases the lock of the
+    event right away and its quota use must be committed by then.
+    """
+    matches = {
+        trans.pk: pattern.findall(trans.reference.replace(" ", "").replace("\n", "").upper())
+        for trans in transactions
+    }
+    known_orders = _find_orders([m for ms in matches.values() for m in ms], event=event, organizer=organizer)
+
+    nomatch = []
+    used = set()
+    for trans in transactions:
+        if not matches[trans.pk]:
+            trans.state = BankTransaction.STATE_NOMATCH
+            nomatch.append(trans)
+            continue
+
+        for slug, code in matches[trans.pk]:
+            order = _find_order_for_code(known_orders, slug, code, event=event)
+            if order and order.pk in used:
+                # A previous transaction of this batch might have paid it already
+                order.refresh_from_db()
+            elif order:
+                used.add(order.pk)
+        _handle_transaction(trans, matches[trans.pk], event=event, organizer=organizer, known_orders=known_orders)
+
+    BankTransaction.objects.bulk_update(nomatch, ['state'], batch_size=BATCH_SIZE)
+
+
 @app.task(base=TransactionAwareTask, bind=True, max_retries=5, default_retry_delay=1)
 def process_banktransfers(self, job: int, data: list) -> None:
     with language("en"):  # We'll translate error messages at display time
@@ -265,17 +318,14 @@ def process_banktransfers(self, job: int, data: list) -> None:
                     )
                 )
 
-                for trans in transactions:
-                    matches = pattern.findall(trans.reference.replace(" ", "").replace("\n", "").upper())
-
-                    if matches:
-                        if job.event:
-                            _handle_transaction(trans, matches, event=job.event)
-                        else:
-                            _handle_transaction(trans, matches, organizer=job.organizer)
-                    else:
-                        trans.state = BankTransaction.STATE_NOMATCH
-                        trans.save()
+                job.transactions_total = len(transactions)
+                job.transactions_processed = 0
+                job.save(update_fields=['transactions_total', 'transactions_processed'])
+
+                for chunk in chunked_iterable(transactions, BATCH_SIZE):
+                    _handle_transactions(chunk, pattern, **job.owner_kwargs)
+                    job.transactions_processed += len(chunk)
+                    job.save(update_fields=['transactions_processed'])
             except LockTimeoutException:
                 try:
                     self.retry()
@@ -263,7 +263,9 @@ class JobDetailView(DetailView):
     def get(self, request, *args, **kwargs):
         if 'ajax' in request.GET:
             return JsonResponse({
-                'state': self.job.state
+                'state': self.job.state,
+                'transactions_total': self.job.transactions_total,
+                'transactions_processed': self.job.transactions_processed,
             })
 
         context = self.get_context_data()
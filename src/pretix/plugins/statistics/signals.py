@@ -2,7 +2,6 @@ from django.dispatch import receiver
 from django.urls import resolve, reverse
 from django.utils.translation import gettext_lazy as _
 
-from pretix.base.signals import order_paid, order_placed
 from pretix.control.signals import nav_event
 
 
@@ -26,14 +25,3 @@ def control_nav_import(sender, request=None, **kwargs):
             'icon': 'bar-chart',
         }
     ]
-
-
-def clear_cache(sender, *args, **kwargs):
-    cache = sender.cache
-    cache.delete('statistics_obd_data')
-    cache.delete('statistics_obp_data')
-    cache.delete('statistics_rev_data')
-
-
-order_placed.connect(clear_cache)
-order_paid.connect(clear_cache)
@@ -4,16 +4,15 @@ from decimal import Decimal
 
 import dateutil.parser
 import dateutil.rrule
-from django.db.models import Count, DateTimeField, Max, Min, OuterRef, Subquery
-from django.utils import timezone
+from django.db.models import Count, Min, Q, Sum
 from django.views.generic import TemplateView
 
 from pretix.base.models import (
-    Item, Order, OrderPayment, OrderPosition, SubEvent,
+    Item, Order, SalesRollup, StatisticsRollup, SubEvent,
 )
+from pretix.base.services.stats import sales_rollup_ready
 from pretix.control.permissions import EventPermissionRequiredMixin
 from pretix.control.views import ChartContainingView
-from pretix.plugins.statistics.signals import clear_cache
 
 
 class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView):
@@ -22,10 +21,6 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        tz = timezone.get_current_timezone()
-
-        if 'latest' in self.request.GET:
-            clear_cache(self.request.event)
 
         subevent = None
         if self.request.GET.get("subevent", "") != "" and self.request.event.has_subevents:
@@ -35,137 +30,84 @@ class IndexView(EventPermissionRequiredMixin, ChartContainingView, TemplateView)
             except SubEvent.DoesNotExist:
                 pass
 
-        cache = self.request.event.cache
-        ckey = str(subevent.pk) if subevent else 'all'
-
-        p_date = OrderPayment.objects.filter(
-            order=OuterRef('pk'),
-            state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED),
-            payment_date__isnull=False
-        ).values('order').annotate(
-            m=Max('payment_date')
-        ).values(
-            'm'
-        ).order_by()
-        op_date = OrderPayment.objects.filter(
-            order=OuterRef('order'),
-            state__in=(OrderPayment.PAYMENT_STATE_CONFIRMED, OrderPayment.PAYMENT_STATE_REFUNDED),
-            payment_date__isnull=False
-        ).values('order').annotate(
-            m=Max('payment_date')
-        ).values(
-            'm'
-        ).order_by()
+        if not sales_rollup_ready(self.request.event):
+            # The rollups of the event are rebuilt in the background
+            ctx['rollup_pending'] = True
+            return ctx
+
+        rollup = StatisticsRollup.objects.filter(event=self.request.event, subevent=subevent)
 
         # Orders by day
-        ctx['obd_data'] = cache.get('statistics_obd_data' + ckey)
-        if not ctx['obd_data']:
-            oqs = Order.objects.annotate(payment_date=Subquery(p_date, output_field=DateTimeField()))
-            if subevent:
-                oqs = oqs.filter(all_positions__subevent_id=subevent, all_positions__canceled=False).distinct()
-
-            ordered_by_day = {}
-            for o in oqs.filter(event=self.request.event).values('datetime'):
-                day = o['datetime'].astimezone(tz).date()
-                ordered_by_day[day] = ordered_by_day.get(day, 0) + 1
-            paid_by_day = {}
-            for o in oqs.filter(event=self.request.event, payment_date__isnull=False).values('payment_date'):
-                day = o['payment_date'].astimezone(tz).date()
-                paid_by_day[day] = paid_by_day.get(day, 0) + 1
-
-            data = []
-            for d in dateutil.rrule.rrule(
-                    dateutil.rrule.DAILY,
-                    dtstart=min(ordered_by_day.keys()) if ordered_by_day else datetime.date.today(),
-                    until=max(
-                        max(ordered_by_day.keys() if paid_by_day else [datetime.date.today()]),
-                        max(paid_by_day.keys() if paid_by_day else [datetime.date(1970, 1, 1)])
-                    )):
-                d = d.date()
-                data.append({
-                    'date': d.strftime('%Y-%m-%d'),
-                    'ordered': ordered_by_day.get(d, 0),
-                    'paid': paid_by_day.get(d, 0)
-                })
-
-            ctx['obd_data'] = json.dumps(data)
-            cache.set('statistics_obd_data' + ckey, ctx['obd_data'])
+        ordered_by_day = dict(rollup.values('date').annotate(s=Sum('orders')).values_list('date', 's').order_by())
+        paid_by_day = dict(
+            rollup.filter(payment_date__isnull=False).values('payment_date').annotate(
+                s=Sum('orders')
+            ).values_list('payment_date', 's').order_by()
+        )
+
+        data = []
+        for d in dateutil.rrule.rrule(
+                dateutil.rrule.DAILY,
+                dtstart=min(ordered_by_day.keys()) if ordered_by_day else datetime.date.today(),
+                until=max(
+                    max(ordered_by_day.keys() if paid_by_day else [datetime.date.today()]),
+                    max(paid_by_day.keys() if paid_by_day else [datetime.date(1970, 1, 1)])
+                )):
+            d = d.date()
+            data.append({
+                'date': d.strftime('%Y-%m-%d'),
+                'ordered': ordered_by_day.get(d, 0),
+                'paid': paid_by_day.get(d, 0)
+            })
+        ctx['obd_data'] = json.dumps(data)
 
         # Orders by product
-        ctx['obp_data'] = cache.get('statistics_obp_data' + ckey)
-        if not ctx['obp_data']:
-            opqs = OrderPosition.objects
-            if subevent:
-                opqs = opqs.filter(subevent=subevent)
-            num_ordered = {
-                p['item']: p['cnt']
-                for p in (opqs
-                          .filter(order__event=self.request.event)
-                          .values('item')
-                          .annotate(cnt=Count('id')).order_by())
-            }
-            num_paid = {
-                p['item']: p['cnt']
-                for p in (opqs
-                          .filter(order__event=self.request.event, order__status=Order.STATUS_PAID)
-                          .values('item')
-                          .annotate(cnt=Count('id')).order_by())
-            }
-            item_names = {
-                i.id: str(i)
-                for i in Item.objects.filter(event=self.request.event)
-            }
-            ctx['obp_data'] = json.dumps([
-                {
-                    'item': item_names[item],
-                    'item_short': item_names[item] if len(item_names[item]) < 15 else (item_names[item][:15] + "…"),
-                    'ordered': cnt,
-                    'paid': num_paid.get(item, 0)
-                } for item, cnt in num_ordered.items()
-            ])
-            cache.set('statistics_obp_data' + ckey, ctx['obp_data'])
-
-        ctx['rev_data'] = cache.get('statistics_rev_data' + ckey)
-        if not ctx['rev_data']:
-            rev_by_day = {}
-            if subevent:
-                for o in OrderPosition.objects.annotate(
-                        payment_date=Subquery(op_date, output_field=DateTimeField())
-                ).filter(order__event=self.request.event,
-                         subevent=subevent,
-                         order__status=Order.STATUS_PAID,
-                         payment_date__isnull=False).values('payment_date', 'price'):
-                    day = o['payment_date'].astimezone(tz).date()
-                    rev_by_day[day] = rev_by_day.get(day, 0) + o['price']
-            else:
-                for o in Order.objects.annotate(
-                        payment_date=Subquery(p_date, output_field=DateTimeField())
-                ).filter(event=self.request.event,
-                         status=Order.STATUS_PAID,
-                         payment_date__isnull=False).values('payment_date', 'total'):
-                    day = o['payment_date'].astimezone(tz).date()
-                    rev_by_day[day] = rev_by_day.get(day, 0) + o['total']
-
-            data = []
-            total = 0
-            for d in dateutil.rrule.rrule(
-                    dateutil.rrule.DAILY,
-                    dtstart=min(rev_by_day.keys() if rev_by_day else [datetime.date.today()]),
-                    until=max(rev_by_day.keys() if rev_by_day else [datetime.date.today()])):
-                d = d.date()
-                total += float(rev_by_day.get(d, 0))
-                data.append({
-                    'date': d.strftime('%Y-%m-%d'),
-                    'revenue': round(total, 2),
-                })
-            ctx['rev_data'] = json.dumps(data)
-            cache.set('statistics_rev_data' + ckey, ctx['rev_data'])
+        sales = SalesRollup.objects.filter(event=self.request.event)
+        if subevent:
+            sales = sales.filter(subevent=subevent)
+        item_names = {
+            i.id: str(i)
+            for i in Item.objects.filter(event=self.request.event)
+        }
+        ctx['obp_data'] = json.dumps([
+            {
+                'item': item_names[p['item']],
+                'item_short': item_names[p['item']] if len(item_names[p['item']]) < 15 else (
+                    item_names[p['item']][:15] + "…"
+                ),
+                'ordered': p['ordered'],
+                'paid': p['paid'] or 0
+            } for p in sales.values('item').annotate(
+                ordered=Sum('count', filter=~Q(status=SalesRollup.STATUS_CANCELED_POSITION)),
+                paid=Sum('count', filter=Q(status=Order.STATUS_PAID)),
+            ).order_by('item__position', 'item_id') if p['ordered']
+        ])
+
+        # Revenue over time
+        rev_by_day = dict(
+            rollup.filter(payment_date__isnull=False).exclude(revenue=0).values('payment_date').annotate(
+                s=Sum('revenue')
+            ).values_list('payment_date', 's').order_by()
+        )
+        data = []
+        total = 0
+        for d in dateutil.rrule.rrule(
+                dateutil.rrule.DAILY,
+                dtstart=min(rev_by_day.keys() if rev_by_day else [datetime.date.today()]),
+                until=max(rev_by_day.keys() if rev_by_day else [datetime.date.today()])):
+            d = d.date()
+            total += float(rev_by_day.get(d, 0))
+            data.append({
+                'date': d.strftime('%Y-%m-%d'),
+                'revenue': round(total, 2),
+            })
+        ctx['rev_data'] = json.dumps(data)
 
         ctx['has_orders'] = self.request.event.orders.exists()
 
         ctx['seats'] = {}
 
-        if not self.request.event.has_subevents or (ckey != "all" and subevent):
+        if not self.request.event.has_subevents or subevent:
             ev = subevent or self.request.event
             if ev.seating_plan_id is not None:
                 seats_qs = ev.free_seats(sales_channel=None, include_blocked=True)
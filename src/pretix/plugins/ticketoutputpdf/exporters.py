@@ -1,22 +1,97 @@
+import os
+import subprocess
+import tempfile
 from collections import OrderedDict
-from io import BytesIO
+from typing import List
 
+import billiard
 from django import forms
 from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import connections
 from django.db.models.functions import Coalesce
 from django.utils.translation import gettext as _, gettext_lazy
+from django_scopes import scopes_disabled
 from jsonfallback.functions import JSONExtract
 from PyPDF2.merger import PdfFileMerger
 
 from pretix.base.exporter import BaseExporter
-from pretix.base.i18n import language
-from pretix.base.models import Event, Order, OrderPosition
+from pretix.base.models import Order, OrderPosition
 from pretix.base.settings import PERSON_NAME_SCHEMES
 
 from .ticketoutput import PdfTicketOutput
 
 
+def _render_chunk(position_ids: List[int], fname: str) -> bool:
+    """
+    Renders the tickets of the given positions in the given order into the file ``fname`` and returns
+    whether any ticket has been rendered. Consecutive positions with the same layout are drawn together,
+    so their background only needs to be merged once. This runs in a separate process if the export is
+    parallelized.
+    """
+    with scopes_disabled():
+        positions = {
+            op.pk: op for op in OrderPosition.objects.filter(
+                pk__in=position_ids
+            ).prefetch_related(
+                'answers', 'answers__question'
+            ).select_related('order', 'order__event', 'item', 'variation', 'addon_to')
+        }
+
+        merger = PdfFileMerger()
+        o = None
+        run_layout = None
+        run = []
+
+        def draw_run():
+            if run:
+                merger.append(ContentFile(o._draw_pages(run_layout, run).read()))
+                run.clear()
+
+        for pk in position_ids:
+            op = positions[pk]
+            if not op.generate_ticket:
+                continue
+
+            if o is None or op.order.event != o.event:
+                draw_run()
+                o = PdfTicketOutput(op.order.event)
+
+            layout = o.layout_map.get(
+                (op.item_id, op.order.sales_channel),
+                o.layout_map.get(
+                    (op.item_id, 'web'),
+                    o.default_layout
+                )
+            )
+            if layout is not run_layout:
+                draw_run()
+                run_layout = layout
+            run.append(op)
+        draw_run()
+
+        if not merger.pages:
+            return False
+        with open(fname, 'wb') as f:
+            merger.write(f)
+        merger.close()
+        return True
+
+
+def _merge_files(fnames: List[str], output_file) -> None:
+    if settings.PDFTK:
+        output_file.flush()
+        subprocess.run([settings.PDFTK, *fnames, 'cat', 'output', '-'], stdout=output_file, check=True)
+    else:
+        # Passing file names makes PyPDF2 read the pages from disk when writing instead of loading them
+        # into memory first
+        merger = PdfFileMerger()
+        for fname in fnames:
+            merger.append(fname)
+        merger.write(output_file)
+        merger.close()
+
+
 class AllTicketsPDF(BaseExporter):
     name = "alltickets"
     verbose_name = gettext_lazy("All PDF tickets in one file")
@@ -47,13 +122,10 @@ class AllTicketsPDF(BaseExporter):
         )
         return d
 
-    def render(self, form_data):
-        merger = PdfFileMerger()
+    def render(self, form_data, output_file=None):
         qs = OrderPosition.objects.filter(
             order__event__in=self.events
-        ).prefetch_related(
-            'answers', 'answers__question'
-        ).select_related('order', 'item', 'variation', 'addon_to')
+        )
 
         if form_data.get('include_pending'):
             qs = qs.filter(order__status__in=[Order.STATUS_PAID, Order.STATUS_PENDING])
@@ -74,31 +146,43 @@ class AllTicketsPDF(BaseExporter):
                 'resolved_name_part'
             )
 
-        o = PdfTicketOutput(Event.objects.none())
-        for op in qs:
-            if not op.generate_ticket:
-                continue
+        position_ids = list(qs.values_list('pk', flat=True))
+        chunk_size = settings.TICKET_EXPORT_CHUNK_SIZE
+        chunks = [position_ids[i:i + chunk_size] for i in range(0, len(position_ids), chunk_size)]
 
-            if op.order.event != o.event:
-                o = PdfTicketOutput(op.event)
+        with tempfile.TemporaryDirectory() as d:
+            fnames = [os.path.join(d, 'chunk{}.pdf'.format(i)) for i in range(len(chunks))]
+            if settings.TICKET_EXPORT_PROCESSES > 1 and len(chunks) > 1:
+                # Child processes must not share the database connections of this process
+                connections.close_all()
+                # Celery's prefork workers are daemonic processes, which the multiprocessing module does not
+                # allow to start processes of their own, while billiard does
+                with billiard.get_context('fork').Pool(settings.TICKET_EXPORT_PROCESSES) as pool:
+                    results = [pool.apply_async(_render_chunk, (chunk, fname)) for chunk, fname in zip(chunks, fnames)]
+                    rendered = []
+                    for i, result in enumerate(results):
+                        rendered.append(result.get())
+                        self.progress_callback((i + 1) / len(chunks) * 100)
+            else:
+                rendered = []
+                for i, (chunk, fname) in enumerate(zip(chunks, fnames)):
+                    rendered.append(_render_chunk(chunk, fname))
+                    self.progress_callback((i + 1) / len(chunks) * 100)
 
-            with language(op.order.locale, o.event.settings.region):
-                layout = o.layout_map.get(
-                    (op.item_id, op.order.sales_channel),
-                    o.layout_map.get(
-                        (op.item_id, 'web'),
-                        o.default_layout
-                    )
-                )
-                outbuffer = o._draw_page(layout, op, op.order)
-                merger.append(ContentFile(outbuffer.read()))
+            fnames = [fname for fname, r in zip(fnames, rendered) if r]
+            if not fnames:
+                return None
 
-        outbuffer = BytesIO()
-        merger.write(outbuffer)
-        merger.close()
-        outbuffer.seek(0)
+            if self.is_multievent:
+                filename = '{}_tickets.pdf'.format(self.events.first().organizer.slug)
+            else:
+                filename = '{}_tickets.pdf'.format(self.event.slug)
 
-        if self.is_multievent:
-            return '{}_tickets.pdf'.format(self.events.first().organizer.slug), 'application/pdf', outbuffer.read()
-        else:
-            return '{}_tickets.pdf'.format(self.event.slug), 'application/pdf', outbuffer.read()
+            if output_file:
+                _merge_files(fnames, output_file)
+                return filename, 'application/pdf', None
+            else:
+                with open(os.path.join(d, 'out.pdf'), 'w+b') as f:
+                    _merge_files(fnames, f)
+                    f.seek(0)
+                    return filename, 'application/pdf', f.read()
@@ -42,4 +42,4 @@ class TicketLayoutItemForm(forms.ModelForm):
         else:
             return super().save(commit=commit)
         tickets.invalidate_cache.apply_async(kwargs={'event': self.event.pk, 'provider': 'pdf',
-                                                     'item': self.instance.item_id})
+                                                     'item': self.instance.item_id, 'regenerate': True})
@@ -59,8 +59,7 @@ class PdfTicketOutput(BaseTicketOutput):
     def _register_fonts(self):
         Renderer._register_fonts()
 
-    def _draw_page(self, layout: TicketLayout, op: OrderPosition, order: Order):
-        buffer = BytesIO()
+    def _get_renderer(self, layout: TicketLayout):
         objs = self.override_layout or json.loads(layout.layout) or self._legacy_layout()
         bg_file = layout.background
 
@@ -71,15 +70,35 @@ class PdfTicketOutput(BaseTicketOutput):
         else:
             bgf = self._get_default_background()
 
+        return Renderer(self.event, objs, bgf)
+
+    def _draw_page(self, layout: TicketLayout, op: OrderPosition, order: Order):
+        buffer = BytesIO()
         p = self._create_canvas(buffer)
-        renderer = Renderer(self.event, objs, bgf)
+        renderer = self._get_renderer(layout)
         renderer.draw_page(p, order, op)
         p.save()
         return renderer.render_background(buffer, _('Ticket'))
 
+    def _draw_pages(self, layout: TicketLayout, positions):
+        """
+        Draws the tickets of multiple positions that share the same layout into one document, each in the
+        language of its order. The background is only loaded and merged once for all of them.
+        """
+        buffer = BytesIO()
+        p = self._create_canvas(buffer)
+        renderer = self._get_renderer(layout)
+        for op in positions:
+            with language(op.order.locale, self.event.settings.region):
+                renderer.draw_page(p, op.order, op)
+        p.save()
+        return renderer.render_background(buffer, _('Ticket'))
+
     def generate_order(self, order: Order):
         merger = PdfFileMerger()
         with language(order.locale, self.event.settings.region):
+            # Positions with the same layout are drawn into one document, so they share the background
+            runs = []
             for op in order.positions_with_tickets:
                 layout = override_layout.send_chained(
                     order.event, 'layout', orderposition=op, layout=self.layout_map.get(
@@ -90,7 +109,12 @@ class PdfTicketOutput(BaseTicketOutput):
                         )
                     )
                 )
-                outbuffer = self._draw_page(layout, op, order)
+                if runs and runs[-1][0] is layout:
+                    runs[-1][1].append(op)
+                else:
+                    runs.append((layout, [op]))
+            for layout, positions in runs:
+                outbuffer = self._draw_pages(layout, positions)
                 merger.append(ContentFile(outbuffer.read()))
 
         outbuffer = BytesIO()
@@ -40,7 +40,7 @@ class EditorView(BaseEditorView):
 
     def save_layout(self):
         super().save_layout()
-        invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'provider': 'pdf'})
+        invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'provider': 'pdf', 'regenerate': True})
 
     def get_layout_settings_key(self):
         return 'ticketoutput_pdf_layout'
@@ -228,7 +228,7 @@ class LayoutEditorView(BaseEditorView):
         self.layout.save(update_fields=['layout'])
         self.layout.log_action(action='pretix.plugins.ticketoutputpdf.layout.changed', user=self.request.user,
                                data={'layout': self.request.POST.get("data")})
-        invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'provider': 'pdf'})
+        invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'provider': 'pdf', 'regenerate': True})
 
     def get_default_background(self):
         return static('pretixpresale/pdf/ticket_default_a4.pdf')
@@ -264,4 +264,4 @@ class LayoutEditorView(BaseEditorView):
         if self.layout.background:
             self.layout.background.delete()
         self.layout.background.save('background.pdf', f.file)
-        invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'provider': 'pdf'})
+        invalidate_cache.apply_async(kwargs={'event': self.request.event.pk, 'provider': 'pdf', 'regenerate': True})
@@ -990,11 +990,11 @@ class OrderDownloadMixin:
 
     def get_last_ct(self):
         if 'position' in self.kwargs:
-            ct = CachedTicket.objects.filter(
+            ct = CachedTicket.objects.current(self.request.event).filter(
                 order_position=self.order_position, provider=self.output.identifier, file__isnull=False
             ).last()
         else:
-            ct = CachedCombinedTicket.objects.filter(
+            ct = CachedCombinedTicket.objects.current(self.request.event).filter(
                 order=self.order, provider=self.output.identifier, file__isnull=False
             ).last()
         if not ct or not ct.file:
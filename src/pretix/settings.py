@@ -128,6 +128,7 @@ PRETIX_PASSWORD_RESET = config.getboolean('pretix', 'password_reset', fallback=T
 PRETIX_LONG_SESSIONS = config.getboolean('pretix', 'long_sessions', fallback=True)
 PRETIX_ADMIN_AUDIT_COMMENTS = config.getboolean('pretix', 'audit_comments', fallback=False)
 PRETIX_OBLIGATORY_2FA = config.getboolean('pretix', 'obligatory_2fa', fallback=False)
+PRETIX_QUOTA_COUNTERS = config.getboolean('pretix', 'quota_counters', fallback=False)
 PRETIX_SESSION_TIMEOUT_RELATIVE = 3600 * 3
 PRETIX_SESSION_TIMEOUT_ABSOLUTE = 3600 * 12
 PRETIX_PRIMARY_COLOR = '#8E44B3'
@@ -190,6 +191,9 @@ ADMINS = [('Admin', n) for n in config.get('mail', 'admins', fallback='').split(
 METRICS_ENABLED = config.getboolean('metrics', 'enabled', fallback=False)
 METRICS_USER = config.get('metrics', 'user', fallback="metrics")
 METRICS_PASSPHRASE = config.get('metrics', 'passphrase', fallback="")
+METRICS_FLUSH_INTERVAL = config.getint('metrics', 'flush_interval', fallback=10)
+INSTRUMENTATION_ENABLED = config.getboolean('metrics', 'instrumentation', fallback=False)
+INSTRUMENTATION_QUERY_BUDGET = config.getint('metrics', 'query_budget', fallback=0)
 
 CACHES = {
     'default': {
@@ -249,6 +253,21 @@ else:
 SESSION_COOKIE_DOMAIN = config.get('pretix', 'cookie_domain', fallback=None)
 
 CACHE_TICKETS_HOURS = config.getint('cache', 'tickets', fallback=24 * 3)
+CACHE_L1_TTL = config.getfloat('cache', 'l1_ttl', fallback=0)
+CACHE_L1_SIZE = config.getint('cache', 'l1_size', fallback=1000)
+
+TICKET_EXPORT_PROCESSES = config.getint('tickets', 'export_processes', fallback=1)
+TICKET_EXPORT_CHUNK_SIZE = config.getint('tickets', 'export_chunk_size', fallback=200)
+TICKET_PREGENERATE = config.getboolean('tickets', 'pregenerate', fallback=False)
+TICKET_PREGENERATE_RATE_LIMIT = config.get('tickets', 'pregenerate_rate_limit', fallback=None)
+
+LOCK_FINE_GRAINED = config.getboolean('locking', 'fine_grained', fallback=False)
+LOCK_MAX_WAIT = config.getfloat('locking', 'max_wait', fallback=5)
+
+WEBHOOK_TIMEOUT = config.getint('webhooks', 'timeout', fallback=30)
+WEBHOOK_TARGET_CONCURRENCY = config.getint('webhooks', 'target_concurrency', fallback=0)
+WEBHOOK_LOG_SUCCESS_RATE = config.getfloat('webhooks', 'log_success_rate', fallback=1)
+WEBHOOK_LOG_PAYLOAD_LENGTH = config.getint('webhooks', 'log_payload_length', fallback=0)
 
 ENTROPY = {
     'order_code': config.getint('entropy', 'order_code', fallback=5),
@@ -398,9 +417,20 @@ if METRICS_ENABLED:
     MIDDLEWARE.insert(MIDDLEWARE.index('pretix.base.middleware.CustomCommonMiddleware') + 1,
                       'pretix.helpers.metrics.middleware.MetricsMiddleware')
 
+if INSTRUMENTATION_ENABLED:
+    MIDDLEWARE.insert(MIDDLEWARE.index('pretix.base.middleware.CustomCommonMiddleware') + 1,
+                      'pretix.helpers.metrics.middleware.InstrumentationMiddleware')
+
 
 PROFILING_RATE = config.getfloat('django', 'profile', fallback=0)  # Percentage of requests to profile
-if PROFILING_RATE > 0:
+PROFILING_SAMPLING = config.getboolean('django', 'profile_sampling', fallback=False)
+PROFILING_SAMPLING_INTERVAL = config.getint('django', 'profile_sampling_interval', fallback=10)  # Milliseconds
+PROFILING_SAMPLING_RETENTION = config.getint('django', 'profile_sampling_retention', fallback=24)  # Hours
+if PROFILING_SAMPLING:
+    if not os.path.exists(PROFILE_DIR):
+        os.mkdir(PROFILE_DIR)
+    MIDDLEWARE.insert(0, 'pretix.helpers.profile.middleware.SamplingProfilerMiddleware')
+elif PROFILING_RATE > 0:
     if not os.path.exists(PROFILE_DIR):
         os.mkdir(PROFILE_DIR)
     MIDDLEWARE.insert(0, 'pretix.helpers.profile.middleware.CProfileMiddleware')
@@ -55,6 +55,12 @@ CACHES = {
 }
 DATABASE_REPLICA = 'default'
 
+# Write metrics right away
+METRICS_FLUSH_INTERVAL = 0
+
+# Don't wait long for locks held by the test itself
+LOCK_MAX_WAIT = .5
+
 # Don't run migrations
 
 
@@ -0,0 +1,219 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.api.changes import (
+    assign_sequence_numbers, build_change_feed, prune_change_feed,
+)
+from pretix.api.models import ChangeFeedEntry, ChangeFeedLock
+from pretix.base.models import CartPosition, Order, OrderPosition
+from pretix.helpers.database import rolledback_transaction
+
+
+@pytest.fixture
+def item(event):
+    return event.items.create(name="Budget Ticket", default_price=23)
+
+
+def _create_order(event, item, code='FOO'):
+    with scopes_disabled():
+        o = Order.objects.create(
+            code=code, event=event, email='dummy@dummy.test', status=Order.STATUS_PENDING,
+            datetime=now(), expires=now() + timedelta(days=10), total=Decimal('23.00'), locale='en'
+        )
+        p = OrderPosition.objects.create(order=o, item=item, price=Decimal('23.00'), positionid=1)
+    return o, p
+
+
+def _get(client, organizer, event, query=''):
+    resp = client.get('/api/v1/organizers/{}/events/{}/changes/{}'.format(organizer.slug, event.slug, query))
+    assert resp.status_code == 200
+    return resp.data
+
+
+@pytest.mark.django_db
+def test_feed(token_client, organizer, event, item):
+    o, p = _create_order(event, item)
+    with scopes_disabled():
+        v = event.vouchers.create(code='ABCDEFG')
+        cl = event.checkin_lists.create(name='Default')
+        c = p.checkins.create(list=cl)
+
+    data = _get(token_client, organizer, event)
+    assert not data['has_more']
+    results = {r['type']: r for r in data['results']}
+    assert len(data['results']) == 4
+    assert results['voucher']['id'] == v.pk
+    assert results['checkin']['data']['position'] == p.pk
+    assert results['orderposition']['data']['checkins'][0]['id'] == c.pk
+    assert results['order']['id'] == 'FOO'
+    assert results['order']['data']['positions'][0]['id'] == p.pk
+    assert data['cursor'] == data['results'][-1]['seq']
+    cursor = data['cursor']
+
+    data = _get(token_client, organizer, event, '?limit=1&type=orderposition&type=checkin')
+    assert data['has_more']
+    assert len(data['results']) == 1
+    assert 'since={}'.format(data['cursor']) in data['next']
+
+    with scopes_disabled():
+        o.payments.create(provider='manual', amount=o.total)
+    data = _get(token_client, organizer, event, '?since={}'.format(cursor))
+    assert [(r['type'], r['id']) for r in data['results']] == [('order', 'FOO')]
+    assert len(data['results'][0]['data']['payments']) == 1
+    assert ChangeFeedEntry.objects.filter(object_type='order').current().count() == 1
+
+    voucher_id = v.pk
+    with scopes_disabled():
+        v.delete()
+    data = _get(token_client, organizer, event, '?since={}'.format(data['cursor']))
+    assert data['results'] == [
+        {'seq': data['cursor'], 'type': 'voucher', 'id': voucher_id, 'deleted': True, 'data': None}
+    ]
+
+
+@pytest.mark.django_db
+def test_rolled_back_changes(event, item):
+    with rolledback_transaction():
+        _create_order(event, item)
+        assert ChangeFeedEntry.objects.filter(seq__isnull=True).count() == 3
+    assert not ChangeFeedEntry.objects.exists()
+
+
+@pytest.mark.django_db
+def test_sequence_numbers(token_client, organizer, event, item):
+    o, p = _create_order(event, item)
+    assert not ChangeFeedEntry.objects.filter(seq__isnull=False).exists()
+    # Entries are numbered when the feed is read
+    assert len(_get(token_client, organizer, event)['results']) == 2
+    seqs = list(ChangeFeedEntry.objects.order_by('id').values_list('seq', flat=True))
+    assert None not in seqs and seqs == sorted(seqs)
+    cursor = _get(token_client, organizer, event)['cursor']
+    assert cursor == ChangeFeedLock.objects.get(event=event).last_seq
+
+    with scopes_disabled():
+        o.email = 'foo@example.org'
+        o.save()
+    data = _get(token_client, organizer, event, '?since={}'.format(cursor))
+    assert [(r['type'], r['id']) for r in data['results']] == [('order', 'FOO')]
+    assert data['cursor'] > cursor
+
+
+@pytest.mark.django_db
+def test_voucher_redeemed(token_client, organizer, event, item):
+    with scopes_disabled():
+        v = event.vouchers.create(code='ABCDEFG', item=item)
+    cursor = _get(token_client, organizer, event)['cursor']
+    o, p = _create_order(event, item)
+    with scopes_disabled():
+        cp = CartPosition.objects.create(
+            event=event, item=item, price=Decimal('23.00'), expires=now() + timedelta(days=1), voucher=v
+        )
+        OrderPosition.transform_cart_positions([cp], o)
+
+    data = _get(token_client, organizer, event, '?since={}&type=voucher'.format(cursor))
+    assert [(r['id'], r['data']['redeemed']) for r in data['results']] == [(v.pk, 1)]
+
+
+@pytest.mark.django_db
+def test_prune(event, item):
+    o, p = _create_order(event, item)
+    with scopes_disabled():
+        o.email = 'foo@example.org'
+        o.save()
+    assert ChangeFeedEntry.objects.count() == 4
+    latest = ChangeFeedEntry.objects.filter(object_type='order').last()
+    # Entries without a sequence number are never pruned
+    assert prune_change_feed() == 0
+    assign_sequence_numbers([event.pk])
+    assert prune_change_feed() == 2
+    assert set(ChangeFeedEntry.objects.values_list('object_type', flat=True)) == {'order', 'orderposition'}
+    assert ChangeFeedEntry.objects.filter(object_type='order').get() == latest
+
+
+@pytest.mark.django_db
+def test_entries_committed_in_inverted_order(token_client, organizer, event, item):
+    o, p = _create_order(event, item)
+    assign_sequence_numbers([event.pk])
+    with scopes_disabled():
+        o.email = 'first@example.org'
+        o.save()
+        first = ChangeFeedEntry.objects.latest('id')
+        o.email = 'second@example.org'
+        o.save()
+        second = ChangeFeedEntry.objects.latest('id')
+
+    # The second transaction is committed and numbered first
+    lock = ChangeFeedLock.objects.get(event=event)
+    lock.last_seq += 1
+    lock.save()
+    ChangeFeedEntry.objects.filter(pk=second.pk).update(seq=lock.last_seq)
+    cursor = lock.last_seq
+    assign_sequence_numbers([event.pk])
+    first.refresh_from_db()
+    assert first.seq > cursor
+
+    # A client that has seen the second entry still sees the order again
+    data = _get(token_client, organizer, event, '?since={}'.format(cursor))
+    assert [(r['type'], r['seq']) for r in data['results']] == [('order', first.seq)]
+    assert prune_change_feed() == 3
+    assert ChangeFeedEntry.objects.filter(object_type='order').get() == first
+
+
+@pytest.mark.django_db
+def test_voucher_permission(token_client, team, organizer, event, item):
+    team.can_view_vouchers = False
+    team.save()
+    with scopes_disabled():
+        event.vouchers.create(code='ABCDEFG')
+    _create_order(event, item)
+
+    data = _get(token_client, organizer, event)
+    assert sorted(r['type'] for r in data['results']) == ['order', 'orderposition']
+    resp = token_client.get('/api/v1/organizers/{}/events/{}/changes/?type=voucher'.format(
+        organizer.slug, event.slug
+    ))
+    assert resp.status_code == 403
+
+
+@pytest.mark.django_db
+def test_invalid_parameters(token_client, organizer, event):
+    resp = token_client.get('/api/v1/organizers/{}/events/{}/changes/?type=foo'.format(organizer.slug, event.slug))
+    assert resp.status_code == 400
+    resp = token_client.get('/api/v1/organizers/{}/events/{}/changes/?since=foo'.format(organizer.slug, event.slug))
+    assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+def test_backfill(event, item):
+    o, p = _create_order(event, item)
+    ChangeFeedEntry.objects.all().delete()
+    assert build_change_feed(limit=1) == 2
+    assert build_change_feed() == 0
+    assert sorted(ChangeFeedEntry.objects.values_list('object_type', 'object_id')) == [
+        ('order', 'FOO'), ('orderposition', str(p.pk)),
+    ]
+
+
+@pytest.mark.django_db
+def test_deleted_children(token_client, organizer, event, item):
+    o, p = _create_order(event, item)
+    with scopes_disabled():
+        p2 = OrderPosition.objects.create(order=o, item=item, price=Decimal('23.00'), positionid=2)
+        cl = event.checkin_lists.create(name='Default')
+        c = p.checkins.create(list=cl)
+        c2 = p2.checkins.create(list=cl)
+    cursor = _get(token_client, organizer, event)['cursor']
+
+    with scopes_disabled():
+        o.testmode = True
+        o.save()
+        o.gracefully_delete()
+    data = _get(token_client, organizer, event, '?since={}'.format(cursor))
+    assert sorted((r['type'], str(r['id'])) for r in data['results'] if r['deleted']) == sorted([
+        ('checkin', str(c.pk)), ('checkin', str(c2.pk)), ('order', 'FOO'),
+        ('orderposition', str(p.pk)), ('orderposition', str(p2.pk)),
+    ])
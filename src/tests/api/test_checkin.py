@@ -1039,3 +1039,119 @@ def test_question_upload(token_client, organizer, clist, event, order, question)
     with scopes_disabled():
         assert order.positions.first().answers.get(question=question[0]).answer.startswith('file://')
         assert order.positions.first().answers.get(question=question[0]).file
+
+
+@pytest.mark.django_db
+def test_redeem_batch(token_client, organizer, clist, event, order):
+    with scopes_disabled():
+        p = order.positions.first()
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': [
+        {'secret': p.secret, 'nonce': 'a'},
+        {'secret': p.secret, 'nonce': 'a'},
+        {'secret': p.secret, 'nonce': 'b'},
+        {'secret': str(p.pk), 'type': 'exit'},
+        {'secret': 'unknown'},
+    ]}, format='json')
+    assert resp.status_code == 200
+    res = resp.data['results']
+    assert [r['status'] for r in res] == ['ok', 'ok', 'error', 'ok', 'error']
+    assert res[2]['reason'] == 'already_redeemed'
+    assert res[4]['reason'] == 'invalid'
+    assert len(res[3]['position']['checkins']) == 2
+    with scopes_disabled():
+        assert p.checkins.filter(type=Checkin.TYPE_ENTRY).count() == 1
+        assert p.checkins.filter(type=Checkin.TYPE_EXIT).count() == 1
+
+
+@pytest.mark.django_db
+def test_redeem_batch_previous_checkins(token_client, organizer, clist, event, order):
+    with scopes_disabled():
+        p = order.positions.first()
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/{}/redeem/'.format(
+        organizer.slug, event.slug, clist.pk, p.pk
+    ), {'nonce': 'a'}, format='json')
+    assert resp.status_code == 201
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': [
+        {'secret': p.secret, 'nonce': 'a'},
+        {'secret': p.secret},
+        {'secret': p.secret, 'force': True},
+    ]}, format='json')
+    assert [r['status'] for r in resp.data['results']] == ['ok', 'error', 'ok']
+    with scopes_disabled():
+        assert p.checkins.count() == 2
+        assert p.checkins.filter(forced=True).count() == 1
+
+
+@pytest.mark.django_db
+def test_redeem_batch_require_paid(token_client, organizer, clist, event, order):
+    with scopes_disabled():
+        p = order.positions.first()
+    order.status = Order.STATUS_PENDING
+    order.save()
+    clist.include_pending = True
+    clist.save()
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': [
+        {'secret': p.secret},
+        {'secret': p.secret, 'ignore_unpaid': True},
+    ]}, format='json')
+    res = resp.data['results']
+    assert res[0]['status'] == 'error'
+    assert res[0]['reason'] == 'unpaid'
+    assert res[1]['status'] == 'ok'
+
+
+@pytest.mark.django_db
+def test_redeem_batch_rules(token_client, organizer, clist, event, order):
+    clist.allow_multiple_entries = True
+    clist.rules = {"<": [{"var": "entries_number"}, 2]}
+    clist.save()
+    with scopes_disabled():
+        p = order.positions.first()
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': [
+        {'secret': p.secret},
+        {'secret': p.secret},
+        {'secret': p.secret},
+    ]}, format='json')
+    res = resp.data['results']
+    assert [r['status'] for r in res] == ['ok', 'ok', 'error']
+    assert res[2]['reason'] == 'rules'
+
+
+@pytest.mark.django_db
+def test_redeem_batch_question_required(token_client, organizer, clist, event, order, question):
+    with scopes_disabled():
+        p = order.positions.first()
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': [{'secret': p.secret}]}, format='json')
+    assert resp.data['results'][0]['status'] == 'incomplete'
+    with scopes_disabled():
+        assert resp.data['results'][0]['questions'] == [QuestionSerializer(question[0]).data]
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': [{'secret': p.secret}], 'questions_supported': False}, format='json')
+    assert resp.data['results'][0]['status'] == 'ok'
+
+
+@pytest.mark.django_db
+def test_redeem_batch_invalid(token_client, organizer, clist, event, order):
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': []}, format='json')
+    assert resp.status_code == 400
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': [{'nonce': 'a'}]}, format='json')
+    assert resp.status_code == 400
+    resp = token_client.post('/api/v1/organizers/{}/events/{}/checkinlists/{}/positions/redeem_batch/'.format(
+        organizer.slug, event.slug, clist.pk
+    ), {'scans': [{'secret': 'a', 'type': 'foo'}]}, format='json')
+    assert resp.status_code == 400
@@ -37,6 +37,10 @@ SAMPLE_EXPORTER_CONFIG = {
             "name": "group_multiple_choice",
             "required": False
         },
+        {
+            "name": "incremental",
+            "required": False
+        },
     ]
 }
 
@@ -20,6 +20,7 @@ event_urls = [
     (None, 'taxrules/'),
     ('can_view_orders', 'waitinglistentries/'),
     ('can_view_orders', 'checkinlists/'),
+    ('can_view_orders', 'changes/'),
 ]
 
 event_permission_sub_urls = [
@@ -29,6 +30,7 @@ event_permission_sub_urls = [
     ('get', 'can_view_orders', 'revokedsecrets/1/', 404),
     ('get', 'can_view_orders', 'orders/', 200),
     ('get', 'can_view_orders', 'orderpositions/', 200),
+    ('get', 'can_view_orders', 'changes/', 200),
     ('delete', 'can_change_orders', 'orderpositions/1/', 404),
     ('post', 'can_change_orders', 'orderpositions/1/price_calc/', 404),
     ('get', 'can_view_vouchers', 'vouchers/', 200),
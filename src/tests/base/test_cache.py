@@ -1,8 +1,10 @@
 import random
+from unittest import mock
 
 from django.core.cache import cache as django_cache
 from django.test import TestCase, override_settings
 from django.utils.timezone import now
+from django_scopes import scopes_disabled
 
 from pretix.base.models import Event, Organizer
 
@@ -53,3 +55,44 @@ class CacheTest(TestCase):
         }
         self.cache.set_many(inp)
         self.assertEqual(inp, self.cache.get_many(inp.keys()))
+
+    def test_many_longkey(self):
+        inp = {
+            self.testkey * 100: 'foo',
+            'b': 'bar',
+        }
+        self.cache.set_many(inp)
+        self.assertEqual(inp, self.cache.get_many(inp.keys()))
+
+    def test_invalidation_other_instance(self):
+        self.cache.set(self.testkey, "foo")
+        self.assertEqual(self.cache.get(self.testkey), "foo")
+        with scopes_disabled():
+            Event.objects.get(pk=self.event.pk).cache.clear()
+        self.assertIsNone(self.cache.get(self.testkey))
+
+    def test_prefix_pinned(self):
+        self.cache.set(self.testkey, "foo")
+        with mock.patch.object(django_cache, 'get', wraps=django_cache.get) as get, \
+                mock.patch.object(django_cache, 'get_many', wraps=django_cache.get_many) as get_many:
+            self.cache.get_many([self.testkey, 'a', 'b'])
+            self.cache.get(self.testkey)
+        self.assertEqual(get_many.call_count, 1)
+        self.assertNotIn(mock.call(self.cache.prefixkey), get.call_args_list)
+
+    @override_settings(CACHE_L1_TTL=60)
+    def test_l1(self):
+        self.cache.set(self.testkey, {"foo": "bar"})
+        django_cache.clear()
+        value = self.cache.get(self.testkey)
+        self.assertEqual(value, {"foo": "bar"})
+        value["foo"] = "baz"
+        self.assertEqual(self.cache.get_many([self.testkey]), {self.testkey: {"foo": "bar"}})
+        self.cache.delete(self.testkey)
+        self.assertIsNone(self.cache.get(self.testkey))
+
+    @override_settings(CACHE_L1_TTL=60)
+    def test_l1_invalidation(self):
+        self.cache.set(self.testkey, "foo")
+        self.event.cache.clear()
+        self.assertIsNone(self.cache.get(self.testkey))
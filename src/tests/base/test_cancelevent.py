@@ -1,5 +1,6 @@
 from datetime import timedelta
 from decimal import Decimal
+from unittest import mock
 
 from django.core import mail as djmail
 from django.test import TestCase
@@ -9,6 +10,7 @@ from django_scopes import scope
 from pretix.base.models import (
     Event, Item, Order, OrderPosition, Organizer, Voucher, WaitingListEntry,
 )
+from pretix.base.models.base import _dispatch_logentries
 from pretix.base.models.orders import OrderFee, OrderPayment, OrderRefund
 from pretix.base.services.cancelevent import cancel_event
 from pretix.base.services.invoices import generate_invoice
@@ -63,6 +65,38 @@ class EventCancelTests(TestCase):
         assert self.order.status == Order.STATUS_CANCELED
         assert '46.00' in djmail.outbox[0].body
 
+    @classscope(attr='o')
+    def test_cancel_logs_every_order_in_one_batch(self):
+        gc = self.o.issued_gift_cards.create(currency="EUR")
+        self.order.payments.create(
+            amount=Decimal('46.00'),
+            state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+            provider='giftcard',
+            info='{"gift_card": %d}' % gc.pk
+        )
+        self.order.status = Order.STATUS_PAID
+        self.order.save()
+        o2 = Order.objects.create(
+            code='BAR', event=self.event, email='dummy@dummy.test',
+            status=Order.STATUS_PENDING, locale='en',
+            datetime=now(), expires=now() + timedelta(days=10),
+            total=Decimal('23.00'),
+        )
+        OrderPosition.objects.create(order=o2, item=self.ticket, price=Decimal("23.00"), positionid=1)
+        with mock.patch('pretix.base.models.base._dispatch_logentries', wraps=_dispatch_logentries) as dispatch:
+            cancel_event(
+                self.event.pk, subevent=None,
+                auto_refund=True, keep_fee_fixed="0.00", keep_fee_percentage="0.00", keep_fee_per_ticket="",
+                send=True, send_subject="Event canceled", send_message="Event canceled :-(",
+                user=None
+            )
+        assert {
+            'pretix.event.order.canceled', 'pretix.event.order.refund.created', 'pretix.event.order.email.event_canceled'
+        } <= set(self.order.all_logentries().values_list('action_type', flat=True))
+        assert o2.all_logentries().filter(action_type='pretix.event.order.canceled').exists()
+        # One batch for the event and its items, one for everything that happened to each order
+        assert dispatch.call_count == 3
+
     @classscope(attr='o')
     def test_cancel_send_mail_attendees(self):
         self.op1.attendee_email = 'foo@example.com'
@@ -10,7 +10,8 @@ from freezegun import freeze_time
 
 from pretix.base.models import Checkin, Event, Order, OrderPosition, Organizer
 from pretix.base.services.checkin import (
-    CheckInError, RequiredQuestionsError, perform_checkin, process_exit_all,
+    CheckInError, LazyRuleVars, RequiredQuestionsError, compile_rules,
+    perform_checkin, process_exit_all,
 )
 
 
@@ -509,6 +510,47 @@ def test_rules_scan_days(event, position, clist):
         assert excinfo.value.code == 'rules'
 
 
+@pytest.mark.django_db
+def test_rules_entry_counts_single_query(event, position, clist, django_assert_num_queries):
+    clist.allow_multiple_entries = True
+    clist.rules = {"or": [{">": [{"var": "entries_today"}, 0]}, {"<": [{"var": "entries_days"}, 2]}]}
+    clist.save()
+    perform_checkin(position, clist, {})
+    perform_checkin(position, clist, {})
+
+    rules, variables = compile_rules(clist, event)
+    assert variables == {"entries_today", "entries_days"}
+    rule_data = LazyRuleVars(position, clist, now(), variables)
+    with django_assert_num_queries(1):
+        assert rules(rule_data)
+        assert rule_data['entries_today'] == 2
+        assert rule_data['entries_days'] == 1
+
+
+@pytest.mark.django_db
+def test_rules_compiled_follow_changes(event, position, clist):
+    clist.allow_multiple_entries = True
+    clist.rules = {"<": [{"var": "entries_number"}, 1]}
+    clist.save()
+    perform_checkin(position, clist, {})
+    with pytest.raises(CheckInError):
+        perform_checkin(position, clist, {})
+
+    clist.rules = {"<": [{"var": "entries_number"}, 2]}
+    clist.save()
+    perform_checkin(position, clist, {})
+
+    event.date_admission = now() + timedelta(hours=1)
+    event.save()
+    clist.rules = {"isAfter": [{"var": "now"}, {"buildTime": ["date_admission"]}]}
+    clist.save()
+    with pytest.raises(CheckInError):
+        perform_checkin(position, clist, {})
+    event.date_admission = now() - timedelta(hours=1)
+    event.save()
+    perform_checkin(position, clist, {})
+
+
 @pytest.mark.django_db
 def test_rules_time_isafter_tolerance(event, position, clist):
     # Ticket is valid starting 10 minutes before admission time
@@ -597,7 +639,7 @@ def test_rules_isafter_subevent(position, clist, event):
 
 @pytest.mark.django_db(transaction=True)
 def test_position_queries(django_assert_num_queries, position, clist):
-    with django_assert_num_queries(11) as captured:
+    with django_assert_num_queries(12) as captured:
         perform_checkin(position, clist, {})
     if 'sqlite' not in settings.DATABASES['default']['ENGINE']:
         assert any('FOR UPDATE' in s['sql'] for s in captured)
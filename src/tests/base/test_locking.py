@@ -1,10 +1,11 @@
 import time
 
 import pytest
+from django.test import override_settings
 from django.utils.timezone import now
 from django_scopes import scope, scopes_disabled
 
-from pretix.base.models import Event, Organizer
+from pretix.base.models import Event, Organizer, Quota
 from pretix.base.services import locking
 from pretix.base.services.locking import (
     LockReleaseException, LockTimeoutException,
@@ -54,3 +55,73 @@ def test_lock_timeout_steal(event):
     locking.lock_event(ev)
     with pytest.raises(LockReleaseException):
         locking.release_event(event)
+
+
+@pytest.mark.django_db
+def test_lock_waits_until_available(event, monkeypatch):
+    monkeypatch.setattr(locking, 'LOCK_TIMEOUT', 1)
+    locking.lock_event(event)
+    ev = Event.objects.get(id=event.id)
+    with override_settings(LOCK_MAX_WAIT=.5):
+        with pytest.raises(LockTimeoutException):
+            locking.lock_event(ev)
+    with override_settings(LOCK_MAX_WAIT=3):
+        t0 = time.monotonic()
+        locking.lock_event(ev)
+        assert time.monotonic() - t0 < 1.5
+    locking.release_event(ev)
+
+
+@pytest.fixture
+def quotas(event):
+    return (
+        Quota.objects.create(event=event, name='A', size=10),
+        Quota.objects.create(event=event, name='B', size=10),
+    )
+
+
+@pytest.mark.django_db
+@override_settings(LOCK_FINE_GRAINED=True)
+def test_fine_grained_disjoint_quotas(event, quotas):
+    with event.lock(quotas=[quotas[0]]):
+        ev = Event.objects.get(id=event.id)
+        with ev.lock(quotas=[quotas[1]]):
+            pass
+
+
+@pytest.mark.django_db
+@override_settings(LOCK_FINE_GRAINED=True)
+def test_fine_grained_same_quota(event, quotas):
+    with event.lock(quotas=quotas):
+        with pytest.raises(LockTimeoutException):
+            ev = Event.objects.get(id=event.id)
+            with ev.lock(quotas=[quotas[1]]):
+                pass
+    with event.lock(quotas=[quotas[1]]):
+        pass
+
+
+@pytest.mark.django_db
+@override_settings(LOCK_FINE_GRAINED=True)
+def test_fine_grained_conflicts_with_event_lock(event, quotas):
+    with event.lock(quotas=[quotas[0]]):
+        with pytest.raises(LockTimeoutException):
+            ev = Event.objects.get(id=event.id)
+            with ev.lock():
+                pass
+    with event.lock():
+        with pytest.raises(LockTimeoutException):
+            ev = Event.objects.get(id=event.id)
+            with ev.lock(quotas=[quotas[0]]):
+                pass
+        with event.lock(quotas=[quotas[0]]):
+            pass
+
+
+@pytest.mark.django_db
+def test_fine_grained_disabled(event, quotas):
+    with event.lock(quotas=[quotas[0]]):
+        with pytest.raises(LockTimeoutException):
+            ev = Event.objects.get(id=event.id)
+            with ev.lock(quotas=[quotas[1]]):
+                pass
@@ -0,0 +1,75 @@
+from unittest import mock
+
+import pytest
+from django.db import transaction
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Event, LogEntry, Organizer
+from pretix.base.models.base import log_batch
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    return Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+
+
+@pytest.mark.django_db
+@scopes_disabled()
+def test_log_batch(event):
+    with mock.patch('pretix.base.services.notifications.notify.apply_async') as notify, \
+            mock.patch('pretix.api.webhooks.notify_webhooks.apply_async') as notify_webhooks:
+        with log_batch():
+            with log_batch():
+                event.log_action('pretix.event.order.placed')
+                event.log_action('pretix.foo.bar')
+            event.log_action('pretix.event.order.paid')
+            assert not LogEntry.objects.exists()
+
+    ids = list(LogEntry.objects.order_by('pk').values_list('pk', flat=True))
+    assert len(ids) == 3
+    notify.assert_called_once_with(args=([ids[0], ids[2]],))
+    notify_webhooks.assert_called_once_with(args=([ids[0], ids[2]],))
+
+
+@pytest.mark.django_db(transaction=True)
+@scopes_disabled()
+def test_log_batch_discarded_on_rollback(event):
+    with pytest.raises(ZeroDivisionError):
+        with transaction.atomic(), log_batch():
+            event.log_action('pretix.event.changed')
+            1 / 0
+    assert not LogEntry.objects.exists()
+
+    with pytest.raises(ZeroDivisionError):
+        with log_batch():
+            event.log_action('pretix.event.changed')
+            1 / 0
+    assert LogEntry.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+@scopes_disabled()
+def test_log_batch_collects_committed_transactions(event):
+    with mock.patch('pretix.base.services.notifications.notify.apply_async') as notify, \
+            mock.patch('pretix.api.webhooks.notify_webhooks.apply_async'):
+        with log_batch():
+            with transaction.atomic():
+                event.log_action('pretix.event.order.placed')
+            # Written together with the change it records
+            assert LogEntry.objects.count() == 1
+            with pytest.raises(ZeroDivisionError), transaction.atomic():
+                event.log_action('pretix.event.order.canceled')
+                1 / 0
+            with transaction.atomic():
+                with pytest.raises(ZeroDivisionError), transaction.atomic():
+                    event.log_action('pretix.event.order.canceled')
+                    1 / 0
+                event.log_action('pretix.event.order.paid')
+            assert not notify.called
+
+    assert list(LogEntry.objects.order_by('pk').values_list('action_type', flat=True)) == [
+        'pretix.event.order.placed', 'pretix.event.order.paid'
+    ]
+    notify.assert_called_once()
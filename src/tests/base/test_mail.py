@@ -1,14 +1,26 @@
 import os
+import smtplib
+from unittest import mock
 
 import pytest
+import responses
 from django.conf import settings
 from django.core import mail as djmail
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail import SafeMIMEMultipart, get_connection
+from django.core.mail.backends.locmem import EmailBackend
+from django.test import override_settings
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 from django_scopes import scope
 
 from pretix.base.models import Event, Organizer, User
-from pretix.base.services.mail import mail
+from pretix.base.services import mail as mail_service
+from pretix.base.services.mail import (
+    attach_cid_images, load_image, mail, mail_batch,
+    replace_images_with_cid_paths,
+)
 
 
 @pytest.fixture
@@ -102,3 +114,124 @@ def test_sendmail_placeholder(env):
     assert len(djmail.outbox) == 1
     assert djmail.outbox[0].to == [user.email]
     assert djmail.outbox[0].subject == 'Dummy Test subject'
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_load_image_cached():
+    responses.add(responses.GET, 'https://example.org/logo.png', body=b'PNGDATA')
+    with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                               'LOCATION': 'mailimages'}}):
+        assert load_image('https://example.org/logo.png') == (b'PNGDATA', 'png')
+        assert load_image('https://example.org/logo.png') == (b'PNGDATA', 'png')
+    assert len(responses.calls) == 1
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_load_image_error():
+    responses.add(responses.GET, 'https://example.org/logo.png', status=404)
+    assert load_image('https://example.org/logo.png') is None
+
+
+@pytest.mark.django_db
+def test_load_image_from_static_files():
+    content, subtype = load_image(settings.STATIC_URL + 'pretixbase/img/pretix-logo.svg')
+    assert subtype == 'svg'
+    assert content.startswith(b'<')
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_attach_cid_images():
+    responses.add(responses.GET, 'https://example.org/a.png', body=b'A')
+    responses.add(responses.GET, 'https://example.org/b.gif', body=b'B')
+    html, images = replace_images_with_cid_paths(
+        '<p><img src="https://example.org/a.png"><img src="https://example.org/b.gif">'
+        '<img src="https://example.org/a.png"></p>'
+    )
+    assert images == ['https://example.org/a.png', 'https://example.org/b.gif']
+    msg = SafeMIMEMultipart(_subtype='related')
+    attach_cid_images(msg, images)
+    parts = msg.get_payload()
+    assert [p['Content-ID'] for p in parts] == ['<image_0>', '<image_1>']
+    assert [p.get_content_type() for p in parts] == ['image/png', 'image/gif']
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_load_image_from_media_files():
+    logo = default_storage.save('pub/test/logo.png', ContentFile(b'PNGDATA'))
+    secret = default_storage.save('invoices/secret.png', ContentFile(b'SECRET'))
+    assert load_image(settings.MEDIA_URL + logo) == (b'PNGDATA', 'png')
+    responses.add(responses.GET, 'http://example.com/media/' + secret, status=404)
+    assert load_image(settings.MEDIA_URL + secret) is None
+
+    for path in ('pub/%2e%2e/' + secret, 'pub/test/%2E%2E/%2e%2e/' + secret):
+        responses.add(responses.GET, 'http://example.com/media/' + path, status=404)
+        assert load_image(settings.MEDIA_URL + path) is None
+
+
+class DisconnectingBackend(EmailBackend):
+    disconnects = 1
+
+    def send_messages(self, messages):
+        if DisconnectingBackend.disconnects:
+            DisconnectingBackend.disconnects -= 1
+            raise smtplib.SMTPServerDisconnected()
+        return super().send_messages(messages)
+
+
+@pytest.mark.django_db
+def test_mail_batch(env):
+    djmail.outbox = []
+    mail_service._connections.pool = {}
+    event, user, organizer = env
+    with mock.patch('pretix.base.models.event.get_connection', wraps=get_connection) as gc:
+        with mail_batch():
+            for i in range(3):
+                mail('dummy{}@dummy.dummy'.format(i), 'Test subject', 'mailtest.txt', {}, event)
+            assert len(djmail.outbox) == 0
+        assert gc.call_count == 1
+    assert sorted(m.to[0] for m in djmail.outbox) == ['dummy0@dummy.dummy', 'dummy1@dummy.dummy', 'dummy2@dummy.dummy']
+
+
+@pytest.mark.django_db
+def test_mail_batch_sends_full_batches_right_away(env, monkeypatch):
+    djmail.outbox = []
+    event, user, organizer = env
+    monkeypatch.setattr('pretix.base.services.mail.BATCH_SIZE', 2)
+    with mail_batch():
+        for i in range(5):
+            mail('dummy{}@dummy.dummy'.format(i), 'Test subject', 'mailtest.txt', {}, event)
+            assert len(djmail.outbox) == i + 1 - (i + 1) % 2
+    assert len(djmail.outbox) == 5
+
+
+@pytest.mark.django_db
+def test_mail_batch_continues_after_error(env):
+    djmail.outbox = []
+    event, user, organizer = env
+    send_mail = mail_service._send_mail
+
+    def fail_second(*args, **kwargs):
+        if kwargs['to'] == ['dummy1@dummy.dummy']:
+            raise User.DoesNotExist()
+        return send_mail(*args, **kwargs)
+
+    with mock.patch('pretix.base.services.mail._send_mail', side_effect=fail_second):
+        with mail_batch():
+            for i in range(3):
+                mail('dummy{}@dummy.dummy'.format(i), 'Test subject', 'mailtest.txt', {}, event)
+    assert sorted(m.to[0] for m in djmail.outbox) == ['dummy0@dummy.dummy', 'dummy2@dummy.dummy']
+
+
+@pytest.mark.django_db
+@override_settings(EMAIL_BACKEND='tests.base.test_mail.DisconnectingBackend')
+def test_mail_reconnects_after_disconnect(env):
+    djmail.outbox = []
+    mail_service._connections.pool = {}
+    event, user, organizer = env
+    mail('dummy@dummy.dummy', 'Test subject', 'mailtest.txt', {}, event)
+    assert DisconnectingBackend.disconnects == 0
+    assert len(djmail.outbox) == 1
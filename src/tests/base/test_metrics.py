@@ -1,6 +1,7 @@
 # pytest
 
 import base64
+import time
 
 import pytest
 from django.test import override_settings
@@ -166,6 +167,74 @@ def test_histogram(monkeypatch):
     assert fake_redis.storage['my_histogram_bucket{dimension="two",le="1.0"}'] == 1
 
 
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=3600)
+def test_buffered_until_flush(monkeypatch):
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+
+    counter = metrics.Counter("buffered_counter", "this is a helpstring")
+    gauge = metrics.Gauge("buffered_gauge", "this is a helpstring")
+    counter.inc(2)
+    counter.inc(3)
+    gauge.inc(4)
+    gauge.set(1)
+    gauge.inc(2)
+    assert fake_redis.storage == {}
+
+    metrics.flush()
+    assert fake_redis.storage == {'buffered_counter': 5, 'buffered_gauge': 3}
+
+    counter.inc(1)
+    assert fake_redis.storage['buffered_counter'] == 5
+    metrics.flush()
+    assert fake_redis.storage['buffered_counter'] == 6
+
+
+class BrokenRedis(FakeRedis):
+
+    def execute(self):
+        raise ConnectionError()
+
+    def pipeline(self):
+        return BrokenRedis()
+
+
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=3600)
+def test_kept_if_flush_fails(monkeypatch):
+    monkeypatch.setattr(metrics, "redis", FakeRedis(), raising=False)
+    metrics.flush()
+    monkeypatch.setattr(metrics, "redis", BrokenRedis(), raising=False)
+    counter = metrics.Counter("failing_counter", "this is a helpstring")
+    gauge = metrics.Gauge("failing_gauge", "this is a helpstring")
+    counter.inc(2)
+    gauge.set(5)
+    metrics.flush()
+    counter.inc(1)
+    gauge.set(7)
+
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+    metrics.flush()
+    assert fake_redis.storage == {'failing_counter': 3, 'failing_gauge': 7}
+
+
+@override_settings(HAS_REDIS=True, METRICS_FLUSH_INTERVAL=0.1)
+def test_flushed_when_idle(monkeypatch):
+    fake_redis = FakeRedis()
+    monkeypatch.setattr(metrics, "redis", fake_redis, raising=False)
+    metrics.flush()
+    fake_redis.storage.clear()
+    monkeypatch.setattr(metrics, "_flush_thread", None)
+    monkeypatch.setattr(metrics, "_last_flush", time.monotonic())
+    metrics.Counter("idle_counter", "this is a helpstring").inc(1)
+    assert fake_redis.storage == {}
+    for i in range(50):
+        if fake_redis.storage:
+            break
+        time.sleep(0.1)
+    assert fake_redis.storage == {'idle_counter': 1}
+
+
 @pytest.mark.django_db
 @override_settings(HAS_REDIS=True, METRICS_USER="foo", METRICS_PASSPHRASE="bar")
 def test_metrics_view(monkeypatch, client):
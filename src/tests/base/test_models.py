@@ -3,6 +3,7 @@ import sys
 import time
 from datetime import date, timedelta
 from decimal import Decimal
+from unittest import mock
 
 import pytest
 import pytz
@@ -11,15 +12,17 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
 from django.utils.timezone import now
 from django_scopes import scope, scopes_disabled
 
 from pretix.base.i18n import language
 from pretix.base.models import (
     CachedFile, CartPosition, Checkin, CheckinList, Event, Item, ItemCategory,
-    ItemVariation, Order, OrderFee, OrderPayment, OrderPosition, OrderRefund,
-    Organizer, Question, Quota, SeatingPlan, User, Voucher, WaitingListEntry,
+    ItemVariation, Order, OrderFee, OrderPayment, OrderPosition,
+    OrderPositionCounter, OrderRefund, Organizer, Question, Quota, SeatingPlan,
+    User, Voucher, WaitingListEntry,
 )
 from pretix.base.models.event import SubEvent
 from pretix.base.models.items import (
@@ -27,7 +30,9 @@ from pretix.base.models.items import (
 )
 from pretix.base.reldate import RelativeDate, RelativeDateWrapper
 from pretix.base.services.orders import OrderError, cancel_order, perform_order
-from pretix.base.services.quotas import QuotaAvailability
+from pretix.base.services.quotas import (
+    QuotaAvailability, rebuild_position_counters,
+)
 from pretix.testutils.scope import classscope
 
 
@@ -525,6 +530,109 @@ class QuotaTestCase(BaseQuotaTestCase):
         assert self.quota.availability() == (Quota.AVAILABILITY_ORDERED, 0)
 
 
+@override_settings(PRETIX_QUOTA_COUNTERS=True)
+class QuotaCounterTestCase(QuotaTestCase):
+
+    @scopes_disabled()
+    def setUp(self):
+        super().setUp()
+        rebuild_position_counters(self.event)
+
+    def _counted(self, item, status):
+        return sum(c.count for c in OrderPositionCounter.objects.filter(event=self.event, item=item, status=status))
+
+    @classscope(attr='o')
+    def test_counters_are_used(self):
+        self.quota.items.add(self.item1)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        assert self._counted(self.item1, Order.STATUS_PAID) == 1
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 1)
+
+        OrderPositionCounter.objects.filter(event=self.event).update(count=0)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 2)
+
+        assert rebuild_position_counters(self.event) == 1
+        assert self._counted(self.item1, Order.STATUS_PAID) == 1
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 1)
+        assert rebuild_position_counters(self.event) == 0
+
+    @classscope(attr='o')
+    def test_locked_counters_are_skipped(self):
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        OrderPosition.objects.create(order=order, item=self.item2, price=2)
+        OrderPositionCounter.objects.filter(event=self.event).update(count=5)
+        busy = OrderPositionCounter.objects.get(event=self.event, item=self.item1)
+
+        # Simulates another transaction that has changed this counter but not committed yet
+        select_for_update = QuerySet.select_for_update
+        with mock.patch.object(QuerySet, 'select_for_update',
+                               lambda qs, **kwargs: select_for_update(qs, **kwargs).exclude(pk=busy.pk)):
+            assert rebuild_position_counters(self.event) == 1
+        assert self._counted(self.item1, Order.STATUS_PAID) == 5
+        assert self._counted(self.item2, Order.STATUS_PAID) == 1
+
+        assert rebuild_position_counters(self.event) == 1
+        assert self._counted(self.item1, Order.STATUS_PAID) == 1
+
+    @classscope(attr='o')
+    def test_counters_follow_order_lifecycle(self):
+        self.quota.items.add(self.item1)
+        self.quota.items.add(self.item2)
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        op1 = OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        op2 = OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        assert self._counted(self.item1, Order.STATUS_PENDING) == 2
+
+        order.status = Order.STATUS_PAID
+        order.save()
+        assert self._counted(self.item1, Order.STATUS_PENDING) == 0
+        assert self._counted(self.item1, Order.STATUS_PAID) == 2
+
+        op1.item = self.item2
+        op1.variation = self.var1
+        op1.save()
+        assert self._counted(self.item1, Order.STATUS_PAID) == 1
+        assert self._counted(self.item2, Order.STATUS_PAID) == 1
+
+        op2.canceled = True
+        op2.save(update_fields=['canceled'])
+        assert self._counted(self.item1, Order.STATUS_PAID) == 0
+
+        cancel_order(order)
+        assert self._counted(self.item2, Order.STATUS_PAID) == 0
+        assert rebuild_position_counters(self.event) == 0
+
+    @classscope(attr='o')
+    def test_counters_follow_deletion(self):
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PENDING,
+                                     expires=now() + timedelta(days=3),
+                                     total=4, testmode=True)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        assert self._counted(self.item1, Order.STATUS_PENDING) == 1
+        order.gracefully_delete()
+        assert self._counted(self.item1, Order.STATUS_PENDING) == 0
+        assert rebuild_position_counters(self.event) == 0
+
+    @classscope(attr='o')
+    def test_not_used_before_sync(self):
+        self.quota.items.add(self.item1)
+        del self.event.settings.quota_counters_synced
+        order = Order.objects.create(event=self.event, status=Order.STATUS_PAID,
+                                     expires=now() + timedelta(days=3),
+                                     total=4)
+        OrderPosition.objects.create(order=order, item=self.item1, price=2)
+        OrderPositionCounter.objects.filter(event=self.event).update(count=0)
+        assert self.quota.availability() == (Quota.AVAILABILITY_OK, 1)
+
+
 class CheckinQuotaTestCase(BaseQuotaTestCase):
 
     @scopes_disabled()
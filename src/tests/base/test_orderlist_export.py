@@ -0,0 +1,199 @@
+import csv
+import datetime
+import io
+import json
+import tempfile
+from decimal import Decimal
+
+import pytest
+import pytz
+from django.test import override_settings
+from django.utils import translation
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.exporter import OrderSnapshot
+from pretix.base.exporters.json import JSONExporter
+from pretix.base.exporters.orderlist import OrderListExporter
+from pretix.base.models import (
+    Event, Item, Order, OrderFee, OrderPosition, Organizer,
+)
+from pretix.base.services.invoices import generate_invoice
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    # Column headers are translated, other tests in the same process might have activated a different language
+    with scope(organizer=o), translation.override('en'):
+        event = Event.objects.create(
+            organizer=o, name='Dummy', slug='dummy',
+            date_from=now(),
+        )
+        item = Item.objects.create(event=event, name="Ticket", default_price=23, admission=True)
+        for i in range(5):
+            order = Order.objects.create(
+                code='FOO{}'.format(i), event=event, email='dummy@dummy.test',
+                status=Order.STATUS_PAID,
+                datetime=datetime.datetime(2019, 2, 22, 14, i, 0, tzinfo=pytz.UTC),
+                expires=now() + datetime.timedelta(days=10),
+                total=23 + i, locale='en'
+            )
+            OrderPosition.objects.create(order=order, item=item, variation=None, price=Decimal("23"))
+            OrderFee.objects.create(order=order, fee_type=OrderFee.FEE_TYPE_PAYMENT, value=Decimal(i))
+        yield event
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('chunk_size', [2, 1000])
+def test_order_sheet_chunked(event, monkeypatch, chunk_size):
+    monkeypatch.setattr(OrderListExporter, 'chunk_size', chunk_size)
+    ex = OrderListExporter(event)
+    with tempfile.TemporaryFile() as f:
+        fname, ftype, data = ex.render({
+            '_format': 'orders:default',
+            'paid_only': True,
+            'include_payment_amounts': False,
+            'group_multiple_choice': False,
+        }, output_file=f)
+        assert data is None
+        assert not f.closed
+        f.seek(0)
+        rows = list(csv.reader(io.TextIOWrapper(f, encoding='utf-8')))
+
+    header = rows[0]
+    assert [r[header.index('Order code')] for r in rows[1:]] == ['FOO0', 'FOO1', 'FOO2', 'FOO3', 'FOO4']
+    assert [Decimal(r[header.index('Fees')]) for r in rows[1:]] == [0, 1, 2, 3, 4]
+
+
+def _render_orders(event, incremental, sheet='orders'):
+    ex = OrderListExporter(event)
+    fname, ftype, data = ex.render({
+        '_format': '{}:default'.format(sheet),
+        'paid_only': False,
+        'include_payment_amounts': False,
+        'group_multiple_choice': False,
+        'incremental': incremental,
+    })
+    return list(csv.reader(io.StringIO(data.decode())))
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+def test_order_sheet_incremental(event, monkeypatch):
+    monkeypatch.setattr(OrderSnapshot, 'OVERLAP', datetime.timedelta(0))
+    iterated = []
+    iterate_orders = OrderListExporter.iterate_orders
+
+    def spy(self, form_data, order_ids=None):
+        iterated.append(order_ids)
+        return iterate_orders(self, form_data, order_ids)
+
+    monkeypatch.setattr(OrderListExporter, 'iterate_orders', spy)
+
+    with scope(organizer=event.organizer):
+        assert _render_orders(event, True) == _render_orders(event, False)
+        iterated.clear()
+
+        o = event.orders.get(code='FOO1')
+        o.email = 'changed@dummy.test'
+        o.save()
+        o2 = event.orders.get(code='FOO3')
+        o2.status = Order.STATUS_PENDING
+        o2.save()
+        rows = _render_orders(event, True)
+        assert iterated == [{o.pk, o2.pk}]
+        assert rows == _render_orders(event, False)
+        assert rows[2][rows[0].index('Email')] == 'changed@dummy.test'
+
+        # Changes to the event invalidate the snapshot
+        iterated.clear()
+        Item.objects.get(event=event).save()
+        _render_orders(event, True)
+        assert iterated == [None]
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+def test_order_sheet_incremental_invoice(event, monkeypatch):
+    monkeypatch.setattr(OrderSnapshot, 'OVERLAP', datetime.timedelta(0))
+    with scope(organizer=event.organizer):
+        _render_orders(event, True)
+        o = event.orders.get(code='FOO2')
+        inv = generate_invoice(o)
+        rows = _render_orders(event, True)
+        assert rows == _render_orders(event, False)
+        assert rows[3][rows[0].index('Invoice numbers')] == inv.number
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+def test_fee_sheet_incremental_orders_without_fees(event, monkeypatch):
+    monkeypatch.setattr(OrderSnapshot, 'OVERLAP', datetime.timedelta(0))
+    iterated = []
+    iterate_fees = OrderListExporter.iterate_fees
+
+    def spy(self, form_data, order_ids=None):
+        iterated.append(order_ids)
+        return iterate_fees(self, form_data, order_ids)
+
+    monkeypatch.setattr(OrderListExporter, 'iterate_fees', spy)
+
+    with scope(organizer=event.organizer):
+        OrderFee.objects.filter(order__code__in=['FOO1', 'FOO3']).delete()
+        rows = _render_orders(event, True, 'fees')
+        assert len(rows) == 4
+        assert rows == _render_orders(event, False, 'fees')
+        iterated.clear()
+
+        # Orders without fees are part of the snapshot and are not generated again
+        assert _render_orders(event, True, 'fees') == rows
+        assert iterated == [set()]
+        iterated.clear()
+
+        o = event.orders.get(code='FOO2')
+        o.email = 'changed@dummy.test'
+        o.save()
+        rows = _render_orders(event, True, 'fees')
+        assert iterated == [{o.pk}]
+        assert rows == _render_orders(event, False, 'fees')
+        assert rows[2][rows[0].index('Email')] == 'changed@dummy.test'
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+def test_fee_sheet_incremental_progress_total(event, monkeypatch):
+    monkeypatch.setattr(OrderSnapshot, 'OVERLAP', datetime.timedelta(0))
+    form_data = {
+        'paid_only': False,
+        'include_payment_amounts': False,
+        'group_multiple_choice': False,
+        'incremental': True,
+    }
+    with scope(organizer=event.organizer):
+        OrderFee.objects.filter(order__code__in=['FOO1', 'FOO3']).delete()
+        _render_orders(event, True, 'fees')
+        o = event.orders.get(code='FOO2')
+        o.email = 'changed@dummy.test'
+        o.save()
+        lines = list(OrderListExporter(event).iterate_sheet(form_data, 'fees'))
+
+    totals = [line.total for line in lines if isinstance(line, OrderListExporter.ProgressSetTotal)]
+    # The total is counted in rows, not in orders
+    assert totals == [3]
+    assert len(lines) == 1 + 1 + 3
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+def test_json_incremental(event, monkeypatch):
+    monkeypatch.setattr(OrderSnapshot, 'OVERLAP', datetime.timedelta(0))
+    with scope(organizer=event.organizer):
+        ex = JSONExporter(event)
+        assert ex.render({'incremental': True}) == ex.render({})
+        o = event.orders.get(code='FOO1')
+        o.email = 'changed@dummy.test'
+        o.save()
+        data = ex.render({'incremental': True})
+        assert data == ex.render({})
+        assert json.loads(data[2])['event']['orders'][3]['user'] == 'changed@dummy.test'
@@ -0,0 +1,237 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+import pytz
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scope, scopes_disabled
+
+from pretix.base.models import (
+    Event, Item, Order, OrderPayment, OrderPosition, Organizer,
+    OutdatedSalesRollup, SalesRollup, StatisticsRollup,
+)
+from pretix.base.services.stats import (
+    mark_modified_orders_outdated, mark_sales_rollup_outdated, order_overview,
+    rebuild_sales_rollup, refresh_sales_rollup, refresh_sales_rollups_periodic,
+    sales_rollup_ready,
+)
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(organizer=o, name='Dummy', slug='dummy', date_from=now())
+    event.settings.timezone = 'Europe/Berlin'
+    return event
+
+
+def _create_order(event, item, dt, status=Order.STATUS_PAID, price=Decimal('23.00')):
+    with scope(organizer=event.organizer):
+        o = Order.objects.create(
+            event=event, email='dummy@dummy.test', status=status, locale='en',
+            datetime=dt, expires=now() + timedelta(days=10), total=price,
+        )
+        OrderPosition.objects.create(order=o, item=item, price=price)
+    return o
+
+
+def _overview(event, **kwargs):
+    with scope(organizer=event.organizer):
+        items_by_category, total = order_overview(event, **kwargs)
+    return total['num']
+
+
+@pytest.mark.django_db
+def test_refresh(event):
+    item = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    # 23:30 UTC is already the next day in Berlin
+    _create_order(event, item, datetime(2020, 3, 1, 12, 0, tzinfo=pytz.UTC))
+    _create_order(event, item, datetime(2020, 3, 1, 23, 30, tzinfo=pytz.UTC), status=Order.STATUS_PENDING)
+    mark_sales_rollup_outdated(event)
+    # Rebuilding the whole event is left to the periodic task, in the meantime we look at the orders
+    assert not refresh_sales_rollup(event)
+    assert not SalesRollup.objects.exists()
+    assert _overview(event)['paid'] == (1, Decimal('23.00'), Decimal('23.00'))
+
+    assert refresh_sales_rollup(event, full=True)
+    assert not OutdatedSalesRollup.objects.exists()
+    assert sorted(SalesRollup.objects.values_list('date', 'status', 'count')) == [
+        (date(2020, 3, 1), 'p', 1),
+        (date(2020, 3, 2), 'n', 1),
+    ]
+
+    num = _overview(event)
+    assert num['paid'] == (1, Decimal('23.00'), Decimal('23.00'))
+    assert num['pending'] == (1, Decimal('23.00'), Decimal('23.00'))
+    assert num['total'] == (2, Decimal('46.00'), Decimal('46.00'))
+
+    num = _overview(event, date_filter='order_date', date_from=date(2020, 3, 2), date_until=date(2020, 3, 2))
+    assert num['paid'] == (0, 0, 0)
+    assert num['pending'] == (1, Decimal('23.00'), Decimal('23.00'))
+
+    # Only the outdated day is recomputed
+    _create_order(event, item, datetime(2020, 3, 1, 13, 0, tzinfo=pytz.UTC), status=Order.STATUS_CANCELED)
+    OutdatedSalesRollup.objects.create(event=event, date=date(2020, 3, 1))
+    with scopes_disabled():
+        Order.objects.filter(status=Order.STATUS_PENDING).update(status=Order.STATUS_EXPIRED)
+    num = _overview(event)
+    assert num['canceled'] == (1, Decimal('23.00'), Decimal('23.00'))
+    assert num['pending'] == (1, Decimal('23.00'), Decimal('23.00'))
+    assert num['expired'] == (0, 0, 0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_updated_on_commit(event):
+    item = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    refresh_sales_rollup(event, full=True)
+    o = _create_order(event, item, now(), status=Order.STATUS_PENDING)
+    assert _overview(event)['pending'][0] == 1
+
+    with scope(organizer=event.organizer):
+        o.status = Order.STATUS_PAID
+        o.save(update_fields=['status'])
+    num = _overview(event)
+    assert num['pending'][0] == 0
+    assert num['paid'][0] == 1
+
+    with scope(organizer=event.organizer):
+        p = o.positions.get()
+        p.canceled = True
+        p.save()
+    num = _overview(event)
+    assert num['paid'][0] == 0
+    assert num['canceled'][0] == 1
+
+    with scope(organizer=event.organizer):
+        OrderPosition.all.filter(order=o).delete()
+        o.delete()
+    assert _overview(event)['canceled'][0] == 0
+    assert not SalesRollup.objects.exists()
+
+
+@pytest.mark.django_db
+def test_lost_marks_are_repaired(event):
+    item = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    o = _create_order(event, item, datetime(2020, 3, 1, 12, 0, tzinfo=pytz.UTC), status=Order.STATUS_PENDING)
+    refresh_sales_rollup(event, full=True)
+    mark_modified_orders_outdated()
+    assert refresh_sales_rollup(event)
+
+    with scope(organizer=event.organizer):
+        o.status = Order.STATUS_PAID
+        o.save()
+    # Transactions are never committed in tests, as if the marks had been lost
+    assert not OutdatedSalesRollup.objects.exists()
+    assert _overview(event)['paid'][0] == 0
+
+    mark_modified_orders_outdated()
+    assert list(OutdatedSalesRollup.objects.values_list('date', flat=True)) == [date(2020, 3, 1)]
+    assert _overview(event)['paid'][0] == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_timezone_change(event):
+    assert OutdatedSalesRollup.objects.filter(event=event, date__isnull=True).exists()
+    refresh_sales_rollup(event, full=True)
+
+    event.settings.timezone = 'Europe/Berlin'
+    assert not OutdatedSalesRollup.objects.exists()
+    event.settings.timezone = 'America/New_York'
+    assert OutdatedSalesRollup.objects.filter(event=event, date__isnull=True).exists()
+    assert not refresh_sales_rollup(event)
+
+    refresh_sales_rollup(event, full=True)
+    del event.settings.timezone
+    assert OutdatedSalesRollup.objects.filter(event=event, date__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_rebuild_command(event):
+    item = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    _create_order(event, item, now())
+    assert not SalesRollup.objects.exists()
+    call_command('build_sales_rollup', rebuild=True)
+    assert SalesRollup.objects.get().count == 1
+    assert not OutdatedSalesRollup.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+def test_periodic_rebuilds_events_in_background(event):
+    item = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    _create_order(event, item, now())
+    mark_sales_rollup_outdated(event)
+    with mock.patch('pretix.base.services.stats.rebuild_sales_rollup.apply_async') as m:
+        refresh_sales_rollups_periodic(sender=None)
+    m.assert_called_once_with(kwargs={'event': event.pk}, queue='background')
+    assert not SalesRollup.objects.exists()
+
+    rebuild_sales_rollup.apply(kwargs={'event': event.pk})
+    assert SalesRollup.objects.get().count == 1
+    assert not OutdatedSalesRollup.objects.exists()
+
+
+@pytest.mark.django_db
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+def test_read_refreshes_in_background(event):
+    item = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    refresh_sales_rollup(event, full=True)
+    _create_order(event, item, datetime(2020, 3, 1, 12, 0, tzinfo=pytz.UTC))
+    mark_sales_rollup_outdated(event, date(2020, 3, 1))
+    with mock.patch('pretix.base.services.stats.rebuild_sales_rollup.apply_async') as m:
+        # Slightly outdated rows are served while the refresh is scheduled only once
+        assert sales_rollup_ready(event)
+        assert sales_rollup_ready(event)
+    m.assert_called_once_with(kwargs={'event': event.pk})
+    assert not SalesRollup.objects.exists()
+
+    rebuild_sales_rollup.apply(kwargs={'event': event.pk})
+    assert SalesRollup.objects.get().count == 1
+    assert sales_rollup_ready(event)
+
+
+@pytest.mark.django_db
+def test_statistics(event):
+    item = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    o1 = _create_order(event, item, datetime(2020, 3, 1, 12, 0, tzinfo=pytz.UTC))
+    with scope(organizer=event.organizer):
+        o1.payments.create(provider='manual', amount=o1.total, state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+                           payment_date=datetime(2020, 3, 3, 12, 0, tzinfo=pytz.UTC))
+    _create_order(event, item, datetime(2020, 3, 1, 13, 0, tzinfo=pytz.UTC), status=Order.STATUS_PENDING)
+    mark_sales_rollup_outdated(event)
+    refresh_sales_rollup(event, full=True)
+    assert list(StatisticsRollup.objects.order_by('revenue').values_list(
+        'subevent', 'date', 'payment_date', 'orders', 'revenue'
+    )) == [
+        (None, date(2020, 3, 1), None, 1, Decimal('0.00')),
+        (None, date(2020, 3, 1), date(2020, 3, 3), 1, Decimal('23.00')),
+    ]
+
+
+@pytest.mark.django_db
+def test_statistics_subevents(event):
+    event.has_subevents = True
+    event.save()
+    item = Item.objects.create(event=event, name='Ticket', default_price=23, admission=True)
+    with scope(organizer=event.organizer):
+        se1 = event.subevents.create(name='Foo', date_from=now())
+        se2 = event.subevents.create(name='Bar', date_from=now())
+    o = _create_order(event, item, datetime(2020, 3, 1, 12, 0, tzinfo=pytz.UTC))
+    with scope(organizer=event.organizer):
+        o.payments.create(provider='manual', amount=o.total, state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+                          payment_date=datetime(2020, 3, 1, 12, 0, tzinfo=pytz.UTC))
+        o.all_positions.update(subevent=se1)
+        OrderPosition.objects.create(order=o, item=item, price=Decimal('10.00'), subevent=se1)
+        OrderPosition.objects.create(order=o, item=item, price=Decimal('5.00'), subevent=se2)
+    mark_sales_rollup_outdated(event)
+    refresh_sales_rollup(event, full=True)
+    assert sorted(
+        StatisticsRollup.objects.filter(subevent__isnull=False).values_list('subevent', 'orders', 'revenue')
+    ) == [
+        (se1.pk, 1, Decimal('33.00')),
+        (se2.pk, 1, Decimal('5.00')),
+    ]
+    assert StatisticsRollup.objects.get(subevent__isnull=True).revenue == Decimal('23.00')
@@ -0,0 +1,139 @@
+from datetime import timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils.timezone import now
+from django_scopes import scope, scopes_disabled
+
+from pretix.base.models import (
+    Event, Invoice, InvoiceAddress, Item, Order, OrderPosition,
+    OrderSearchIndex, Organizer,
+)
+from pretix.base.services.search import (
+    build_search_index, order_search_q, search_index_ready,
+    update_modified_orders, update_search_index,
+)
+from pretix.base.settings import GlobalSettingsObject
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    return Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy',
+        date_from=now(),
+    )
+
+
+@pytest.fixture
+def order(event):
+    o = Order.objects.create(
+        code='FOO', event=event, email='dummy@dummy.test',
+        status=Order.STATUS_PENDING, locale='en',
+        datetime=now(), expires=now() + timedelta(days=10),
+        total=Decimal('23.00'),
+    )
+    item = Item.objects.create(event=event, name='Ticket', default_price=23)
+    OrderPosition.objects.create(order=o, item=item, price=Decimal('23.00'), attendee_name_parts={'_legacy': 'Peter Meier'},
+                                 attendee_email='peter@example.org')
+    InvoiceAddress.objects.create(order=o, company='ACME Corp.', name_parts={'_legacy': 'Anna Schmidt'})
+    return o
+
+
+def _search(query):
+    with scopes_disabled():
+        return list(Order.objects.filter(order_search_q(query)).values_list('code', flat=True))
+
+
+@pytest.mark.django_db
+def test_build_index(order):
+    assert order_search_q('foo') is None
+    assert not search_index_ready()
+    assert build_search_index(limit=1) == 1
+    assert not search_index_ready()
+    assert build_search_index(limit=1) == 0
+    assert search_index_ready()
+
+    entry = OrderSearchIndex.objects.get(order=order)
+    assert 'peter meier' in entry.text
+    assert 'acme corp.' in entry.text
+    with scopes_disabled():
+        secret = order.positions.first().secret
+    assert '\np:{}\n'.format(secret.lower()) in entry.keys
+
+    assert _search('FOO') == ['FOO']
+    assert _search('dummy-FOO') == ['FOO']
+    assert _search('Peter@Example') == ['FOO']
+    assert _search('Schmidt') == ['FOO']
+    assert _search('acme') == ['FOO']
+    assert _search('Müller') == []
+
+
+@pytest.mark.django_db
+def test_search_semantics(order, event):
+    with scopes_disabled():
+        p = order.positions.first()
+        p.secret = 'abcdefgh'
+        p.pseudonymization_id = 'XYZ123'
+        p.save()
+        Invoice.objects.create(order=order, event=event, organizer=event.organizer, prefix='INV-',
+                               invoice_no='00042', full_invoice_no='INV-00042', date=now().date(), locale='en')
+    build_search_index()
+
+    # Secrets and pseudonymization IDs match from their start
+    assert _search('abcd') == ['FOO']
+    assert _search('cdef') == []
+    assert _search('xyz1') == ['FOO']
+    assert _search('z123') == []
+    # Invoice numbers only match as a whole
+    assert _search('00042') == ['FOO']
+    assert _search('42') == ['FOO']
+    assert _search('inv-00042') == ['FOO']
+    assert _search('0004') == []
+    assert _search('inv-0004') == []
+    # Event slug and order code are matched independently
+    assert _search('FO') == ['FOO']
+    assert _search('umm-FO') == ['FOO']
+    assert _search('other-FOO') == []
+
+
+@pytest.mark.django_db
+def test_update_index(order):
+    build_search_index()
+    with scope(organizer=order.event.organizer):
+        p = order.positions.first()
+        p.attendee_email = 'paul@example.org'
+        p.save()
+    # Transactions are never committed in tests
+    assert _search('paul@example') == []
+    update_search_index([order.pk])
+    assert _search('paul@example') == ['FOO']
+    assert _search('peter@example') == []
+
+
+@pytest.mark.django_db
+def test_lost_updates_are_repaired(order):
+    build_search_index()
+    update_modified_orders()
+    with scope(organizer=order.event.organizer):
+        p = order.positions.first()
+        p.attendee_email = 'paul@example.org'
+        p.save()
+    # Transactions are never committed in tests, so the update is lost just like after a crash
+    assert _search('paul@example') == []
+    update_modified_orders()
+    assert _search('paul@example') == ['FOO']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_update_index_on_commit(order):
+    GlobalSettingsObject().settings.set('order_search_index_ready', True)
+    assert _search('peter@example') == ['FOO']
+    with scope(organizer=order.event.organizer):
+        order.email = 'other@example.com'
+        order.save()
+        order.invoice_address.company = 'Example Ltd.'
+        order.invoice_address.save()
+    assert _search('other@example') == ['FOO']
+    assert _search('example ltd') == ['FOO']
+    assert _search('acme') == []
@@ -0,0 +1,194 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scope
+
+from pretix.base.models import (
+    CachedCombinedTicket, CachedTicket, Event, Item, Order, OrderPosition,
+    Organizer,
+)
+from pretix.base.services.cleanup import clean_outdated_cached_tickets
+from pretix.base.services.tickets import (
+    invalidate_cache, pregenerate, pregenerate_event, pregenerate_order,
+)
+
+
+@pytest.fixture
+def event():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(
+        organizer=o, name='Dummy', slug='dummy',
+        date_from=now(), plugins='tests.testdummy'
+    )
+    event.settings.ticket_download = True
+    event.settings.ticketoutput_testdummy__enabled = True
+    return event
+
+
+@pytest.fixture
+def order(event):
+    o = Order.objects.create(
+        code='FOO', event=event, email='dummy@dummy.test',
+        status=Order.STATUS_PENDING, locale='en',
+        datetime=now(), expires=now() + timedelta(days=10),
+        total=Decimal('23.00'),
+    )
+    item = Item.objects.create(event=event, name='Ticket', default_price=23)
+    OrderPosition.objects.create(order=o, item=item, price=Decimal('23.00'))
+    OrderPosition.objects.create(order=o, item=item, price=Decimal('23.00'))
+    return o
+
+
+@pytest.mark.django_db
+def test_pregenerate(event, order):
+    with scope(organizer=event.organizer):
+        assert pregenerate(order) == 3
+        assert CachedTicket.objects.filter(order_position__order=order, provider='testdummy').count() == 2
+        assert CachedCombinedTicket.objects.filter(order=order, provider='testdummy').count() == 1
+        assert pregenerate(order) == 0
+
+
+@pytest.mark.django_db
+def test_pregenerate_disabled_output(event, order):
+    event.settings.ticketoutput_testdummy__enabled = False
+    with scope(organizer=event.organizer):
+        assert pregenerate(order) == 0
+
+
+@pytest.mark.django_db
+@override_settings(TICKET_PREGENERATE=True)
+def test_pregenerate_on_payment(event, order, django_capture_on_commit_callbacks):
+    with scope(organizer=event.organizer):
+        with django_capture_on_commit_callbacks(execute=True):
+            order.payments.create(
+                provider='manual', amount=order.total
+            ).confirm()
+        assert CachedTicket.objects.filter(order_position__order=order).count() == 2
+
+
+@pytest.mark.django_db
+def test_pregenerate_order_skips_canceled(event, order):
+    order.status = Order.STATUS_CANCELED
+    order.save()
+    pregenerate_order.apply(args=(order.pk,))
+    with scope(organizer=event.organizer):
+        assert not CachedTicket.objects.exists()
+        order.status = Order.STATUS_PAID
+        order.save()
+    pregenerate_order.apply(args=(order.pk,))
+    with scope(organizer=event.organizer):
+        assert CachedTicket.objects.filter(order_position__order=order).count() == 2
+
+
+@pytest.mark.django_db
+@override_settings(TICKET_PREGENERATE=True)
+def test_pregenerate_after_invalidation(event, order):
+    with scope(organizer=event.organizer):
+        order.status = Order.STATUS_PAID
+        order.save()
+        pregenerate(order)
+        old = set(CachedTicket.objects.values_list('pk', flat=True))
+    invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy', 'regenerate': True})
+    with scope(organizer=event.organizer):
+        new = set(CachedTicket.objects.values_list('pk', flat=True))
+        assert len(new) == 2
+        assert not old & new
+
+
+@pytest.mark.django_db
+@override_settings(TICKET_PREGENERATE=True)
+def test_no_pregenerate_after_other_invalidation(event, order):
+    with scope(organizer=event.organizer):
+        order.status = Order.STATUS_PAID
+        order.save()
+        item = order.positions.first().item_id
+    with mock.patch('pretix.base.services.tickets.pregenerate_event.apply_async') as m:
+        invalidate_cache.apply(kwargs={'event': event.pk})
+        invalidate_cache.apply(kwargs={'event': event.pk, 'item': item})
+    assert not m.called
+
+
+@pytest.mark.django_db
+@override_settings(TICKET_PREGENERATE=True, CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+def test_pregenerate_event_coalesced(event, order):
+    with mock.patch('pretix.base.services.tickets.pregenerate_event.apply_async') as m:
+        invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy', 'regenerate': True})
+        invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy', 'regenerate': True})
+        assert m.call_count == 1
+    pregenerate_event.apply(kwargs={'event': event.pk})
+    with mock.patch('pretix.base.services.tickets.pregenerate_event.apply_async') as m:
+        invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy', 'regenerate': True})
+        assert m.call_count == 1
+
+
+@pytest.mark.django_db
+@override_settings(TICKET_PREGENERATE=True, CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+})
+def test_pregenerate_event_for_item(event, order):
+    with scope(organizer=event.organizer):
+        item = order.positions.first().item_id
+    with mock.patch('pretix.base.services.tickets.pregenerate_event.apply_async') as m:
+        invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy', 'item': item, 'regenerate': True})
+        invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy', 'regenerate': True})
+        assert [c[1]['kwargs']['item'] for c in m.call_args_list] == [item, None]
+    pregenerate_event.apply(kwargs={'event': event.pk, 'item': item})
+    with mock.patch('pretix.base.services.tickets.pregenerate_event.apply_async') as m:
+        invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy', 'item': item, 'regenerate': True})
+        invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy', 'regenerate': True})
+        assert m.call_count == 1
+
+
+@pytest.mark.django_db
+def test_pregenerate_command(event, order):
+    order.status = Order.STATUS_PAID
+    order.save()
+    call_command('pregenerate_tickets', 'dummy', 'dummy')
+    with scope(organizer=event.organizer):
+        assert CachedTicket.objects.filter(order_position__order=order).count() == 2
+
+
+@pytest.mark.django_db
+def test_invalidate_event(event, order):
+    with scope(organizer=event.organizer):
+        pregenerate(order)
+        assert CachedTicket.objects.current(event).count() == 2
+    invalidate_cache.apply(kwargs={'event': event.pk, 'provider': 'testdummy'})
+    with scope(organizer=event.organizer):
+        event = Event.objects.get(pk=event.pk)
+        assert CachedTicket.objects.count() == 2
+        assert CachedTicket.objects.current(event).count() == 0
+        assert CachedCombinedTicket.objects.current(event).count() == 0
+        assert pregenerate(Order.objects.get(pk=order.pk)) == 3
+
+
+@pytest.mark.django_db
+def test_invalidate_order(event, order):
+    with scope(organizer=event.organizer):
+        pregenerate(order)
+    invalidate_cache.apply(kwargs={'event': event.pk, 'order': order.pk})
+    with scope(organizer=event.organizer):
+        assert event.settings.ticket_cache_generation == 0
+        assert CachedTicket.objects.current(event).count() == 0
+        assert CachedCombinedTicket.objects.current(event).count() == 0
+
+
+@pytest.mark.django_db
+def test_clean_outdated(event, order):
+    with scope(organizer=event.organizer):
+        pregenerate(order)
+        ct = CachedTicket.objects.first()
+        ct.generation = -1
+        ct.save()
+    clean_outdated_cached_tickets(sender=None)
+    with scope(organizer=event.organizer):
+        assert not CachedTicket.objects.filter(pk=ct.pk).exists()
+        assert CachedTicket.objects.count() == 1
+        assert CachedCombinedTicket.objects.count() == 1
@@ -5,9 +5,12 @@ from decimal import Decimal
 import pytest
 import responses
 from django.db import transaction
+from django.test import override_settings
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
+from pretix.api import webhooks
+from pretix.api.webhooks import notify_webhooks, send_webhooks
 from pretix.base.models import Event, Item, Order, OrderPosition, Organizer
 
 
@@ -200,3 +203,62 @@ def test_webhook_disable_gone(event, order, webhook, monkeypatch_on_commit):
     assert len(responses.calls) == 1
     webhook.refresh_from_db()
     assert not webhook.enabled
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batch(event, order, webhook, monkeypatch):
+    monkeypatch.setattr("pretix.api.webhooks.notify_webhooks.apply_async", lambda args: None)
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with transaction.atomic():
+        le1 = order.log_action('pretix.event.order.placed', {})
+        le2 = order.log_action('pretix.event.order.paid', {})
+    notify_webhooks.apply(args=([le1.pk, le2.pk],))
+    assert len(responses.calls) == 2
+    # Delivered in the order they have been logged, not sorted by action type
+    assert [json.loads(force_str(c.request.body))['notification_id'] for c in responses.calls] == [le1.pk, le2.pk]
+    with scopes_disabled():
+        assert webhook.calls.filter(success=True).count() == 2
+
+
+@pytest.mark.django_db
+@responses.activate
+def test_webhook_batch_continues_after_error(event, order, webhook, monkeypatch):
+    monkeypatch.setattr("pretix.api.webhooks.notify_webhooks.apply_async", lambda args: None)
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with transaction.atomic():
+        le = order.log_action('pretix.event.order.paid', {})
+    send_webhooks.apply(args=(webhook.pk, [(le.pk + 1000, 'pretix.event.order.paid'), (le.pk, 'pretix.event.order.paid')]))
+    assert len(responses.calls) == 1
+    assert json.loads(force_str(responses.calls[0].request.body))['notification_id'] == le.pk
+
+
+def test_webhook_sessions_are_limited(monkeypatch):
+    monkeypatch.setattr(webhooks, 'MAX_SESSIONS', 2)
+    monkeypatch.setattr(webhooks, '_sessions', webhooks.OrderedDict())
+    s1 = webhooks._get_session('https://a.example.com/hook')
+    s2 = webhooks._get_session('https://b.example.com/hook')
+    assert webhooks._get_session('https://a.example.com/other') is s1
+    webhooks._get_session('https://c.example.com/hook')
+    assert list(webhooks._sessions) == ['https://a.example.com', 'https://c.example.com']
+    assert webhooks._get_session('https://b.example.com/hook') is not s2
+
+
+@pytest.mark.django_db
+@responses.activate
+@override_settings(WEBHOOK_LOG_SUCCESS_RATE=0, WEBHOOK_LOG_PAYLOAD_LENGTH=10)
+def test_webhook_call_logging(event, order, webhook, monkeypatch_on_commit):
+    responses.add(responses.POST, 'https://google.com', status=200)
+    with transaction.atomic():
+        order.log_action('pretix.event.order.paid', {})
+    assert len(responses.calls) == 1
+    with scopes_disabled():
+        assert not webhook.calls.exists()
+
+    responses.replace(responses.POST, 'https://google.com', status=410)
+    with transaction.atomic():
+        order.log_action('pretix.event.order.paid', {})
+    with scopes_disabled():
+        call = webhook.calls.get()
+        assert call.return_code == 410
+        assert call.payload == '{"notifica…'
@@ -8,6 +8,7 @@ from tests.base import SoupTest
 from pretix.base.models import (
     Event, InvoiceAddress, Item, Order, OrderPosition, Organizer, Team, User,
 )
+from pretix.base.services.search import build_search_index, search_index_ready
 
 
 class OrderSearchTest(SoupTest):
@@ -147,3 +148,10 @@ class OrderSearchTest(SoupTest):
         assert '30C3-FO1' not in resp
         resp = self.client.get('/control/search/orders/?query=FO2').content.decode()
         assert '30C3-FO1' not in resp
+
+
+class IndexedOrderSearchTest(OrderSearchTest):
+    def setUp(self):
+        super().setUp()
+        build_search_index()
+        assert search_index_ready()
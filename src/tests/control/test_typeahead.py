@@ -0,0 +1,64 @@
+import pytest
+from django.test import override_settings
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+
+from pretix.base.models import Event, Item, Organizer, Team, User
+
+locmem_cache = override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+
+
+@pytest.fixture
+def env():
+    o = Organizer.objects.create(name='Dummy', slug='dummy')
+    event = Event.objects.create(organizer=o, name='Dummy Conference', slug='dummy', date_from=now())
+    Event.objects.create(organizer=o, name='Secret Conference', slug='secret', date_from=now())
+    other = Organizer.objects.create(name='Other', slug='other')
+    Event.objects.create(organizer=other, name='Other Conference', slug='other', date_from=now())
+    user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+    t = Team.objects.create(organizer=o, can_change_items=True)
+    t.members.add(user)
+    t.limit_events.add(event)
+    return event, user
+
+
+def _names(response):
+    return [r['name'] for r in response.json()['results']]
+
+
+@pytest.mark.django_db
+def test_event_list_permissions(client, env):
+    client.login(email='dummy@dummy.dummy', password='dummy')
+    assert _names(client.get('/control/events/typeahead/?query=Conference')) == ['Dummy Conference']
+
+
+@pytest.mark.django_db
+@locmem_cache
+def test_event_list_cached_per_user(client, env):
+    client.login(email='dummy@dummy.dummy', password='dummy')
+    assert _names(client.get('/control/events/typeahead/?query=conf')) == ['Dummy Conference']
+    with scopes_disabled():
+        Event.objects.filter(slug='dummy').update(name='Renamed')
+    assert _names(client.get('/control/events/typeahead/?query=CONF')) == ['Dummy Conference']
+
+    with scopes_disabled():
+        User.objects.create_user('other@dummy.dummy', 'dummy')
+    client.login(email='other@dummy.dummy', password='dummy')
+    assert _names(client.get('/control/events/typeahead/?query=conf')) == []
+
+
+@pytest.mark.django_db
+@locmem_cache
+def test_items_select2_invalidated_by_event_changes(client, env):
+    event, user = env
+    with scopes_disabled():
+        item = Item.objects.create(event=event, name='Ticket', default_price=23)
+    client.login(email='dummy@dummy.dummy', password='dummy')
+    url = '/control/event/dummy/dummy/items/select2?query=tick'
+    assert [r['text'] for r in client.get(url).json()['results']] == ['Ticket']
+
+    with scopes_disabled():
+        item = Item.objects.get(pk=item.pk)
+        item.name = 'Ticket (reduced)'
+        item.save()
+    assert [r['text'] for r in client.get(url).json()['results']] == ['Ticket (reduced)']
@@ -0,0 +1,47 @@
+import logging
+
+import pytest
+from django.core.cache import cache
+from django.test import override_settings
+
+from pretix.base.models import Organizer
+from pretix.helpers.metrics.instrumentation import Instrumentation
+
+
+@pytest.mark.django_db
+def test_count_queries():
+    with Instrumentation() as outer:
+        Organizer.objects.count()
+        with Instrumentation() as inner:
+            Organizer.objects.count()
+            Organizer.objects.exists()
+    Organizer.objects.count()
+    assert outer.queries == 3
+    assert inner.queries == 2
+    assert outer.db_time > 0
+
+
+def test_count_cache():
+    with Instrumentation() as i:
+        cache.get('foo')
+        cache.get_many(['foo', 'bar'])
+    assert i.cache_hits == 0
+    assert i.cache_misses == 3
+    assert cache.get('foo', 'default') == 'default'
+
+
+@pytest.mark.django_db
+@override_settings(INSTRUMENTATION_QUERY_BUDGET=1)
+def test_budget(caplog):
+    with Instrumentation() as i:
+        Organizer.objects.count()
+    with caplog.at_level(logging.WARNING):
+        i.check_budget('Test')
+    assert not caplog.records
+
+    with Instrumentation() as i:
+        Organizer.objects.count()
+        Organizer.objects.count()
+    with caplog.at_level(logging.WARNING):
+        i.check_budget('Test')
+    assert 'Test executed 2 database queries' in caplog.records[0].getMessage()
@@ -3,7 +3,7 @@ import os
 
 import pytest
 
-from pretix.helpers.jsonlogic import Logic
+from pretix.helpers.jsonlogic import Logic, used_variables
 
 with open(os.path.join(os.path.dirname(__file__), 'jsonlogic-tests.json'), 'r') as f:
     data = json.load(f)
@@ -23,12 +23,36 @@ def test_shared_tests(logic, data, expected):
     assert Logic().apply(logic, data) == expected
 
 
+@pytest.mark.parametrize("logic,data,expected", params)
+def test_shared_tests_compiled(logic, data, expected):
+    assert Logic().compile(logic)(data) == expected
+
+
 def test_unknown_operator():
     with pytest.raises(ValueError):
         assert Logic().apply({'unknownOp': []}, {})
+    f = Logic().compile({'if': [False, {'unknownOp': []}, 1]})
+    with pytest.raises(ValueError):
+        f({})
 
 
 def test_custom_operation():
     logic = Logic()
     logic.add_operation('double', lambda a: a * 2)
     assert logic.apply({'double': [{'var': 'value'}]}, {'value': 3}) == 6
+    assert logic.compile({'double': [{'var': 'value'}]})({'value': 3}) == 6
+
+
+@pytest.mark.parametrize("logic,expected", [
+    (True, set()),
+    ({"var": "a"}, {"a"}),
+    ({"var": ["a.b", 1]}, {"a"}),
+    ({"and": [{"<": [{"var": "a"}, 2]}, {"==": [{"var": "b"}, 1]}]}, {"a", "b"}),
+    ({"missing": ["a", "b"]}, {"a", "b"}),
+    ({"missing_some": [1, ["a", "b"]]}, {"a", "b"}),
+    ({"some": [{"var": "list"}, {">": [{"var": ""}, 2]}]}, {"list"}),
+    ({"var": ""}, None),
+    ({"var": {"cat": ["a", "b"]}}, None),
+])
+def test_used_variables(logic, expected):
+    assert used_variables(logic) == expected
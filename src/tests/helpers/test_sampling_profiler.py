@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+
+from django.test import override_settings
+
+from pretix.helpers.profile.sampling import SamplingProfiler
+
+
+def busy_function(duration):
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < duration:
+        pass
+
+
+def busy_until_sampled(profiler):
+    # How many samples are taken depends on the load of the machine, so we keep going until the profiler has
+    # seen busy_function at least once, but not forever
+    stacks = profiler.contexts[threading.get_ident()]
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        busy_function(0.01)
+        with profiler.lock:
+            if any(stack.endswith(':busy_function') for stack in stacks):
+                return
+
+
+def test_sampling_profiler(tmpdir):
+    profiler = SamplingProfiler(interval=0.001, write_interval=3600, retention=3600)
+    with profiler.profile(lambda: 'view:test'):
+        busy_until_sampled(profiler)
+    busy_function(0.05)
+
+    assert profiler.counts
+    for stack, count in profiler.counts.items():
+        assert stack.startswith('view:test;')
+    assert any(stack.endswith(__name__ + ':busy_function') for stack in profiler.counts)
+
+    old_file = os.path.join(str(tmpdir), 'sampling_2000010100_1.folded')
+    with open(old_file, 'w'):
+        pass
+    os.utime(old_file, (time.time() - 7200, time.time() - 7200))
+
+    with override_settings(PROFILE_DIR=str(tmpdir)):
+        profiler.write()
+    assert not profiler.counts
+    assert not os.path.exists(old_file)
+    files = os.listdir(str(tmpdir))
+    assert len(files) == 1
+    with open(os.path.join(str(tmpdir), files[0])) as f:
+        lines = f.read().splitlines()
+    assert all(line.startswith('view:test;') and line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+def test_sampling_profiler_nested():
+    profiler = SamplingProfiler(interval=0.001, write_interval=3600, retention=3600)
+    with profiler.profile('view:outer'):
+        with profiler.profile('task:inner'):
+            busy_until_sampled(profiler)
+        busy_function(0.05)
+    assert not profiler.contexts
+    assert profiler.counts
+    assert all(stack.startswith('view:outer;') for stack in profiler.counts)
@@ -5,6 +5,7 @@ import pytest
 from bs4 import BeautifulSoup
 from django.core import mail as djmail
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.utils.timezone import now
 from django_scopes import scopes_disabled
 
@@ -12,6 +13,7 @@ from pretix.base.models import (
     Event, Item, Order, OrderFee, OrderPayment, OrderPosition, Organizer,
     Quota, Team, User,
 )
+from pretix.plugins.banktransfer import tasks
 from pretix.plugins.banktransfer.models import BankImportJob, BankTransaction
 from pretix.plugins.banktransfer.tasks import process_banktransfers
 
@@ -519,3 +521,59 @@ def test_pending_paypal_replace_fee_missing(env, job):
         assert env[2].fees.count() == 1
         assert env[2].fees.last().value == Decimal('1.00')
         assert env[2].total == Decimal('24.00')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('batch_size', [2, 200])
+def test_batched(env, job, monkeypatch, batch_size):
+    monkeypatch.setattr('pretix.plugins.banktransfer.tasks.BATCH_SIZE', batch_size)
+    process_banktransfers(job, [{
+        'payer': 'Karla Kundin',
+        'reference': 'Bestellung DUMMY1Z3AS',
+        'date': '2016-01-26',
+        'amount': '23.00'
+    }, {
+        'payer': 'Karla Kundin',
+        'reference': 'Bestellung DUMMY1Z3AS again',
+        'date': '2016-01-26',
+        'amount': '23.00'
+    }, {
+        'payer': 'Karl Kunde',
+        'reference': 'Invoice 12345',
+        'date': '2016-01-26',
+        'amount': '42.00'
+    }])
+    env[2].refresh_from_db()
+    assert env[2].status == Order.STATUS_PAID
+    with scopes_disabled():
+        job = BankImportJob.objects.get(pk=job)
+        assert job.state == BankImportJob.STATE_COMPLETED
+        assert job.transactions_total == 3
+        assert job.transactions_processed == 3
+        assert list(job.transactions.order_by('pk').values_list('state', flat=True)) == [
+            BankTransaction.STATE_VALID, BankTransaction.STATE_DUPLICATE, BankTransaction.STATE_NOMATCH
+        ]
+        assert job.transactions.order_by('pk').first().order == env[2]
+        assert env[2].payments.get().info_data['trans_id'] == job.transactions.order_by('pk').first().pk
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_commits_every_transaction(env, job, monkeypatch):
+    # Confirming a payment releases the event lock right away, so it needs to be committed before the next one
+    handle_transaction = tasks._handle_transaction
+    in_atomic_block = []
+
+    def _handle_transaction(*args, **kwargs):
+        in_atomic_block.append(connection.in_atomic_block)
+        return handle_transaction(*args, **kwargs)
+
+    monkeypatch.setattr('pretix.plugins.banktransfer.tasks._handle_transaction', _handle_transaction)
+    process_banktransfers(job, [{
+        'payer': 'Karla Kundin',
+        'reference': 'Bestellung DUMMY1Z3AS',
+        'date': '2016-01-26',
+        'amount': '23.00'
+    }])
+    env[2].refresh_from_db()
+    assert env[2].status == Order.STATUS_PAID
+    assert in_atomic_block == [False]
@@ -0,0 +1,78 @@
+import datetime
+import json
+from decimal import Decimal
+
+from django.utils.timezone import now
+from django_scopes import scopes_disabled
+from tests.base import SoupTest
+
+from pretix.base.models import (
+    Event, Item, Order, OrderPayment, OrderPosition, Organizer, Team, User,
+)
+from pretix.base.services.stats import (
+    mark_sales_rollup_outdated, refresh_sales_rollup,
+)
+
+
+class StatisticsTest(SoupTest):
+    @scopes_disabled()
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('dummy@dummy.dummy', 'dummy')
+        self.orga = Organizer.objects.create(name='CCC', slug='ccc')
+        self.event = Event.objects.create(
+            organizer=self.orga, name='30C3', slug='30c3',
+            plugins='pretix.plugins.statistics',
+            date_from=datetime.datetime(2013, 12, 26, tzinfo=datetime.timezone.utc),
+        )
+        t = Team.objects.create(organizer=self.orga, can_view_orders=True, all_events=True)
+        t.members.add(self.user)
+        item = Item.objects.create(event=self.event, name="Standard", default_price=23)
+        for i, status in enumerate((Order.STATUS_PAID, Order.STATUS_PENDING)):
+            o = Order.objects.create(
+                code='FOO{}'.format(i), event=self.event, email='dummy@dummy.test', status=status,
+                datetime=datetime.datetime(2020, 3, 1, 12, 0, tzinfo=datetime.timezone.utc),
+                expires=now() + datetime.timedelta(days=10), total=Decimal('23.00'),
+            )
+            OrderPosition.objects.create(order=o, item=item, price=Decimal('23.00'))
+        o.payments.create(provider='manual', amount=o.total, state=OrderPayment.PAYMENT_STATE_CONFIRMED,
+                          payment_date=datetime.datetime(2020, 3, 2, 12, 0, tzinfo=datetime.timezone.utc))
+        Order.objects.filter(pk=o.pk).update(status=Order.STATUS_PAID)
+        mark_sales_rollup_outdated(self.event)
+        refresh_sales_rollup(self.event, full=True)
+        self.client.login(email='dummy@dummy.dummy', password='dummy')
+
+    def test_index(self):
+        response = self.client.get('/control/event/ccc/30c3/statistics/')
+        assert response.status_code == 200
+        obd = json.loads(response.context['obd_data'])
+        assert obd == [
+            {'date': '2020-03-01', 'ordered': 2, 'paid': 0},
+            {'date': '2020-03-02', 'ordered': 0, 'paid': 1},
+        ]
+        assert json.loads(response.context['obp_data']) == [
+            {'item': 'Standard', 'item_short': 'Standard', 'ordered': 2, 'paid': 2}
+        ]
+        assert json.loads(response.context['rev_data']) == [
+            {'date': '2020-03-02', 'revenue': 23.0}
+        ]
+
+    def test_orders_by_product_canceled(self):
+        with scopes_disabled():
+            # Canceling an order does not cancel its positions, they are still counted as ordered
+            Order.objects.filter(code='FOO1').update(status=Order.STATUS_CANCELED)
+            o = Order.objects.get(code='FOO0')
+            OrderPosition.objects.create(order=o, item=o.positions.first().item, price=Decimal('23.00'), canceled=True)
+            mark_sales_rollup_outdated(self.event)
+            refresh_sales_rollup(self.event, full=True)
+        response = self.client.get('/control/event/ccc/30c3/statistics/')
+        assert json.loads(response.context['obp_data']) == [
+            {'item': 'Standard', 'item_short': 'Standard', 'ordered': 2, 'paid': 1}
+        ]
+
+    def test_rollup_pending(self):
+        mark_sales_rollup_outdated(self.event)
+        response = self.client.get('/control/event/ccc/30c3/statistics/')
+        assert response.status_code == 200
+        assert response.context['rollup_pending']
+        assert 'obd_data' not in response.context
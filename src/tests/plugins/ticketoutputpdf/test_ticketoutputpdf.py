@@ -1,15 +1,21 @@
+import tempfile
 from datetime import timedelta
 from decimal import Decimal
 from io import BytesIO
+from unittest import mock
 
 import pytest
+from django.test import override_settings
 from django.utils.timezone import now
 from django_scopes import scope
-from PyPDF2 import PdfFileReader
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from reportlab.pdfgen.canvas import Canvas
 
 from pretix.base.models import (
     Event, Item, ItemVariation, Order, OrderPosition, Organizer,
 )
+from pretix.base.pdf import Background
+from pretix.plugins.ticketoutputpdf.exporters import AllTicketsPDF
 from pretix.plugins.ticketoutputpdf.ticketoutput import PdfTicketOutput
 
 
@@ -51,3 +57,76 @@ def test_generate_pdf(env0):
         assert ftype == 'application/pdf'
         pdf = PdfFileReader(BytesIO(buf))
         assert pdf.numPages == 1
+
+
+@pytest.mark.django_db
+def test_generate_order_shares_background(env0):
+    event, order = env0
+    with scope(organizer=event.organizer):
+        o = PdfTicketOutput(event)
+        fname, ftype, buf = o.generate_order(order)
+        pdf = PdfFileReader(BytesIO(buf))
+        assert pdf.numPages == 2
+        refs = [p['/Resources'].raw_get('/XObject').raw_get('/PretixBackground') for p in pdf.pages]
+        assert refs[0].idnum == refs[1].idnum
+        bg = refs[0].getObject()
+        assert bg['/Subtype'] == '/Form'
+        assert bg.getData()
+
+
+def test_background_is_parsed_once():
+    buf = BytesIO()
+    c = Canvas(buf)
+    c.setFont('Helvetica', 12)
+    c.drawString(100, 100, 'Background')
+    c.save()
+    bg = Background(buf.getvalue())
+
+    for i in range(2):
+        buf = BytesIO()
+        c = Canvas(buf)
+        c.drawString(100, 200, 'Ticket {}'.format(i))
+        c.save()
+        writer = PdfFileWriter()
+        with mock.patch('pretix.base.pdf.PdfFileReader') as reader:
+            stamp = bg.add_to(writer)
+        assert not reader.called
+        writer.addPage(stamp(PdfFileReader(buf).getPage(0)))
+        out = BytesIO()
+        writer.write(out)
+
+        page = PdfFileReader(out).getPage(0)
+        xobject = page['/Resources']['/XObject']['/PretixBackground']
+        assert xobject['/Resources']['/Font']['/F1']['/BaseFont'] == '/Helvetica'
+        # Writing must not have touched the objects of the parsed background
+        assert isinstance(bg.resources.getObject()['/Font'].raw_get('/F1').pdf, PdfFileReader)
+
+
+@pytest.mark.django_db
+def test_export_all_tickets(env0):
+    event, order = env0
+    with scope(organizer=event.organizer):
+        event.settings.set('ticketoutput_pdf_code_x', 30)
+        event.settings.set('ticketoutput_pdf_code_y', 50)
+        event.settings.set('ticketoutput_pdf_code_s', 2)
+        ex = AllTicketsPDF(event)
+        assert ex.render({'include_pending': False, 'order_by': 'code'}) is None
+
+        with override_settings(TICKET_EXPORT_CHUNK_SIZE=1), tempfile.TemporaryFile() as f:
+            fname, ftype, buf = ex.render({'include_pending': True, 'order_by': 'code'}, output_file=f)
+            assert ftype == 'application/pdf'
+            assert buf is None
+            f.seek(0)
+            pdf = PdfFileReader(f)
+            assert pdf.numPages == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_export_all_tickets_processes(env0):
+    event, order = env0
+    with scope(organizer=event.organizer):
+        ex = AllTicketsPDF(event)
+        with override_settings(TICKET_EXPORT_CHUNK_SIZE=1, TICKET_EXPORT_PROCESSES=2):
+            fname, ftype, buf = ex.render({'include_pending': True, 'order_by': 'code'})
+        pdf = PdfFileReader(BytesIO(buf))
+        assert pdf.numPages == 2